@@ -0,0 +1,105 @@
+"""
+Check that the DuckDB backend returns the same DataFrames as pandas, and time both on synthetic data at several scales.
+
+Run from the microsoft_movies directory, with duckdb installed:
+    python -m benchmarks.bench_backends [--scales 1 10] [--only PATTERN] [--repeat 1] [--parity-only]
+
+Every call of CALLS runs once with backend='pandas' and once with backend='duckdb' inside the synthetic data directory
+of each scale (see benchmarks.bench_suite.prepare), with the in-memory and on-disk caches disabled. The results must
+be equal as pd.testing.assert_frame_equal checks them: same index, columns, row order, dtypes (categories included)
+and values, floats up to RTOL. Peak memory is the tracemalloc peak, which does not include the buffers DuckDB
+allocates outside the Python heap. Exits with status 1 if any result differs. The tests package runs the same
+comparison as unit tests.
+"""
+import argparse
+import os
+import re
+import sys
+
+import pandas as pd
+
+from benchmarks.bench_suite import measure, prepare
+from tools import backends, cache, data_preparation, disk_cache
+
+# Compared calls, as (name, function name, keyword arguments)
+CALLS = [
+    ('clean_imdb_name_basics', 'clean_imdb_name_basics', {}),
+    ('clean_imdb_title_akas', 'clean_imdb_title_akas', {}),
+    ('clean_imdb_title_crew', 'clean_imdb_title_crew', {}),
+    ('clean_imdb_title_principals', 'clean_imdb_title_principals', {}),
+    ('clean_imdb_title_ratings', 'clean_imdb_title_ratings', {}),
+    ('clean_imdb_title_basics', 'clean_imdb_title_basics', {'clean_titles': False}),
+    ('merge_bom_and_imdb', 'merge_bom_and_imdb', {}),
+    ('merge_imdb_title_and_ratings', 'merge_imdb_title_and_ratings', {}),
+    ('merge_imdb_top_crew', 'merge_imdb_top_crew', {}),
+    ('merge_imdb_top_crew[Action]', 'merge_imdb_top_crew', {'select_genre': 'Action'}),
+    ('merge_imdb_top_crew[Sci-Fi, director]', 'merge_imdb_top_crew',
+     {'select_genre': 'Sci-Fi', 'select_role': 'director'}),
+]
+
+# Relative tolerance of float comparisons, as DuckDB sums in another order than pandas
+RTOL = 1e-9
+
+
+def difference(expected, result):
+    """Return a description of how result differs from expected, or None if they are equal"""
+    try:
+        pd.testing.assert_frame_equal(expected, result, rtol=RTOL)
+    except AssertionError as error:
+        return str(error)
+    return None
+
+
+def run(scales, pattern=None, repeat=1, seed=0, timed=True):
+    """
+    Compare and time both backends on the selected calls at every scale
+
+    @return: number of calls whose results differ
+    """
+    selected = [item for item in CALLS if pattern is None or re.search(pattern, item[0])]
+    cache.DATASET_CACHE.enabled = False
+    disk_cache.DISK_CACHE_ENABLED = False
+
+    failures = 0
+    cwd = os.getcwd()
+    for scale in scales:
+        directory = prepare(scale, seed)
+        os.chdir(directory)
+        try:
+            for name, function_name, kwargs in selected:
+                func = getattr(data_preparation, function_name)
+                problem = difference(func(backend='pandas', **kwargs), func(backend='duckdb', **kwargs))
+                failures += problem is not None
+                line = f"scale {scale:<5g} {name:<40} {'OK' if problem is None else 'DIFFERENT'}"
+                if timed:
+                    for backend in backends.BACKENDS:
+                        seconds, peak_mb, _ = measure(lambda: func(backend=backend, **kwargs), repeat)
+                        line += f"  {backend} {seconds:8.3f}s {peak_mb:8.1f} MB"
+                print(line)
+                if problem is not None:
+                    print(f"    {problem}")
+        finally:
+            os.chdir(cwd)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10])
+    parser.add_argument('--only', help="regular expression selecting call names")
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--parity-only', action='store_true', help="compare the results without timing them")
+    args = parser.parse_args(argv)
+
+    backends.resolve_backend('duckdb')
+    failures = run(args.scales, args.only, args.repeat, args.seed, timed=not args.parity_only)
+    if failures:
+        print(f"{failures} results differ between the backends")
+        return 1
+    print("Both backends return the same results")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Benchmark the date parsing of tools.dates against the pd.to_datetime calls it replaced, on the RT and TN files.
+
+Run from the microsoft_movies directory:
+    python -m benchmarks.bench_dates [--scales 1 10] [--repeat 3] [--corrupt 0.001]
+
+For every scale, the date columns of the synthetic files of benchmarks.synthetic are read once, then parsed as before
+(format inference by pd.to_datetime, row by row for the movie info dates), with format detection (an empty format
+cache) and with the cached formats. The parsed columns must be equal. With --corrupt, that share of the values is
+replaced by unparseable strings before parsing with tools.dates only, and every one of them must be quarantined.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_suite import measure, prepare
+from tools import dates
+from tools.constants import RT_MOVIE_INFO, RT_REVIEWS_PATH, TN_BUDGETS
+from tools.schemas import read_source
+
+# Parsed date columns, as (name, source file, columns, previous parsing function)
+COLUMNS = [
+    ('rt.reviews date', RT_REVIEWS_PATH, ['date'], lambda df: pd.to_datetime(df['date']).to_frame()),
+    ('rt.movie_info dates', RT_MOVIE_INFO, ['theater_date', 'dvd_date'],
+     lambda df: df.apply(pd.to_datetime, axis=1)),
+    ('tn.movie_budgets release_date', TN_BUDGETS, ['release_date'],
+     lambda df: pd.to_datetime(df['release_date']).to_frame()),
+]
+
+
+def parse(df, path):
+    """Parse every column of df with tools.dates.parse_dates"""
+    return pd.DataFrame({column: dates.parse_dates(df[column], path) for column in df.columns})
+
+
+def corrupt(df, share, seed=0):
+    """Return a copy of df with a share of its present values replaced by unparseable strings, and their count"""
+    rng = np.random.default_rng(seed)
+    df = df.copy()
+    count = 0
+    for column in df.columns:
+        hit = df[column].notna().to_numpy() & (rng.random(len(df)) < share)
+        df.loc[hit, column] = 'TBA ' + df.loc[hit, column].astype(str)
+        count += hit.sum()
+    return df, count
+
+
+def run(scales, repeat=1, share=None, seed=0):
+    cwd = os.getcwd()
+    for scale in scales:
+        os.chdir(prepare(scale, seed))
+        try:
+            for name, path, columns, previous in COLUMNS:
+                df = read_source(path, usecols=columns)
+                line = f"scale {scale:<5g} {name:<30}"
+
+                seconds, _, _ = measure(lambda: previous(df), repeat)
+                line += f"  inferred {seconds:8.3f}s"
+                dates.clear_formats()
+                seconds, _, _ = measure(lambda: parse(df, path), 1)
+                line += f"  detected {seconds:8.3f}s"
+                seconds, _, _ = measure(lambda: parse(df, path), repeat)
+                line += f"  cached {seconds:8.3f}s"
+
+                equal = previous(df).equals(parse(df, path))
+                line += '' if equal else '  RESULTS DIFFER'
+                if share:
+                    corrupted, count = corrupt(df, share, seed)
+                    parse(corrupted, path)
+                    report = dates.quarantine_report()
+                    quarantined = (report['source'] == os.path.basename(path)).sum()
+                    line += f"  quarantined {quarantined}/{count}"
+                    parse(df, path)
+                print(line)
+        finally:
+            os.chdir(cwd)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--corrupt', type=float, help="share of values replaced by unparseable strings")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    run(args.scales, args.repeat, args.corrupt, args.seed)
+
+
+if __name__ == '__main__':
+    main()
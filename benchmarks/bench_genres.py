@@ -0,0 +1,85 @@
+"""
+Benchmark genre aggregation through the genre bridge tables against exploding the merged rows.
+
+Run from the microsoft_movies directory:
+    python -m benchmarks.bench_genres
+
+Each pair is checked for matching output, then timed twice: cold, with the dataset cache disabled so that both paths
+include loading and building the bridge, and warm, after a first call has cached the cleaned tables and bridges. Peak
+memory is measured with tracemalloc. Benchmarks whose source files are not present in ./data are skipped.
+"""
+import os
+import time
+import tracemalloc
+
+import pandas as pd
+
+from tools import cache
+from tools.data_preparation import (IMDB_TITLE_BASICS, IMDB_TITLE_RATINGS, RT_MOVIE_INFO, RT_REVIEWS_PATH,
+                                    clean_imdb_title_basics, clean_imdb_title_ratings, clean_rt_movie_info,
+                                    clean_rt_reviews, merge_imdb_title_and_ratings, merge_rt_data)
+
+
+def imdb_explode_path():
+    """Weighted ratings per genre by exploding the merged basics and ratings rows"""
+    basics_df = clean_imdb_title_basics(clean_titles=False, explode=True)
+    combined = pd.merge(basics_df, clean_imdb_title_ratings(), how='inner', on='tconst')
+    subset = combined[['genres', 'numvotes', 'averagerating']].eval('avgrating_x_numvotes = averagerating * numvotes')
+    main_df = subset.groupby('genres').aggregate(numvotes=pd.NamedAgg('numvotes', 'sum'),
+                                                 avgrating_x_numvotes=pd.NamedAgg('avgrating_x_numvotes', 'sum'),
+                                                 avgnumvotes=pd.NamedAgg('numvotes', 'mean'))
+    main_df.eval('wavg_rating = avgrating_x_numvotes / numvotes', inplace=True)
+    main_df.drop(index='Adult', inplace=True)
+    main_df.reset_index(inplace=True)
+    return main_df.sort_values('numvotes', ascending=False)
+
+
+def rt_explode_path():
+    """Fresh review counts per genre by exploding the merged movie info and reviews rows"""
+    rt_df = clean_rt_movie_info().merge(clean_rt_reviews(), on='id')
+    grouped = rt_df.explode('genre').groupby('genre')['fresh'].aggregate(['count', 'sum', 'mean'])
+    grouped.columns = ['total_references', 'total_positive', 'percent_positive']
+    return grouped.sort_values('total_positive', ascending=False)
+
+
+def measure(func):
+    """Return the result, wall time in seconds and peak traced memory in MB of one call"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def compare(label, explode_func, bridge_func):
+    for mode in ['cold', 'warm']:
+        cache.DATASET_CACHE.enabled = mode == 'warm'
+        if mode == 'warm':
+            explode_func()
+            bridge_func()
+
+        explode_result, explode_time, explode_peak = measure(explode_func)
+        bridge_result, bridge_time, bridge_peak = measure(bridge_func)
+        pd.testing.assert_frame_equal(explode_result.reset_index(drop=True), bridge_result.reset_index(drop=True),
+                                      check_dtype=False, check_index_type=False)
+        print(f"{label + ' (' + mode + ')':<30} explode: {explode_time:7.3f}s {explode_peak:8.1f} MB   "
+              f"bridge: {bridge_time:7.3f}s {bridge_peak:8.1f} MB")
+
+
+def main():
+
+    if os.path.exists(IMDB_TITLE_BASICS) and os.path.exists(IMDB_TITLE_RATINGS):
+        compare("imdb genre ratings", imdb_explode_path, merge_imdb_title_and_ratings)
+    else:
+        print(f"Skipping imdb genre ratings: {IMDB_TITLE_BASICS} or {IMDB_TITLE_RATINGS} not found")
+
+    if os.path.exists(RT_MOVIE_INFO) and os.path.exists(RT_REVIEWS_PATH):
+        compare("rt genre popularity", rt_explode_path, lambda: merge_rt_data(focus='genre_popularity'))
+    else:
+        print(f"Skipping rt genre popularity: {RT_MOVIE_INFO} or {RT_REVIEWS_PATH} not found")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark the scalar formatting helpers against their whole-column equivalents.
+
+Run from the microsoft_movies directory:
+    python -m benchmarks.bench_helpers
+
+Each pair is checked for identical output before it is timed. Source files that are not present in ./data are skipped.
+"""
+import os
+import string
+import timeit
+
+import pandas as pd
+
+from tools.data_preparation import (IMDB_TITLE_BASICS, RT_MOVIE_INFO, TN_BUDGETS, dollars_to_num,
+                                    dollars_to_num_series, minutes_to_num, minutes_to_num_series,
+                                    remove_punctuation_series)
+
+REPEAT = 5
+
+
+def remove_punctuation_loop(text):
+    """Original implementation of remove_punctuation, kept as the benchmark baseline"""
+    for char in string.punctuation:
+        text = text.replace(char, '')
+    return text.strip().lower().replace(' ', '')
+
+
+def compare(label, series, scalar_func, series_func):
+    """Print best-of-REPEAT timings of series.map(scalar_func) and series_func(series)"""
+    expected = series.map(scalar_func, na_action='ignore')
+    result = series_func(series)
+    pd.testing.assert_series_equal(expected, result, check_dtype=False)
+
+    mapped = min(timeit.repeat(lambda: series.map(scalar_func, na_action='ignore'), number=1, repeat=REPEAT))
+    vectorized = min(timeit.repeat(lambda: series_func(series), number=1, repeat=REPEAT))
+    print(f"{label:<45} {len(series):>9} rows  map: {mapped:8.4f}s  "
+          f"vectorized: {vectorized:8.4f}s  speedup: {mapped / vectorized:6.1f}x")
+
+
+def main():
+    if os.path.exists(TN_BUDGETS):
+        tn_df = pd.read_csv(TN_BUDGETS)
+        for col in ['production_budget', 'domestic_gross', 'worldwide_gross']:
+            compare(f"tn.movie_budgets {col}", tn_df[col], dollars_to_num, dollars_to_num_series)
+        compare("tn.movie_budgets movie", tn_df['movie'], remove_punctuation_loop, remove_punctuation_series)
+
+    if os.path.exists(RT_MOVIE_INFO):
+        info_df = pd.read_csv(RT_MOVIE_INFO, delimiter='\t')
+        compare("rt.movie_info runtime", info_df['runtime'], minutes_to_num, minutes_to_num_series)
+
+    if os.path.exists(IMDB_TITLE_BASICS):
+        basics_df = pd.read_csv(IMDB_TITLE_BASICS)
+        compare("imdb.title.basics primary_title", basics_df['primary_title'], remove_punctuation_loop,
+                remove_punctuation_series)
+    else:
+        print(f"Skipping {IMDB_TITLE_BASICS}: file not found")
+
+
+if __name__ == '__main__':
+    main()
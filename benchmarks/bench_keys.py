@@ -0,0 +1,80 @@
+"""
+Benchmark the joins of the IMDB merges on string keys against the same joins on int64 keys from tools.keys.
+
+Run from the microsoft_movies directory:
+    python -m benchmarks.bench_keys [--scales 1 10] [--repeat 3]
+
+For every scale, the synthetic files of benchmarks.synthetic are loaded once into the in-memory dataset cache, both
+as read and with encode_keys=True, so that the timed joins neither parse files nor encode keys; the one-off cost of
+encoding the keys at load time is reported separately. Each query is then collected with string and with int64 keys,
+and their results are checked to hold the same rows.
+"""
+import argparse
+import os
+import time
+
+from benchmarks.bench_suite import measure, prepare
+from tools import data_preparation, disk_cache
+
+# Benchmarked queries, as (name, function returning a Query, keyword arguments)
+QUERIES = [
+    ('top_crew_query', data_preparation.top_crew_query, {}),
+    ('top_crew_query[Action, actor]', data_preparation.top_crew_query,
+     {'select_genre': 'Action', 'select_role': 'actor'}),
+    ('bom_imdb_query', data_preparation.bom_imdb_query, {}),
+]
+
+# Cleaning calls whose keys are encoded at load time, as (function name, keyword arguments)
+ENCODED_SOURCES = [
+    ('clean_imdb_title_basics', {}),
+    ('clean_imdb_title_basics', {'clean_titles': False}),
+    ('clean_imdb_title_ratings', {}),
+    ('clean_imdb_title_principals', {}),
+    ('clean_imdb_name_basics', {}),
+]
+
+
+def load(encode_keys):
+    """Fill the dataset cache with the benchmarked sources and return the seconds it took"""
+    start = time.perf_counter()
+    for name, kwargs in ENCODED_SOURCES:
+        getattr(data_preparation, name)(encode_keys=encode_keys, **kwargs)
+    data_preparation.clean_bom_gross()
+    return time.perf_counter() - start
+
+
+def run(scales, repeat=1, seed=0):
+    disk_cache.DISK_CACHE_ENABLED = False
+    cwd = os.getcwd()
+    for scale in scales:
+        os.chdir(prepare(scale, seed))
+        try:
+            data_preparation.clear_cache()
+            strings = load(encode_keys=False)
+            encoded = load(encode_keys=True)
+            print(f"scale {scale:g}: loading {strings:.3f}s with string keys, {encoded:.3f}s with int64 keys")
+
+            for name, query, kwargs in QUERIES:
+                line = f"scale {scale:<5g} {name:<32}"
+                rows = set()
+                for label, encode_keys in [('string', False), ('int64', True)]:
+                    collect = query(encode_keys=encode_keys, **kwargs).collect
+                    seconds, peak_mb, count = measure(collect, repeat)
+                    rows.add(count)
+                    line += f"  {label} {seconds:8.3f}s {peak_mb:8.1f} MB"
+                print(line + ('' if len(rows) == 1 else '  ROW COUNTS DIFFER'))
+        finally:
+            os.chdir(cwd)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    run(args.scales, args.repeat, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark loading every source file serially against tools.parallel.load_all with increasing worker counts.
+
+Run from the microsoft_movies directory:
+    python -m benchmarks.bench_parallel [max_workers] [--min-speedup 1.2]
+
+The on-disk cache is disabled and the in-memory cache is cleared before every run, so that every run parses the files
+once, as a fresh session would. Sources whose files are not present in ./data are left out. The process workers load
+the largest files first while this process loads clean_imdb_title_basics(encode_keys=True) in threads, see
+tools.parallel. On a machine with more than one CPU, exits with status 1 if no run with two or more workers is at
+least min_speedup times faster than the serial run; on a single CPU the speedup is only reported.
+"""
+import argparse
+import os
+import sys
+import time
+
+from tools import cache, data_preparation, disk_cache, parallel
+
+# Source file of each cleaning function, used to skip functions whose file is missing
+SOURCE_FILES = {
+    'clean_rt_reviews': data_preparation.RT_REVIEWS_PATH,
+    'clean_rt_movie_info': data_preparation.RT_MOVIE_INFO,
+    'rt_genre_bridge': data_preparation.RT_MOVIE_INFO,
+    'clean_tn_budgets': data_preparation.TN_BUDGETS,
+    'clean_bom_gross': data_preparation.BOM_GROSS,
+    'clean_tmdb_movies': data_preparation.TMDB_MOVIES,
+    'clean_imdb_name_basics': data_preparation.IMDB_NAME_BASICS,
+    'clean_imdb_title_principals': data_preparation.IMDB_TITLE_PRINCIPALS,
+    'clean_imdb_title_ratings': data_preparation.IMDB_TITLE_RATINGS,
+    'clean_imdb_title_basics': data_preparation.IMDB_TITLE_BASICS,
+    'imdb_genre_bridge': data_preparation.IMDB_TITLE_BASICS,
+}
+
+
+def run(max_workers):
+    """
+    Time the serial run and load_all with 1, 2, 4... process workers up to max_workers
+
+    @return: dict mapping each worker count to its speedup over the serial run
+    """
+    disk_cache.DISK_CACHE_ENABLED = False
+    sources = [(name, kwargs) for name, kwargs in parallel.ALL_SOURCES if os.path.exists(SOURCE_FILES[name])]
+
+    cache.clear_cache()
+    start = time.perf_counter()
+    for name, kwargs in sources:
+        getattr(data_preparation, name)(**kwargs)
+    serial = time.perf_counter() - start
+    print(f"{len(sources)} sources, serial: {serial:7.3f}s")
+
+    speedups = {}
+    workers = 1
+    while workers <= max_workers:
+        cache.clear_cache()
+        start = time.perf_counter()
+        parallel.load_all(max_workers=workers, executor='process', sources=sources)
+        elapsed = time.perf_counter() - start
+        speedups[workers] = serial / elapsed
+        print(f"{workers:>2} process workers: {elapsed:7.3f}s  speedup: {speedups[workers]:5.2f}x")
+        workers *= 2
+    return speedups
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('max_workers', type=int, nargs='?', default=os.cpu_count() or 1)
+    parser.add_argument('--min-speedup', type=float, default=1.2,
+                        help="speedup over the serial run required from the best run with two or more workers")
+    args = parser.parse_args(argv)
+
+    speedups = run(args.max_workers)
+    if (os.cpu_count() or 1) < 2 or args.max_workers < 2:
+        print("Speedup not checked: it needs more than one CPU and max_workers of at least 2")
+        return 0
+    best = max(speedup for workers, speedup in speedups.items() if workers >= 2)
+    if best < args.min_speedup:
+        print(f"FAILED: best speedup {best:.2f}x is below {args.min_speedup:.2f}x")
+        return 1
+    print(f"Best speedup {best:.2f}x, at least {args.min_speedup:.2f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
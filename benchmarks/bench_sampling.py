@@ -0,0 +1,89 @@
+"""
+Check the sampled genre estimates of tools.sampling against the exact results, and time both on synthetic data.
+
+Run from the microsoft_movies directory:
+    python -m benchmarks.bench_sampling [--scales 1 10] [--sample-size 2000] [--confidence 0.95] [--repeat 3]
+        [--margin 0.1]
+
+For every scale, each exact function is timed with the in-memory and on-disk caches disabled, then the sample is built
+from scratch and finally refreshed with no new rows, which is the cost of an approximate query once the sample exists.
+Coverage is the share of genres whose exact value lies inside the confidence interval, and rank coverage the share
+whose exact rank lies between rank_best and rank_worst. With a few dozen genres, coverage varies by several points
+around the confidence level, so the run exits with status 1 only when the coverage of an aggregate is below the
+confidence level by more than --margin.
+"""
+import argparse
+import os
+import sys
+
+from benchmarks.bench_suite import measure, prepare
+from tools import cache, data_preparation, disk_cache, sampling
+
+# Compared aggregates, as (name, exact function, sample class, estimated column, index column of both results)
+AGGREGATES = [
+    ('rt_genre_popularity', lambda: data_preparation.merge_rt_data('genre_popularity'),
+     sampling.RtGenrePopularitySample, 'percent_positive', 'genre'),
+    ('imdb_genre_ratings', data_preparation.merge_imdb_title_and_ratings,
+     sampling.ImdbGenreRatingsSample, 'wavg_rating', 'genres'),
+]
+
+
+def coverage(exact, estimates, column):
+    """Return the shares of genres whose exact value and exact rank lie inside the sampled intervals"""
+    exact = exact[column].sort_values(ascending=False)
+    ranks = exact.rank(ascending=False, method='first').reindex(estimates.index)
+    values = exact.reindex(estimates.index)
+    inside = (values >= estimates[f'{column}_low'] - 1e-12) & (values <= estimates[f'{column}_high'] + 1e-12)
+    ranked = (ranks >= estimates['rank_best']) & (ranks <= estimates['rank_worst'])
+    return inside.mean(), ranked.mean()
+
+
+def run(scales, sample_size=sampling.SAMPLE_SIZE, confidence=sampling.CONFIDENCE, repeat=1, seed=0):
+    """Print the timings and coverages of every aggregate at every scale; return the lowest coverage"""
+    lowest = 1.0
+    cache.DATASET_CACHE.enabled = False
+    disk_cache.DISK_CACHE_ENABLED = False
+    cwd = os.getcwd()
+    for scale in scales:
+        os.chdir(prepare(scale, seed))
+        try:
+            for name, exact_func, sample_class, column, index in AGGREGATES:
+                sample = sample_class(sample_size=sample_size)
+                sample.reset()
+                build_seconds, build_mb, _ = measure(sample.refresh, 1)
+                query_seconds, query_mb, _ = measure(lambda: sample_class(sample_size=sample_size).refresh(), repeat)
+                exact_seconds, exact_mb, _ = measure(exact_func, repeat)
+
+                exact = exact_func().reset_index().set_index(index)
+                estimates = sample.result(confidence).reset_index().set_index(index)
+                inside, ranked = coverage(exact, estimates, column)
+                lowest = min(lowest, inside)
+                stable = estimates['rank_stable'].mean()
+                print(f"scale {scale:<5g} {name:<20} exact {exact_seconds:8.3f}s {exact_mb:8.1f} MB"
+                      f"  build {build_seconds:8.3f}s {build_mb:8.1f} MB"
+                      f"  query {query_seconds:8.3f}s {query_mb:8.1f} MB"
+                      f"  coverage {inside:6.1%}  rank coverage {ranked:6.1%}  stable ranks {stable:6.1%}")
+        finally:
+            os.chdir(cwd)
+    return lowest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10])
+    parser.add_argument('--sample-size', type=int, default=sampling.SAMPLE_SIZE)
+    parser.add_argument('--confidence', type=float, default=sampling.CONFIDENCE)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--margin', type=float, default=0.1, help="coverage shortfall tolerated below --confidence")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    lowest = run(args.scales, args.sample_size, args.confidence, args.repeat, args.seed)
+    if lowest < args.confidence - args.margin:
+        print(f"Coverage {lowest:.1%} is below the {args.confidence:.0%} confidence level"
+              f" by more than {args.margin:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Track the startup cost of the tools package: module import times and the wall time of lightweight CLI commands.
+
+Run from the microsoft_movies directory:
+    python -m benchmarks.bench_startup [--repeat 5] [--max-ms 150] [--output startup.json]
+
+Every measurement runs in a fresh interpreter. Import times are the cumulative microseconds that python -X importtime
+reports for the module itself, the fastest of --repeat runs; CLI times are the fastest wall time of running the
+command, including interpreter startup, which is reported on its own as 'python -c pass'. With --max-ms, the run exits
+with status 1 if a lightweight command, which must not import pandas, takes longer than that.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+# Modules whose import time is measured
+MODULES = ['tools', 'tools.constants', 'tools.__main__', 'tools.instrumentation', 'tools.keys', 'tools.schemas',
+           'tools.data_preparation', 'tools.TN_File_Eddie', 'tools.crew_cube', 'tools.service', 'pandas']
+
+# Commands that must start without importing pandas, checked against --max-ms
+LIGHTWEIGHT_COMMANDS = [['--help'], ['sources'], ['top-crew', '--help']]
+
+
+def import_time(module, repeat):
+    """Return the fastest cumulative import time of a module in milliseconds"""
+    best = None
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                                   capture_output=True, text=True, check=True)
+        # Lines read 'import time: self [us] | cumulative | imported package', the module itself being the last
+        for line in completed.stderr.splitlines():
+            fields = [field.strip() for field in line.split('|')]
+            if len(fields) == 3 and fields[2] == module:
+                milliseconds = int(fields[1]) / 1000
+                best = milliseconds if best is None else min(best, milliseconds)
+    return best
+
+
+def wall_time(arguments, repeat):
+    """Return the fastest wall time in milliseconds of running the given interpreter arguments"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + arguments, stdout=subprocess.DEVNULL, check=True)
+        milliseconds = (time.perf_counter() - start) * 1000
+        best = milliseconds if best is None else min(best, milliseconds)
+    return best
+
+
+def imports_pandas(arguments):
+    """Return whether running the CLI with the given arguments imports pandas"""
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'tools'] + arguments,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    return any(line.rstrip().endswith('| pandas') for line in completed.stderr.splitlines())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-ms', type=float, help="fail if a lightweight command takes longer")
+    parser.add_argument('--output', help="write the measurements to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = {'imports': {}, 'commands': {}}
+    for module in MODULES:
+        results['imports'][module] = milliseconds = import_time(module, args.repeat)
+        print(f"import {module:<32} {milliseconds:9.1f} ms")
+
+    failures = []
+    results['commands']['python -c pass'] = milliseconds = wall_time(['-c', 'pass'], args.repeat)
+    print(f"{'python -c pass':<39} {milliseconds:9.1f} ms")
+    for arguments in LIGHTWEIGHT_COMMANDS:
+        label = ' '.join(['python -m tools'] + arguments)
+        results['commands'][label] = milliseconds = wall_time(['-m', 'tools'] + arguments, args.repeat)
+        heavy = imports_pandas(arguments)
+        print(f"{label:<39} {milliseconds:9.1f} ms{'  imports pandas' if heavy else ''}")
+        if heavy or (args.max_ms is not None and milliseconds > args.max_ms):
+            failures.append(label)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if failures:
+        print(f"Slow lightweight commands: {', '.join(failures)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
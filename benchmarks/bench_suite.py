@@ -0,0 +1,302 @@
+"""
+Time and memory-profile every clean_* and merge_* function and eddies_function on synthetic data at several scales.
+
+Run from the microsoft_movies directory:
+    python -m benchmarks.bench_suite [--scales 1 10 100] [--only PATTERN] [--output results.json]
+                                     [--baseline benchmarks/baseline.json] [--save-baseline] [--check]
+                                     [--tolerance 1.25]
+
+For every scale, the source files are generated once by benchmarks.synthetic into ./data/.synthetic/scale-<scale>/data
+and reused by later runs with the same seed. Each function then runs inside that directory, since the path constants
+of tools.data_preparation are relative, with the in-memory and on-disk caches disabled so that it parses and cleans
+everything it needs. Wall time is the best of --repeat calls (3 by default, as single calls vary by a third from run to
+run) and peak memory is measured with tracemalloc.
+
+Results are written as JSON. When a baseline file exists, every function and scale present in both is compared, and
+the run exits with status 1 if the row count changed, or if the time or peak memory grew by more than --tolerance (a
+ratio). When the median ratio of new to baseline time at a scale is above 1, times are first divided by it, so that a
+machine uniformly slower or busier than when the baseline was recorded does not fail the check, while a single
+function that slows down still does; a slowdown of every function alike is therefore not reported. Differences under
+--min-seconds or --min-mb are ignored, as they are mostly noise.
+
+Times and peak memory only compare on the machine and library versions they were measured with, so a baseline is
+recorded per machine, on the machine that runs the comparisons:
+    python -m benchmarks.bench_suite --save-baseline
+The environment of the baseline (see FINGERPRINT) and its --repeat must match the current ones for times and memory to
+be compared; otherwise only row counts are, and --save-baseline starts a new baseline instead of merging into it. With
+--check, the run also exits with status 2 when the baseline is missing, was recorded in another environment or lacks
+any of the measured scales and benchmarks, so that a regression gate never passes without comparing everything it
+ran. The committed benchmarks/baseline.json was recorded at scales 0.1 and 1 on a single-CPU machine with 6 GB of
+memory, too little to generate scale 10, and mainly serves as the row count reference on other machines.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import re
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import synthetic
+from tools import cache, data_preparation, disk_cache
+
+# Directory holding one generated data directory per scale
+SYNTHETIC_DIR = "./data/.synthetic"
+
+BASELINE_PATH = "./benchmarks/baseline.json"
+
+# Keys of environment() that must match between a baseline and a run for their times and memory to be compared
+FINGERPRINT = ('system', 'machine', 'processor', 'cpus', 'python', 'pandas', 'numpy')
+
+# Benchmarked calls, as (name, function name, keyword arguments); 'eddies_function' lives in tools.TN_File_Eddie
+BENCHMARKS = [
+    ('clean_rt_reviews', 'clean_rt_reviews', {}),
+    ('clean_rt_movie_info', 'clean_rt_movie_info', {}),
+    ('clean_tn_budgets', 'clean_tn_budgets', {}),
+    ('clean_bom_gross', 'clean_bom_gross', {}),
+    ('clean_tmdb_movies', 'clean_tmdb_movies', {}),
+    ('clean_imdb_name_basics', 'clean_imdb_name_basics', {}),
+    ('clean_imdb_title_akas', 'clean_imdb_title_akas', {}),
+    ('clean_imdb_title_crew', 'clean_imdb_title_crew', {}),
+    ('clean_imdb_title_principals', 'clean_imdb_title_principals', {}),
+    ('clean_imdb_title_ratings', 'clean_imdb_title_ratings', {}),
+    ('clean_imdb_title_basics', 'clean_imdb_title_basics', {}),
+    ('clean_imdb_title_basics[explode]', 'clean_imdb_title_basics', {'explode': True}),
+    ('merge_rt_data', 'merge_rt_data', {}),
+    ('merge_rt_data[genre_popularity]', 'merge_rt_data', {'focus': 'genre_popularity'}),
+    ('merge_rt_data[rating_popularity]', 'merge_rt_data', {'focus': 'rating_popularity'}),
+    ('merge_rt_data[combined_popularity]', 'merge_rt_data', {'focus': 'combined_popularity'}),
+    ('merge_bom_and_imdb', 'merge_bom_and_imdb', {}),
+    ('merge_imdb_title_and_ratings', 'merge_imdb_title_and_ratings', {}),
+    ('merge_imdb_top_crew', 'merge_imdb_top_crew', {}),
+    ('merge_imdb_top_crew[streaming]', 'merge_imdb_top_crew', {'chunksize': 1_000_000}),
+    ('tn_imdb_budgets', 'tn_imdb_budgets', {}),
+    ('merge_tn_imdb[international_gross]', 'merge_tn_imdb', {'value': 'international_gross', 'top_n': None}),
+    ('eddies_function', 'eddies_function', {}),
+]
+
+
+def resolve(function_name):
+    """Return the benchmarked function for a name in BENCHMARKS"""
+    if function_name == 'eddies_function':
+        from tools.TN_File_Eddie import eddies_function
+        return eddies_function
+    return getattr(data_preparation, function_name)
+
+
+def measure(func, repeat=1):
+    """Return the best wall time in seconds, the peak traced memory in MB and the row count of func()"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # Memory is traced in a separate call because tracemalloc slows allocation-heavy code down
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+    tracemalloc.stop()
+    return best, peak, len(result)
+
+
+def prepare(scale, seed):
+    """Generate the synthetic files for a scale unless a previous run already did, and return its directory"""
+    directory = os.path.abspath(os.path.join(SYNTHETIC_DIR, f"scale-{scale:g}"))
+    marker = os.path.join(directory, 'data', 'generated.json')
+    expected = {'scale': scale, 'seed': seed, 'rows': synthetic.BASE_ROWS}
+
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if json.load(f) == expected:
+                return directory
+
+    print(f"Generating scale {scale:g} data in {directory}")
+    synthetic.generate(os.path.join(directory, 'data'), scale, seed)
+    with open(marker, 'w') as f:
+        json.dump(expected, f)
+    return directory
+
+
+def run(scales, pattern=None, repeat=1, seed=0):
+    """
+    Run the selected benchmarks at every scale
+
+    @param scales: list of scale multipliers, see benchmarks.synthetic
+    @param pattern: optional regular expression selecting benchmark names
+    @param repeat: number of timed calls, the fastest of which is kept
+    @param seed: seed of the synthetic data generator
+    @return: dict mapping each scale (as a string) to a dict of benchmark name to its measurements
+    """
+    selected = [item for item in BENCHMARKS if pattern is None or re.search(pattern, item[0])]
+    cache.DATASET_CACHE.enabled = False
+    disk_cache.DISK_CACHE_ENABLED = False
+
+    results = {}
+    cwd = os.getcwd()
+    for scale in scales:
+        directory = prepare(scale, seed)
+        results[f"{scale:g}"] = scale_results = {}
+        os.chdir(directory)
+        try:
+            for name, function_name, kwargs in selected:
+                func = resolve(function_name)
+                seconds, peak_mb, rows = measure(lambda: func(**kwargs), repeat)
+                scale_results[name] = {'seconds': round(seconds, 4), 'peak_mb': round(peak_mb, 2), 'rows': rows}
+                print(f"scale {scale:<5g} {name:<38} {seconds:9.3f}s {peak_mb:10.1f} MB {rows:>10,} rows")
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def compare(results, baseline, tolerance=1.25, min_seconds=0.05, min_mb=5.0, timings=True):
+    """
+    Return a list of messages describing the measurements that regressed against a baseline
+
+    @param results: dict returned by run
+    @param baseline: 'results' dict of a previously saved run
+    @param tolerance: largest accepted ratio of new to baseline peak memory, and of new to baseline time once divided
+        by the median ratio of the scale when above 1 (see speed_ratio)
+    @param min_seconds: time differences smaller than this are ignored
+    @param min_mb: peak memory differences smaller than this are ignored
+    @param timings: whether to compare times and peak memory, or only row counts
+    @return: list of str, empty when nothing regressed
+    """
+    regressions = []
+    for scale, scale_results in results.items():
+        # A machine faster than when the baseline was recorded must not make the check stricter than the baseline
+        speed = max(1.0, speed_ratio(scale_results, baseline.get(scale, {}), min_seconds))
+        for name, new in scale_results.items():
+            old = baseline.get(scale, {}).get(name)
+            if old is None:
+                continue
+            for metric, minimum, unit in [('seconds', min_seconds, 's'), ('peak_mb', min_mb, ' MB')] if timings else []:
+                expected = old[metric] * (speed if metric == 'seconds' else 1.0)
+                if new[metric] - expected > minimum and new[metric] > tolerance * expected:
+                    relative = f", {new[metric] / expected:.2f}x relative to the scale" if speed > 1.0 else ""
+                    regressions.append(f"scale {scale} {name}: {metric} {old[metric]:.3f}{unit} -> "
+                                       f"{new[metric]:.3f}{unit} ({new[metric] / old[metric]:.2f}x{relative})")
+            if new['rows'] != old['rows']:
+                regressions.append(f"scale {scale} {name}: rows {old['rows']} -> {new['rows']}")
+    return regressions
+
+
+def speed_ratio(scale_results, scale_baseline, min_seconds=0.05):
+    """
+    Return the median ratio of new to baseline time of the benchmarks of a scale taking at least min_seconds
+
+    The ratio measures how much slower or busier the machine is than when the baseline was recorded, which affects
+    every benchmark alike, unlike a regression of one function. It is 1.0 when no benchmark can be compared.
+    """
+    ratios = [new['seconds'] / scale_baseline[name]['seconds'] for name, new in scale_results.items()
+              if name in scale_baseline and scale_baseline[name]['seconds'] >= min_seconds]
+    return float(np.median(ratios)) if ratios else 1.0
+
+
+def environment():
+    """Return the versions and machine details stored alongside the results"""
+    return {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'system': platform.system(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpus': os.cpu_count()}
+
+
+def fingerprint_differences(baseline_environment, current_environment):
+    """Return a list of messages describing the FINGERPRINT keys that differ between two environments"""
+    return [f"{key} {baseline_environment.get(key)!r} -> {current_environment.get(key)!r}" for key in FINGERPRINT
+            if baseline_environment.get(key) != current_environment.get(key)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--only', help="regular expression selecting benchmark names")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='./benchmarks/results.json')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the new baseline")
+    parser.add_argument('--check', action='store_true', help="exit with status 2 when nothing can be compared")
+    parser.add_argument('--tolerance', type=float, default=1.25)
+    parser.add_argument('--min-seconds', type=float, default=0.05)
+    parser.add_argument('--min-mb', type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    results = run(args.scales, args.only, args.repeat, args.seed)
+    report = {'environment': environment(), 'seed': args.seed, 'repeat': args.repeat, 'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        # Merge into an existing baseline so that runs of a subset of scales or benchmarks do not discard the rest
+        baseline = {'environment': report['environment'], 'seed': args.seed, 'repeat': args.repeat, 'results': {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                previous = json.load(f)
+            if _differences(previous, report):
+                print(f"Replacing the baseline of another machine or --repeat at {args.baseline}")
+            else:
+                baseline['results'] = previous['results']
+        for scale, scale_results in results.items():
+            baseline['results'].setdefault(scale, {}).update(scale_results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"{'NO BASELINE' if args.check else 'No baseline'} at {args.baseline}; "
+              f"run with --save-baseline to record one")
+        return 2 if args.check else 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('seed') != args.seed:
+        print(f"Baseline was recorded with seed {baseline.get('seed')}, not {args.seed}; row counts may differ")
+    compared = [name for scale, scale_results in results.items() for name in scale_results
+                if name in baseline['results'].get(scale, {})]
+    if not compared:
+        print(f"{'NO BASELINE' if args.check else 'No baseline'} measurements in {args.baseline} for these scales "
+              f"and benchmarks")
+        return 2 if args.check else 0
+    differences = _differences(baseline, report)
+    if differences:
+        print(f"Baseline at {args.baseline} was recorded in another environment ({', '.join(differences)}); only "
+              f"row counts are compared. Record a baseline on this machine with --save-baseline")
+    regressions = compare(results, baseline['results'], args.tolerance, args.min_seconds, args.min_mb,
+                          timings=not differences)
+    if regressions:
+        print(f"REGRESSIONS against {args.baseline}:")
+        for message in regressions:
+            print(f"  {message}")
+        return 1
+
+    missing = [f"scale {scale} {name}" for scale, scale_results in results.items() for name in scale_results
+               if name not in baseline['results'].get(scale, {})]
+    if missing and args.check:
+        print(f"NO BASELINE measurements in {args.baseline} for {', '.join(missing)}")
+    print(f"No regressions against {args.baseline}{' in row counts' if differences else ''}")
+    return 2 if args.check and (differences or missing) else 0
+
+
+def _differences(baseline, report):
+    """Return messages describing why the times of a baseline and a report cannot be compared"""
+    differences = fingerprint_differences(baseline['environment'], report['environment'])
+    if baseline.get('repeat', 1) != report['repeat']:
+        differences.append(f"repeat {baseline.get('repeat', 1)} -> {report['repeat']}")
+    return differences
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Time the indexed title matching of tools.title_matching and check its candidates against a brute-force pairing.
+
+Run from the microsoft_movies directory:
+    python -m benchmarks.bench_titles [--scales 0.1 1] [--repeat 3] [--parity-scale 0.1] [--min-recall 0.99]
+
+For every scale, match_sources is timed for each pair of sources on the synthetic files of benchmarks.synthetic, with
+the time to build the TitleIndex of the indexed source reported separately. At --parity-scale, every record of the
+looked up source is also scored against every record of the indexed source within the year window, as match_titles
+would without an index. The number of scored pairs shows the work the index saves, and the recall is the share of
+the pairs scoring at least the threshold that the index also finds. The run exits with status 1 when the recall of a
+pair of sources is below --min-recall.
+
+Candidates are found through the rarest title tokens listing at most title_matching.MAX_POSTINGS titles of a year, so
+the number of scored pairs, and the matching time, grow linearly with the scale. The brute-force pairing still grows
+with the square of the scale, hence the small default --parity-scale.
+"""
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+
+from benchmarks.bench_suite import measure, prepare
+from tools import disk_cache, title_matching
+
+# Matched sources, as (looked up source, indexed source)
+PAIRS = [('tn', 'imdb'), ('bom', 'imdb'), ('tmdb', 'imdb'), ('bom', 'tn')]
+
+# Arguments of match_sources, also applied by the brute-force pairing
+YEAR_TOLERANCE = 1
+THRESHOLD = 0.6
+
+
+def load(name):
+    """Return the titles and years of a source as match_sources prepares them"""
+    title, year, _ = title_matching.SOURCE_COLUMNS[name]
+    df = title_matching.load_source(name).dropna(subset=[title, year]).reset_index(drop=True)
+    return df[title], df[year].astype(int)
+
+
+def index_pairs(left_titles, left_years, right_titles, right_years):
+    """Return the number of candidate pairs the index scores and the set of those scoring at least THRESHOLD"""
+    index = title_matching.TitleIndex(right_titles, right_years)
+    scored, found = 0, set()
+    for position, (title, year) in enumerate(zip(left_titles, left_years)):
+        grams = title_matching.trigrams(title)
+        candidates = index.candidates(title, year, year_tolerance=YEAR_TOLERANCE)
+        scored += len(candidates)
+        for candidate in candidates:
+            if _score(grams, year, index.trigrams(candidate), index.years[candidate]) >= THRESHOLD:
+                found.add((position, candidate))
+    return scored, found
+
+
+def brute_force_pairs(left_titles, left_years, right_titles, right_years):
+    """Return the number of pairs within the year window and the set of those scoring at least THRESHOLD"""
+    by_year = defaultdict(list)
+    for position, (title, year) in enumerate(zip(right_titles, right_years)):
+        by_year[year].append((position, title_matching.trigrams(title)))
+
+    scored, found = 0, set()
+    for position, (title, year) in enumerate(zip(left_titles, left_years)):
+        grams = title_matching.trigrams(title)
+        for block_year in range(year - YEAR_TOLERANCE, year + YEAR_TOLERANCE + 1):
+            for candidate, candidate_grams in by_year.get(block_year, ()):
+                scored += 1
+                if _score(grams, year, candidate_grams, block_year) >= THRESHOLD:
+                    found.add((position, candidate))
+    return scored, found
+
+
+def parity(scale, seed=0):
+    """Print the candidate counts and recall of the index against the brute-force pairing; return the lowest recall"""
+    lowest = 1.0
+    cwd = os.getcwd()
+    os.chdir(prepare(scale, seed))
+    try:
+        for left, right in PAIRS:
+            sources = load(left) + load(right)
+            index_scored, index_found = index_pairs(*sources)
+            brute_scored, brute_found = brute_force_pairs(*sources)
+            recall = len(index_found & brute_found) / len(brute_found) if brute_found else 1.0
+            lowest = min(lowest, recall)
+            print(f"scale {scale:<5g} {left + ' -> ' + right:<14} scored pairs index {index_scored:>12,}"
+                  f"  brute force {brute_scored:>12,}  pairs above threshold index {len(index_found):>8,}"
+                  f"  brute force {len(brute_found):>8,}  recall {recall:7.2%}")
+    finally:
+        os.chdir(cwd)
+    return lowest
+
+
+def run(scales, repeat=1, seed=0):
+    cwd = os.getcwd()
+    for scale in scales:
+        os.chdir(prepare(scale, seed))
+        try:
+            for left, right in PAIRS:
+                # Load both sources first, so that the cached cleaning functions do not parse files while timed
+                load(left)
+                right_titles, right_years = load(right)
+                start = time.perf_counter()
+                title_matching.TitleIndex(right_titles, right_years)
+                build_seconds = time.perf_counter() - start
+
+                seconds, peak_mb, rows = measure(lambda: title_matching.match_sources(left, right, YEAR_TOLERANCE,
+                                                                                      THRESHOLD), repeat)
+                print(f"scale {scale:<5g} {left + ' -> ' + right:<14} index {build_seconds:8.3f}s"
+                      f"  match {seconds:8.3f}s {peak_mb:8.1f} MB {rows:>10,} matches")
+        finally:
+            os.chdir(cwd)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', type=float, nargs='+', default=[0.1, 1])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--parity-scale', type=float, default=0.1)
+    parser.add_argument('--min-recall', type=float, default=0.99)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    disk_cache.DISK_CACHE_ENABLED = False
+    run(args.scales, args.repeat, args.seed)
+    recall = parity(args.parity_scale, args.seed)
+    if recall < args.min_recall:
+        print(f"Recall {recall:.2%} is below {args.min_recall:.2%}")
+        return 1
+    return 0
+
+
+def _score(grams, year, candidate_grams, candidate_year):
+    """Return the match_titles score of a pair matched with years"""
+    return title_matching._jaccard(grams, candidate_grams) - 0.01 * abs(year - candidate_year)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+Load-test the query service and report latency percentiles and throughput.
+
+Run from the microsoft_movies directory, against a running service or one spawned for the test:
+    python -m benchmarks.load_test [--url http://127.0.0.1:8765] [--spawn] [--requests 2000] [--concurrency 32]
+
+Each of --concurrency clients keeps one HTTP/1.1 connection open and sends requests drawn in turn from PATHS, so the
+run mixes cached responses with the first, computed, request of every parameter combination. Latency is measured
+from sending a request to reading its full response; p50, p90, p99 and max latency and overall throughput are
+reported for the whole run and per endpoint.
+"""
+import argparse
+import asyncio
+import itertools
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+# Request targets cycled through by the clients
+PATHS = [
+    '/rt?focus=genre_popularity',
+    '/rt?focus=rating_popularity&by=percent_positive',
+    '/rt?focus=combined_popularity',
+    '/bom_imdb',
+    '/imdb_ratings',
+    '/top_crew',
+    '/top_crew?genre=Action',
+    '/top_crew?genre=Sci-Fi&role=director',
+    '/top_crew?genre=Adventure&role=actor&limit=10',
+    '/top_crew?genre=Animation&role=writer',
+]
+
+
+async def request(reader, writer, host, path):
+    """Send one GET request on an open connection and return its status code"""
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode('latin-1'))
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def client(host, port, paths, results):
+    """Send every request of paths over one connection, appending (path, status, seconds) to results"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for path in paths:
+            start = time.perf_counter()
+            status = await request(reader, writer, host, path)
+            results.append((path, status, time.perf_counter() - start))
+    finally:
+        writer.close()
+
+
+async def run(host, port, total, concurrency):
+    """Split total requests over concurrency clients and return their results and the elapsed time"""
+    targets = list(itertools.islice(itertools.cycle(PATHS), total))
+    results = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, targets[i::concurrency], results) for i in range(concurrency)))
+    return results, time.perf_counter() - start
+
+
+async def wait_until_ready(host, port, timeout):
+    """Poll /health until the service answers, for services spawned by this script"""
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            try:
+                if await request(reader, writer, host, '/health') == 200:
+                    return
+            finally:
+                writer.close()
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"service at {host}:{port} did not start within {timeout}s")
+            await asyncio.sleep(0.5)
+
+
+def report(results, elapsed):
+    """Print latency percentiles, error counts and throughput, overall and per path"""
+    def line(label, rows):
+        latencies = np.array([seconds for _, _, seconds in rows]) * 1000
+        errors = sum(status != 200 for _, status, _ in rows)
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        print(f"{label:<48} {len(rows):>7} {errors:>6} {p50:9.2f} {p90:9.2f} {p99:9.2f} {latencies.max():9.2f}")
+
+    print(f"{'path':<48} {'requests':>7} {'errors':>6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for path in PATHS:
+        rows = [row for row in results if row[0] == path]
+        if rows:
+            line(path, rows)
+    line('all', results)
+    print(f"{len(results)} requests in {elapsed:.2f}s: {len(results) / elapsed:.1f} requests/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the query service")
+    parser.add_argument('--url', default='http://127.0.0.1:8765')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--spawn', action='store_true', help="start python -m tools.service for the test")
+    parser.add_argument('--startup-timeout', type=float, default=300)
+    args = parser.parse_args(argv)
+
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    process = None
+    if args.spawn:
+        process = subprocess.Popen([sys.executable, '-m', 'tools.service', '--host', host, '--port', str(port)])
+    try:
+        if process is not None:
+            asyncio.run(wait_until_ready(host, port, args.startup_timeout))
+        results, elapsed = asyncio.run(run(host, port, args.requests, args.concurrency))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    report(results, elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,378 @@
+"""
+Generate schema-faithful synthetic versions of the eleven source files at a chosen scale.
+
+Scale 1 matches the row counts of the full source files the project was built on (146,144 IMDB titles, 1,028,186
+principals, 54,432 Rotten Tomatoes reviews, ...), so scale 10 and 100 model a catalog ten and a hundred times larger.
+Fractional scales give quick smoke runs. Every file has the columns, value formats and missing value rates that the
+cleaning functions expect: dollar strings with separators, 'Oct 9, 1971' dates, '104 minutes' runtimes, comma
+separated IMDB genres, pipe separated Rotten Tomatoes genres, stringified TMDB genre id lists and duplicated reviews.
+Titles are shared between IMDB, Box Office Mojo, The Numbers and TMDB (with punctuation variants) so that the merging
+functions find matches, and a share of titles has more than 100,000 votes so the top crew filters keep rows.
+
+Run from the microsoft_movies directory:
+    python -m benchmarks.synthetic [scale] [directory]
+
+CONTENTS
+I. imports and row counts
+II. generation functions
+III. helper functions
+"""
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Rows of each source file at scale 1
+BASE_ROWS = {
+    'imdb.title.basics.csv': 146_144,
+    'imdb.title.akas.csv': 331_703,
+    'imdb.title.crew.csv': 146_144,
+    'imdb.title.principals.csv': 1_028_186,
+    'imdb.title.ratings.csv': 73_856,
+    'imdb.name.basics.csv': 606_648,
+    'rt.movie_info.tsv': 1_560,
+    'rt.reviews.tsv': 54_432,
+    'bom.movie_gross.csv': 3_387,
+    'tmdb.movies.csv': 26_517,
+    'tn.movie_budgets.csv': 5_782,
+}
+
+# Genre id mapping written as tmdb_genre_ids.json, as bundled in ./data
+TMDB_GENRE_IDS = {28: 'Action', 12: 'Adventure', 16: 'Animation', 35: 'Comedy', 80: 'Crime', 99: 'Documentary',
+                  18: 'Drama', 10751: 'Family', 14: 'Fantasy', 36: 'History', 27: 'Horror', 10402: 'Music',
+                  9648: 'Mystery', 10749: 'Romance', 878: 'Science Fiction', 10770: 'TV Movie', 53: 'Thriller',
+                  10752: 'War', 37: 'Western'}
+
+IMDB_GENRES = ['Action', 'Adult', 'Adventure', 'Animation', 'Biography', 'Comedy', 'Crime', 'Documentary', 'Drama',
+               'Family', 'Fantasy', 'Game-Show', 'History', 'Horror', 'Music', 'Musical', 'Mystery', 'News',
+               'Reality-TV', 'Romance', 'Sci-Fi', 'Sport', 'Talk-Show', 'Thriller', 'War', 'Western']
+
+RT_GENRES = ['Action and Adventure', 'Animation', 'Art House and International', 'Classics', 'Comedy', 'Documentary',
+             'Drama', 'Horror', 'Kids and Family', 'Musical and Performing Arts', 'Mystery and Suspense', 'Romance',
+             'Science Fiction and Fantasy', 'Special Interest', 'Sports and Fitness', 'Television', 'Western']
+
+PRINCIPAL_CATEGORIES = ['actor', 'actress', 'director', 'producer', 'writer', 'composer', 'cinematographer', 'editor',
+                        'self', 'production_designer', 'archive_footage']
+PRINCIPAL_WEIGHTS = [0.25, 0.15, 0.14, 0.11, 0.12, 0.07, 0.06, 0.05, 0.03, 0.015, 0.005]
+
+TITLE_WORDS = ['the', 'last', 'night', 'love', 'man', 'dark', 'story', 'life', 'world', 'star', 'war', 'blood', 'city',
+               'secret', 'house', 'king', 'girl', 'dead', 'return', 'summer', 'home', 'lost', 'black', 'red', 'road',
+               'time', 'dream', 'fire', 'river', 'ghost', 'heart', 'game', 'wild', 'little', 'big', 'island', 'moon',
+               'shadow', 'silent', 'golden', 'broken', 'rising', 'edge', 'kingdom', 'empire', 'legend', 'hunter',
+               'storm', 'angel', 'devil', 'paradise', 'escape', 'journey', 'dragon', 'machine', 'planet', 'winter']
+
+# Syllables of made-up names, which keep most generated film titles distinct as they are in the real sources
+NAME_SYLLABLES = ['ka', 'lo', 'mi', 'ran', 'tor', 'vel', 'zu', 'bri', 'da', 'fen', 'gor', 'hal', 'is', 'jun', 'kel',
+                  'mar', 'nor', 'os', 'pel', 'quin', 'ra', 'sel', 'tan', 'ul', 'vor', 'wen', 'xa', 'yor', 'zen', 'ar']
+
+FIRST_NAMES = ['James', 'Mary', 'John', 'Patricia', 'Robert', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+               'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Charles', 'Karen']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+              'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin']
+
+"""
+II.
+GENERATION FUNCTIONS:
+1. generate
+2. generate_imdb
+3. generate_rt
+4. generate_box_office
+"""
+
+
+def generate(directory, scale=1, seed=0):
+    """
+    Write every source file, and tmdb_genre_ids.json, into directory
+
+    @param directory: output directory, e.g. './data/.synthetic/scale-10/data'
+    @param scale: multiplier applied to BASE_ROWS
+    @param seed: seed of the random generator; the same seed and scale always give the same files
+    @return: dict mapping each file name to its number of rows
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    titles = generate_imdb(directory, scale, rng)
+    generate_rt(directory, scale, rng)
+    generate_box_office(directory, scale, rng, titles)
+
+    with open(os.path.join(directory, 'tmdb_genre_ids.json'), 'w') as f:
+        json.dump({str(genre_id): genre for genre_id, genre in TMDB_GENRE_IDS.items()}, f)
+
+    return {name: rows(name, scale) for name in BASE_ROWS}
+
+
+def generate_imdb(directory, scale, rng):
+    """Write the six IMDB files and return the titles, with their start years, that other sources reuse"""
+    n_titles = rows('imdb.title.basics.csv', scale)
+    n_names = rows('imdb.name.basics.csv', scale)
+    tconst = _ids('tt', n_titles, 7)
+    nconst = _ids('nm', n_names, 7)
+
+    # Title basics: mostly recent films, about 3.7% without genres and 20% without runtime
+    primary_title = _titles(rng, n_titles)
+    original_title = primary_title.where(rng.random(n_titles) < 0.9, _titles(rng, n_titles))
+    start_year = rng.integers(2010, 2020, n_titles)
+    basics = pd.DataFrame({'tconst': tconst,
+                           'primary_title': primary_title,
+                           'original_title': original_title,
+                           'start_year': start_year,
+                           'runtime_minutes': _with_missing(rng, rng.integers(45, 180, n_titles).astype(float), 0.2),
+                           'genres': _with_missing(rng, _joined(rng, IMDB_GENRES, n_titles, 3, ','), 0.037)})
+    _write(basics, directory, 'imdb.title.basics.csv')
+
+    # Ratings: a subset of titles, with heavy-tailed vote counts
+    rated = np.sort(rng.choice(n_titles, rows('imdb.title.ratings.csv', scale), replace=False))
+    numvotes = np.minimum(np.round(5 * rng.pareto(0.6, len(rated)) + 5), 2_000_000).astype(np.int64)
+    ratings = pd.DataFrame({'tconst': tconst[rated],
+                            'averagerating': np.round(np.clip(rng.normal(6.3, 1.5, len(rated)), 1, 10), 1),
+                            'numvotes': numvotes})
+    _write(ratings, directory, 'imdb.title.ratings.csv')
+
+    # Name basics
+    n = n_names
+    names = pd.DataFrame({'nconst': nconst,
+                          'primary_name': _person_names(rng, n),
+                          'birth_year': _with_missing(rng, rng.integers(1920, 2005, n).astype(float), 0.86),
+                          'death_year': _with_missing(rng, rng.integers(1950, 2020, n).astype(float), 0.99),
+                          'primary_profession': _with_missing(rng, _joined(rng, PRINCIPAL_CATEGORIES[:8], n, 3, ','),
+                                                              0.08),
+                          'known_for_titles': _with_missing(rng, _joined(rng, tconst, n, 4, ','), 0.05)})
+    _write(names, directory, 'imdb.name.basics.csv')
+
+    # Principals: about seven credits per title, numbered by 'ordering'
+    n = rows('imdb.title.principals.csv', scale)
+    title_index = np.sort(rng.integers(0, n_titles, n))
+    ordering = _ordering(title_index)
+    category = rng.choice(PRINCIPAL_CATEGORIES, n, p=PRINCIPAL_WEIGHTS)
+    characters = pd.Series('["' + _person_names(rng, n) + '"]').where(np.isin(category, ['actor', 'actress']))
+    principals = pd.DataFrame({'tconst': tconst[title_index],
+                               'ordering': ordering,
+                               'nconst': nconst[rng.integers(0, n_names, n)],
+                               'category': category,
+                               'job': pd.Series(category).where(rng.random(n) < 0.17).radd('assistant '),
+                               'characters': characters})
+    _write(principals, directory, 'imdb.title.principals.csv')
+
+    # Akas: alternative titles for most titles
+    n = rows('imdb.title.akas.csv', scale)
+    title_index = np.sort(rng.integers(0, n_titles, n))
+    akas = pd.DataFrame({'title_id': tconst[title_index],
+                         'ordering': _ordering(title_index),
+                         'title': primary_title.to_numpy()[title_index],
+                         'region': _with_missing(rng, rng.choice(['US', 'GB', 'FR', 'DE', 'IN', 'JP', 'BR'], n), 0.16),
+                         'language': _with_missing(rng, rng.choice(['en', 'fr', 'de', 'hi', 'ja', 'es'], n), 0.87),
+                         'types': _with_missing(rng, rng.choice(['imdbDisplay', 'original', 'working'], n), 0.49),
+                         'attributes': _with_missing(rng, rng.choice(['new title', 'literal title'], n), 0.95),
+                         'is_original_title': _with_missing(rng, (rng.random(n) < 0.1).astype(float), 0.0001)})
+    _write(akas, directory, 'imdb.title.akas.csv')
+
+    # Crew: directors and writers of every title
+    n = rows('imdb.title.crew.csv', scale)
+    crew = pd.DataFrame({'tconst': tconst[:n],
+                         'directors': _with_missing(rng, _joined(rng, nconst, n, 2, ','), 0.04),
+                         'writers': _with_missing(rng, _joined(rng, nconst, n, 3, ','), 0.24)})
+    _write(crew, directory, 'imdb.title.crew.csv')
+
+    return pd.DataFrame({'title': primary_title, 'year': start_year})
+
+
+def generate_rt(directory, scale, rng):
+    """Write the Rotten Tomatoes movie info and reviews files"""
+    n = rows('rt.movie_info.tsv', scale)
+    ids = np.sort(rng.choice(np.arange(1, 2 * n + 1), n, replace=False))
+    theater_date = _dates(rng, n, 1930, 2018, '%b')
+    dvd_date = _dates(rng, n, 1997, 2019, '%b')
+    box_office = pd.Series(rng.integers(400, 400_000_000, n)).map('{:,}'.format)
+    has_box_office = rng.random(n) < 0.22
+    info = pd.DataFrame({'id': ids,
+                         'synopsis': _with_missing(rng, _titles(rng, n, 8, 20, named=False) + '.', 0.04),
+                         'rating': _with_missing(rng, rng.choice(['R', 'NR', 'PG', 'PG-13', 'G', 'NC17'], n,
+                                                                 p=[0.33, 0.32, 0.15, 0.15, 0.04, 0.01]), 0.002),
+                         'genre': _with_missing(rng, _joined(rng, RT_GENRES, n, 3, '|'), 0.005),
+                         'director': _with_missing(rng, _person_names(rng, n), 0.13),
+                         'writer': _with_missing(rng, _person_names(rng, n), 0.29),
+                         'theater_date': theater_date.where(rng.random(n) > 0.23),
+                         'dvd_date': dvd_date.where(rng.random(n) > 0.23),
+                         'currency': pd.Series('$', index=range(n)).where(has_box_office),
+                         'box_office': box_office.where(has_box_office),
+                         'runtime': _with_missing(rng, pd.Series(rng.integers(60, 200, n)).astype(str) + ' minutes',
+                                                  0.02),
+                         'studio': _with_missing(rng, rng.choice(['Universal Pictures', 'Paramount Pictures',
+                                                                  'Warner Bros. Pictures', 'Sony Pictures Classics',
+                                                                  'IFC Films', 'Magnolia Pictures'], n), 0.68)})
+    _write(info, directory, 'rt.movie_info.tsv', sep='\t')
+
+    # Reviews: some exact duplicate rows, which clean_rt_reviews drops
+    n = rows('rt.reviews.tsv', scale)
+    n_unique = n - n // 50
+    ratings = ['3/5', '4/5', '2/5', '3.5/4', '2.5/4', 'B+', 'B', 'C', 'A-', '7/10', '8/10']
+    reviews = pd.DataFrame({'id': rng.choice(ids, n_unique),
+                            'review': _with_missing(rng, _titles(rng, n_unique, 6, 25, named=False) + '.', 0.1),
+                            'rating': _with_missing(rng, rng.choice(ratings, n_unique), 0.25),
+                            'fresh': rng.choice(['fresh', 'rotten'], n_unique, p=[0.6, 0.4]),
+                            'critic': _with_missing(rng, _person_names(rng, n_unique), 0.05),
+                            'top_critic': (rng.random(n_unique) < 0.24).astype(int),
+                            'publisher': _with_missing(rng, rng.choice(['Variety', 'Film Threat', 'eFilmCritic.com',
+                                                                        'New York Times', 'Village Voice',
+                                                                        'Chicago Reader', 'Time Out'], n_unique),
+                                                       0.006),
+                            'date': _dates(rng, n_unique, 1990, 2019, '%B')})
+    reviews = pd.concat([reviews, reviews.sample(n - n_unique, random_state=rng.integers(2 ** 31))])
+    _write(reviews, directory, 'rt.reviews.tsv', sep='\t', encoding='latin-1')
+
+
+def generate_box_office(directory, scale, rng, titles):
+    """Write the Box Office Mojo, TMDB and The Numbers files, reusing IMDB titles so that the sources can be joined"""
+    # Box Office Mojo: 2010-2018 releases, a few titles suffixed with their year as in the original file
+    n = rows('bom.movie_gross.csv', scale)
+    picked = titles.iloc[rng.integers(0, len(titles), n)].reset_index(drop=True)
+    year = np.minimum(picked['year'].to_numpy(), 2018)
+    title = picked['title'].where(rng.random(n) > 0.05, picked['title'] + ' (' + pd.Series(year).astype(str) + ')')
+    foreign = pd.Series(rng.integers(1, 900_000_000, n)).astype(str)
+    foreign = foreign.where(rng.random(n) > 0.01, '1,' + foreign.str[:3] + '.' + foreign.str[-1])
+    bom = pd.DataFrame({'title': title,
+                        'studio': _with_missing(rng, rng.choice(['BV', 'Uni.', 'WB', 'Fox', 'Sony', 'Par.', 'LGF',
+                                                                 'IFC', 'Magn.', 'SPC', 'Wein.', 'FoxS'], n), 0.0015),
+                        'domestic_gross': _with_missing(rng, rng.integers(100, 700_000_000, n).astype(float), 0.008),
+                        'foreign_gross': foreign.where(rng.random(n) > 0.4),
+                        'year': year})
+    _write(bom, directory, 'bom.movie_gross.csv')
+
+    # TMDB: release dates within a year of the IMDB start year
+    n = rows('tmdb.movies.csv', scale)
+    picked = titles.iloc[rng.integers(0, len(titles), n)].reset_index(drop=True)
+    genre_ids = pd.Series(_joined(rng, [str(genre_id) for genre_id in TMDB_GENRE_IDS], n, 4, ', '))
+    genre_ids = ('[' + genre_ids + ']').where(rng.random(n) > 0.09, '[]')
+    release_date = _dates(rng, n, picked['year'], picked['year'], None)
+    tmdb = pd.DataFrame({'genre_ids': genre_ids,
+                         'id': rng.choice(np.arange(1, 20 * n + 2), n, replace=False),
+                         'original_language': rng.choice(['en', 'fr', 'es', 'ru', 'ja', 'de', 'zh'], n,
+                                                         p=[0.88, 0.02, 0.02, 0.02, 0.02, 0.02, 0.02]),
+                         'original_title': picked['title'],
+                         'popularity': np.round(rng.gamma(1.0, 3.0, n) + 0.6, 3),
+                         'release_date': release_date,
+                         'title': picked['title'],
+                         'vote_average': np.round(rng.uniform(0, 10, n), 1),
+                         'vote_count': np.round(rng.pareto(0.8, n) + 1).astype(np.int64).clip(1, 25_000)})
+    _write(tmdb, directory, 'tmdb.movies.csv', index=True)
+
+    # The Numbers: ids cycle from 1 to 100, dollar amounts are strings such as '$425,000,000'
+    n = rows('tn.movie_budgets.csv', scale)
+    picked = titles.iloc[rng.integers(0, len(titles), n)].reset_index(drop=True)
+    release_date = _dates(rng, n, picked['year'], picked['year'], '%b')
+    budget = rng.integers(1_100, 425_000_000, n)
+    domestic = (budget * rng.gamma(1.0, 1.2, n)).astype(np.int64) * (rng.random(n) > 0.09)
+    worldwide = domestic + (budget * rng.gamma(1.0, 1.3, n)).astype(np.int64) * (rng.random(n) > 0.06)
+    tn = pd.DataFrame({'id': np.arange(n) % 100 + 1,
+                       'release_date': release_date,
+                       'movie': picked['title'],
+                       'production_budget': _dollars(budget),
+                       'domestic_gross': _dollars(domestic),
+                       'worldwide_gross': _dollars(worldwide)})
+    _write(tn, directory, 'tn.movie_budgets.csv')
+
+
+"""
+III.
+HELPER FUNCTIONS:
+"""
+
+
+def rows(name, scale):
+    """Return the number of rows of a source file at a scale, at least one"""
+    return max(1, int(round(BASE_ROWS[name] * scale)))
+
+
+def _ids(prefix, n, width):
+    """Return IMDB style identifiers, e.g. 'tt0000001'"""
+    return (prefix + pd.Series(np.arange(1, n + 1)).astype(str).str.zfill(width)).to_numpy()
+
+
+def _titles(rng, n, min_words=1, max_words=3, named=True):
+    """Return a Series of capitalized titles of TITLE_WORDS, and of a made-up name if named, some with punctuation"""
+    words = np.array(TITLE_WORDS, dtype=object)
+    counts = rng.integers(min_words, max_words + 1, n)
+    titles = pd.Series(words[rng.integers(0, len(words), n)])
+    for position in range(1, max_words):
+        more = counts > position
+        titles[more] = titles[more] + ' ' + words[rng.integers(0, len(words), more.sum())]
+    if named:
+        syllables = np.array(NAME_SYLLABLES, dtype=object)
+        name = pd.Series(syllables[rng.integers(0, len(syllables), n)])
+        for _ in range(2):
+            name = name + syllables[rng.integers(0, len(syllables), n)]
+        first = rng.random(n) < 0.5
+        titles = (name + ' ' + titles).where(first, titles + ' of ' + name)
+    titles = titles.str.title()
+
+    # Sequels and subtitles exercise remove_punctuation
+    sequel = rng.random(n) < 0.05
+    titles[sequel] = titles[sequel] + ' ' + rng.integers(2, 6, sequel.sum()).astype(str)
+    subtitled = rng.random(n) < 0.08
+    titles[subtitled] = titles[subtitled] + ': The ' + words[rng.integers(0, len(words), subtitled.sum())]
+    return titles
+
+
+def _person_names(rng, n):
+    first = np.array(FIRST_NAMES, dtype=object)[rng.integers(0, len(FIRST_NAMES), n)]
+    last = np.array(LAST_NAMES, dtype=object)[rng.integers(0, len(LAST_NAMES), n)]
+    return first + ' ' + last
+
+
+def _joined(rng, values, n, max_count, sep):
+    """Return an array of 1 to max_count distinct values joined with sep"""
+    values = np.asarray(values, dtype=object)
+    counts = rng.integers(1, max_count + 1, n)
+    draws = rng.integers(0, len(values), (n, max_count))
+    joined = pd.Series(values[draws[:, 0]])
+    for position in range(1, max_count):
+        # Only add a value when it differs from the ones already joined, so lists hold distinct values
+        more = (counts > position) & (draws[:, :position] != draws[:, [position]]).all(axis=1)
+        joined[more] = joined[more] + sep + values[draws[more, position]]
+    return joined.to_numpy()
+
+
+def _ordering(group_index):
+    """Return the 1-based position of every row within runs of equal values of a sorted array"""
+    starts = np.flatnonzero(np.r_[True, group_index[1:] != group_index[:-1]])
+    lengths = np.diff(np.r_[starts, len(group_index)])
+    return np.arange(len(group_index)) - np.repeat(starts, lengths) + 1
+
+
+def _dates(rng, n, first_year, last_year, month_format):
+    """
+    Return n random dates formatted like 'Oct 9, 1971' ('%b'), 'October 9, 1971' ('%B') or '1971-10-09' (None)
+
+    first_year and last_year are ints, or aligned Series of years to draw a date within each row's range from
+    """
+    first = pd.to_datetime(pd.Series(first_year, index=range(n)).astype(str) + '-01-01')
+    last = pd.to_datetime(pd.Series(last_year, index=range(n)).astype(str) + '-12-31')
+    days = (last - first).dt.days.to_numpy()
+    dates = first + pd.to_timedelta(np.floor(rng.random(n) * (days + 1)), unit='D')
+    if month_format is None:
+        return dates.dt.strftime('%Y-%m-%d')
+    return dates.dt.strftime(month_format) + ' ' + dates.dt.day.astype(str) + ', ' + dates.dt.year.astype(str)
+
+
+def _dollars(amounts):
+    return '$' + pd.Series(amounts).map('{:,}'.format)
+
+
+def _with_missing(rng, values, rate):
+    """Return values as a Series with about rate of them replaced by NaN"""
+    values = pd.Series(values)
+    return values.where(rng.random(len(values)) >= rate)
+
+
+def _write(df, directory, name, index=False, **kwargs):
+    df.to_csv(os.path.join(directory, name), index=index, **kwargs)
+
+
+if __name__ == '__main__':
+    scale = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+    directory = sys.argv[2] if len(sys.argv) > 2 else f"./data/.synthetic/scale-{scale:g}/data"
+    for name, count in generate(directory, scale).items():
+        print(f"{name:<28} {count:>12,} rows")
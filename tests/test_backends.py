@@ -0,0 +1,58 @@
+"""
+Check that the DuckDB backend returns the same DataFrames as the pandas path.
+
+Run from the microsoft_movies directory, with duckdb installed:
+    python -m unittest tests.test_backends
+    python -m pytest tests
+
+Every call of benchmarks.bench_backends.CALLS runs with backend='pandas' and backend='duckdb' on the synthetic files
+of SCALE, with the in-memory and on-disk caches disabled, and the results must pass pd.testing.assert_frame_equal:
+same index, columns, row order, dtypes (categories included) and values, floats up to bench_backends.RTOL.
+benchmarks.bench_backends runs the same comparison at larger scales and times both backends.
+"""
+import importlib.util
+import os
+import unittest
+
+import pandas as pd
+
+from benchmarks.bench_backends import CALLS, RTOL
+from benchmarks.bench_suite import prepare
+from tools import cache, data_preparation, disk_cache
+
+# Scale of the synthetic files, small enough for a quick run
+SCALE = 0.1
+
+
+@unittest.skipIf(importlib.util.find_spec('duckdb') is None, "the 'duckdb' backend requires the duckdb package")
+class BackendParityTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cwd = os.getcwd()
+        cls.enabled = cache.DATASET_CACHE.enabled, disk_cache.DISK_CACHE_ENABLED
+        cache.DATASET_CACHE.enabled = False
+        disk_cache.DISK_CACHE_ENABLED = False
+        os.chdir(prepare(SCALE, seed=0))
+
+    @classmethod
+    def tearDownClass(cls):
+        os.chdir(cls.cwd)
+        cache.DATASET_CACHE.enabled, disk_cache.DISK_CACHE_ENABLED = cls.enabled
+
+    def test_same_results(self):
+        for name, function_name, kwargs in CALLS:
+            with self.subTest(name):
+                func = getattr(data_preparation, function_name)
+                pd.testing.assert_frame_equal(func(backend='pandas', **kwargs), func(backend='duckdb', **kwargs),
+                                              rtol=RTOL)
+
+    def test_same_results_without_matches(self):
+        expected = data_preparation.merge_imdb_top_crew('Western', 'composer', backend='pandas')
+        self.assertTrue(expected.empty)
+        pd.testing.assert_frame_equal(expected, data_preparation.merge_imdb_top_crew('Western', 'composer',
+                                                                                     backend='duckdb'))
+
+
+if __name__ == '__main__':
+    unittest.main()
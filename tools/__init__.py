@@ -0,0 +1,23 @@
+"""
+Data preparation, analysis and serving tools for the Microsoft movies analysis.
+
+Importing the package imports none of its modules: each one, e.g. tools.data_preparation, is imported the first time
+it is accessed as an attribute, so that `python -m tools --help` and other lightweight entry points do not pay for
+loading pandas.
+"""
+import importlib
+
+# Modules loaded on first attribute access
+SUBMODULES = ['TN_File_Eddie', 'backends', 'cache', 'constants', 'crew_cube', 'data_preparation', 'dates',
+              'disk_cache', 'genres', 'incremental', 'instrumentation', 'keys', 'parallel', 'query', 'sampling',
+              'schemas', 'service', 'title_matching']
+
+
+def __getattr__(name):
+    if name in SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + SUBMODULES)
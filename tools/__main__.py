@@ -0,0 +1,181 @@
+"""
+Command line interface running the analyses of the tools package.
+
+Run from the microsoft_movies directory:
+    python -m tools rt-popularity [--focus genre_popularity] [--by total_positive]
+    python -m tools bom-imdb [--backend duckdb]
+    python -m tools top-crew [--genre Action] [--role director] [--backend duckdb]
+    python -m tools tn-profit [--top 10] [--group-by genres] [--value net_gain]
+    python -m tools sources
+
+Every analysis prints its result as CSV, or writes it to --output as CSV, JSON (one record per row) or Parquet, chosen
+with --format or from the file extension. Modules are imported by the subcommand that needs them, so that --help and
+the sources subcommand start without loading pandas; benchmarks.bench_startup tracks these startup times.
+
+CONTENTS
+I. imports and constants
+II. subcommands
+III. output and parser functions
+"""
+import argparse
+import os
+import sys
+
+from tools import constants
+
+# Output formats, keyed by the file extensions that select them
+FORMATS = {'.csv': 'csv', '.json': 'json', '.parquet': 'parquet', '.pq': 'parquet'}
+
+"""
+II.
+SUBCOMMANDS:
+Each receives the parsed arguments and returns a DataFrame to write, or None
+1. rt_popularity
+2. bom_imdb
+3. top_crew
+4. tn_profit
+5. sources
+"""
+
+
+def rt_popularity(args):
+    # Imported here because loading the cleaning functions imports pandas
+    from tools import data_preparation
+
+    return data_preparation.merge_rt_data(args.focus, args.by)
+
+
+def bom_imdb(args):
+    from tools import data_preparation
+
+    return data_preparation.merge_bom_and_imdb(backend=args.backend)
+
+
+def top_crew(args):
+    if args.role and not args.genre:
+        raise SystemExit("top-crew: --role requires --genre")
+
+    # The persisted result cube answers the default selections; other backends compute the merge directly
+    if args.backend is None and not args.no_cube:
+        from tools import crew_cube
+        return crew_cube.top_crew(args.genre, args.role, args.limit)
+
+    from tools import data_preparation
+    return data_preparation.merge_imdb_top_crew(args.genre, args.role, backend=args.backend)
+
+
+def tn_profit(args):
+    from tools import data_preparation
+
+    return data_preparation.merge_tn_imdb(args.top or None, args.group_by, args.value)
+
+
+def sources(args):
+    """Print every source file with its size, without importing pandas"""
+    for path in constants.SOURCE_PATHS:
+        try:
+            size = f"{os.stat(path).st_size / 1024 ** 2:10.1f} MB"
+        except OSError:
+            size = f"{'missing':>13}"
+        print(f"{path:<40} {size}")
+
+
+"""
+III.
+OUTPUT AND PARSER FUNCTIONS:
+1. write
+2. build_parser
+3. main
+"""
+
+
+def write(df, output=None, output_format=None, limit=None):
+    """
+    Write a result DataFrame to a file, or as CSV to standard output
+
+    @param df: result of a subcommand
+    @param output: file path, or None or '-' for standard output
+    @param output_format: 'csv', 'json' or 'parquet', defaults to the format of the file extension, else 'csv'
+    @param limit: optional number of leading rows written
+    """
+    if limit is not None:
+        df = df.head(limit)
+    # Keep named indexes, such as 'genre', as ordinary columns
+    if any(name is not None for name in df.index.names):
+        df = df.reset_index()
+
+    to_stdout = output in (None, '-')
+    if output_format is None:
+        output_format = 'csv' if to_stdout else FORMATS.get(os.path.splitext(output)[1].lower(), 'csv')
+    if to_stdout and output_format == 'parquet':
+        raise SystemExit("Parquet output needs --output FILE")
+    target = sys.stdout if to_stdout else output
+
+    if output_format == 'csv':
+        df.to_csv(target, index=False)
+    elif output_format == 'json':
+        df.to_json(target, orient='records', lines=True, date_format='iso')
+    else:
+        try:
+            df.to_parquet(target, index=False)
+        except ImportError as error:
+            raise SystemExit(f"Parquet output needs pyarrow: {error}") from None
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m tools', description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    # Output options shared by every analysis
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument('-o', '--output', help="file to write, '-' or omitted for CSV on standard output")
+    output.add_argument('-f', '--format', choices=sorted(set(FORMATS.values())),
+                        help="output format, defaults to the format of the --output extension")
+    output.add_argument('-n', '--limit', type=int, help="write only the first LIMIT rows")
+
+    backend = argparse.ArgumentParser(add_help=False)
+    backend.add_argument('--backend', choices=constants.BACKENDS,
+                         help="execution backend, defaults to $TOOLS_BACKEND or pandas, see tools.backends")
+
+    command = subparsers.add_parser('rt-popularity', parents=[output],
+                                    help="Rotten Tomatoes review popularity by genre and/or rating")
+    command.add_argument('--focus', choices=constants.RT_FOCI, default='genre_popularity')
+    command.add_argument('--by', choices=constants.RT_SORT_COLUMNS, default='total_positive')
+    command.set_defaults(handler=rt_popularity)
+
+    command = subparsers.add_parser('bom-imdb', parents=[output, backend],
+                                    help="IMDB ratings and Box Office Mojo gross by genre")
+    command.set_defaults(handler=bom_imdb)
+
+    command = subparsers.add_parser('top-crew', parents=[output, backend],
+                                    help="top rated cast and crew of recent popular films")
+    command.add_argument('--genre', choices=constants.TOP_CREW_GENRES)
+    command.add_argument('--role', choices=constants.TOP_CREW_ROLES, help="requires --genre")
+    command.add_argument('--no-cube', action='store_true', help="compute the merge instead of using tools.crew_cube")
+    command.set_defaults(handler=top_crew)
+
+    command = subparsers.add_parser('tn-profit', parents=[output], help="genres with the highest mean net profit")
+    command.add_argument('--top', type=int, default=10, help="number of groups, 0 for all of them")
+    command.add_argument('--group-by', nargs='+', choices=constants.TN_GROUP_COLUMNS, default=['genres'])
+    command.add_argument('--value', choices=list(constants.TN_PROFIT_VALUES), default='net_gain',
+                         help="dollar column averaged, in millions")
+    command.set_defaults(handler=tn_profit)
+
+    command = subparsers.add_parser('sources', help="list the source files and their sizes")
+    command.set_defaults(handler=sources)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        df = args.handler(args)
+    except FileNotFoundError as error:
+        raise SystemExit(f"{args.command}: missing source file {error.filename}") from None
+    if df is not None:
+        write(df, args.output, args.format, args.limit)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,267 @@
+"""
+This module provides an optional DuckDB execution backend for the IMDB and Box Office Mojo functions.
+
+The pandas functions of data_preparation.py hold every source table in memory and join them on a single core. With
+backend='duckdb' (or the TOOLS_BACKEND environment variable set to 'duckdb'), the IMDB cleaning functions,
+merge_bom_and_imdb, merge_imdb_title_and_ratings and merge_imdb_top_crew instead run as SQL in an in-process DuckDB
+database. DuckDB scans the csv files in parallel, pushes the filters and projections into the scans, joins and
+aggregates on every core, and spills to TEMP_DIR when an operation does not fit in MEMORY_LIMIT. Every function still
+returns the pandas DataFrame of the pandas path, with the same index, columns, row order and dtypes, categories
+included; tests.test_backends asserts the parity of both paths, and bench_backends in the benchmarks package also
+times them.
+
+DuckDB is optional, like pyarrow in tools.disk_cache: without it, only the 'pandas' backend is available. It is only
+imported once a DuckDB function runs, so that importing data_preparation stays quick. The Rotten Tomatoes, The Numbers
+and TMDB functions always run in pandas, as their date and literal parsing relies on it.
+
+CONTENTS
+I. imports and constants
+II. backend selection
+III. DuckDB functions
+IV. helper functions
+"""
+import importlib.util
+import os
+
+import numpy as np
+
+from tools.constants import BACKENDS
+from tools.instrumentation import instrumented
+from tools.schemas import category_dtype, get_schema, read_source
+
+# Environment variable selecting the backend used when a function is called without backend=
+BACKEND_ENV = 'TOOLS_BACKEND'
+
+# Directory DuckDB spills to when joins or aggregations exceed MEMORY_LIMIT
+TEMP_DIR = "./data/.cache/duckdb"
+
+# Memory DuckDB may use before spilling, e.g. '4GB'; None keeps DuckDB's default of 80% of the RAM
+MEMORY_LIMIT = None
+
+# Strings read as missing values, matching the defaults of pd.read_csv
+NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>', 'N/A',
+             'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+# Characters removed by remove_punctuation (string.punctuation and the space) as a regular expression class
+PUNCTUATION_PATTERN = r'[!-/:-@\[-`{-~ ]'
+
+"""
+II.
+BACKEND SELECTION:
+1. resolve_backend
+2. read_with_backend
+"""
+
+
+def resolve_backend(backend=None):
+    """
+    Return the backend to run with: backend if given, else the TOOLS_BACKEND environment variable, else 'pandas'
+
+    @raise ValueError: for an unknown backend
+    @raise ImportError: for 'duckdb' when duckdb is not installed
+    """
+    backend = backend or os.environ.get(BACKEND_ENV) or 'pandas'
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+    if backend == 'duckdb' and importlib.util.find_spec('duckdb') is None:
+        raise ImportError("The 'duckdb' backend requires the duckdb package")
+    return backend
+
+
+def read_with_backend(path, backend=None):
+    """Read a source file with its registered schema through the selected backend"""
+    if resolve_backend(backend) == 'pandas':
+        return read_source(path)
+    return duckdb_read_source(path)
+
+
+"""
+III.
+DUCKDB FUNCTIONS:
+1. duckdb_read_source
+2. duckdb_merge_bom_and_imdb
+3. duckdb_merge_imdb_title_and_ratings
+4. duckdb_merge_imdb_top_crew
+"""
+
+
+@instrumented
+def duckdb_read_source(path):
+    """Read a csv source file with DuckDB's parallel reader, returning the DataFrame read_source returns"""
+    with _connect() as connection:
+        df = connection.execute(f"SELECT * FROM {_scan(path)}").df()
+    # pandas reads a column without any value as float64, DuckDB as text
+    for column in df.columns[(df.dtypes == object) & df.isna().all().to_numpy()]:
+        df[column] = df[column].astype('float64')
+    return _apply_schema(df, [path])
+
+
+@instrumented
+def duckdb_merge_bom_and_imdb(basics_path, bom_path, ratings_path):
+    """Return the DataFrame of merge_bom_and_imdb, computed in DuckDB"""
+    sql = f"""
+        WITH basics AS (
+            SELECT tconst, genres, {_cleaned_title('primary_title')} AS cleaned_title
+            FROM {_scan(basics_path)} WHERE genres IS NOT NULL
+        ), bom AS (
+            SELECT {_cleaned_title('title')} AS cleaned_title,
+                   coalesce(domestic_gross, 0) AS domestic_gross,
+                   coalesce(CAST(regexp_replace(CAST(foreign_gross AS VARCHAR), '[$,]', '', 'g') AS DOUBLE), 0)
+                       AS foreign_gross
+            FROM {_scan(bom_path)}
+        ), combined AS (
+            SELECT basics.tconst, numvotes, averagerating * numvotes AS avgrating_x_numvotes, domestic_gross,
+                   foreign_gross, domestic_gross + foreign_gross AS total_gross
+            FROM basics
+            JOIN bom USING (cleaned_title)
+            JOIN {_scan(ratings_path)} AS ratings USING (tconst)
+        ), {_bridge('basics')}
+        SELECT genre AS genres,
+               sum(numvotes) AS numvotes,
+               sum(avgrating_x_numvotes) AS avgrating_x_numvotes,
+               avg(numvotes) AS avgnumvotes,
+               avg(domestic_gross) AS domestic_gross,
+               avg(foreign_gross) AS foreign_gross,
+               avg(total_gross) AS total_gross,
+               sum(avgrating_x_numvotes) / sum(numvotes) AS wavg_rating,
+               avg(total_gross) / 10 ^ 5 AS total_gross_scaled
+        FROM bridge JOIN combined USING (tconst)
+        GROUP BY genre
+        ORDER BY genre
+    """
+    with _connect() as connection:
+        df = connection.execute(sql).df()
+        return _apply_schema(df, [ratings_path], exclude=['genres'], connection=connection)
+
+
+@instrumented
+def duckdb_merge_imdb_title_and_ratings(basics_path, ratings_path):
+    """Return the DataFrame of merge_imdb_title_and_ratings, computed in DuckDB"""
+    sql = f"""
+        WITH basics AS (
+            SELECT tconst, genres FROM {_scan(basics_path)} WHERE genres IS NOT NULL
+        ), {_bridge('basics')}
+        SELECT genre AS genres,
+               sum(numvotes) AS numvotes,
+               sum(averagerating * numvotes) AS avgrating_x_numvotes,
+               avg(numvotes) AS avgnumvotes,
+               sum(averagerating * numvotes) / sum(numvotes) AS wavg_rating
+        FROM bridge JOIN {_scan(ratings_path)} AS ratings USING (tconst)
+        GROUP BY genre
+        HAVING genre != 'Adult'
+        ORDER BY numvotes DESC
+    """
+    with _connect() as connection:
+        df = connection.execute(sql).df()
+        return _apply_schema(df, [ratings_path], exclude=['genres'], connection=connection)
+
+
+@instrumented
+def duckdb_merge_imdb_top_crew(basics_path, ratings_path, principals_path, name_basics_path, genres, roles,
+                               select_genre=None, select_role=None):
+    """Return the DataFrame of merge_imdb_top_crew, computed in DuckDB"""
+    selections = []
+    parameters = [list(genres), list(roles)]
+    if select_genre:
+        selections.append("AND genre = ?")
+        parameters.append(select_genre)
+        if select_role:
+            selections.append("AND category = ?")
+            parameters.append(select_role)
+
+    sql = f"""
+        WITH basics AS (
+            SELECT tconst, primary_title, original_title, start_year, runtime_minutes,
+                   unnest(string_split(trim(genres), ',')) AS genre
+            FROM {_scan(basics_path)} WHERE genres IS NOT NULL AND start_year > 2014
+        )
+        SELECT tconst, primary_title, original_title, start_year, runtime_minutes, genre AS genres,
+               averagerating, numvotes, ordering, nconst, category, job, characters,
+               primary_name, birth_year, death_year, primary_profession, known_for_titles
+        FROM basics
+        JOIN {_scan(ratings_path)} AS ratings USING (tconst)
+        JOIN {_scan(principals_path)} AS principals USING (tconst)
+        JOIN {_scan(name_basics_path)} AS name_basics USING (nconst)
+        WHERE list_contains(?, genre) AND list_contains(?, category) AND numvotes > 100000
+          {' '.join(selections)}
+        ORDER BY averagerating DESC, numvotes DESC
+    """
+    with _connect() as connection:
+        df = connection.execute(sql, parameters).df()
+        return _apply_schema(df, [basics_path, ratings_path, principals_path, name_basics_path], exclude=['genres'],
+                             connection=connection)
+
+
+"""
+IV.
+HELPER FUNCTIONS:
+"""
+
+
+def _connect():
+    """Return an in-memory DuckDB connection that may spill to TEMP_DIR"""
+    # Imported here because importing duckdb takes a while and most calls use the pandas backend
+    import duckdb
+
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    connection = duckdb.connect()
+    connection.execute(f"SET temp_directory = {_literal(os.path.abspath(TEMP_DIR))}")
+    if MEMORY_LIMIT is not None:
+        connection.execute(f"SET memory_limit = {_literal(MEMORY_LIMIT)}")
+    return connection
+
+
+def _scan(path):
+    """Return the table function scanning a csv source file with its separator, missing values and text columns"""
+    schema = get_schema(path)
+    options = ["header = true", f"nullstr = [{', '.join(_literal(value) for value in NA_VALUES)}]"]
+    if 'sep' in schema:
+        options.append(f"delim = {_literal(schema['sep'])}")
+    # Read object and category columns as text instead of letting DuckDB sniff numbers or dates from them
+    text_columns = [column for column, dtype in schema.get('dtype', {}).items() if dtype in ('object', 'category')]
+    if text_columns:
+        options.append(f"types = {{{', '.join(f'{_literal(column)}: VARCHAR' for column in text_columns)}}}")
+    return f"read_csv({_literal(os.path.abspath(path))}, {', '.join(options)})"
+
+
+def _cleaned_title(column):
+    """Return the SQL expression of remove_punctuation applied to a column"""
+    return f"lower(trim(regexp_replace({column}, '{PUNCTUATION_PATTERN}', '', 'g')))"
+
+
+def _bridge(titles):
+    """Return a WITH clause defining 'bridge', one (tconst, genre) row per genre of each title, as genre_bridge does"""
+    return f"bridge AS (SELECT tconst, unnest(string_split(trim(genres), ',')) AS genre FROM {titles})"
+
+
+def _apply_schema(df, paths, exclude=(), connection=None):
+    """
+    Cast columns to the dtypes registered for the source files and use NaN for missing strings, as pandas does
+
+    Category columns get the categories read_source finds in the whole source file: the values of df when it holds
+    every row of the file, otherwise the values a scan of the file through connection finds.
+    """
+    for path in paths:
+        dtypes = {column: dtype for column, dtype in get_schema(path).get('dtype', {}).items()
+                  if column in df.columns and column not in exclude}
+        categorical = [column for column, dtype in dtypes.items() if dtype == 'category']
+        categories = _categories(connection, path, categorical) if connection is not None and categorical else {}
+        for column, dtype in dtypes.items():
+            if dtype == 'category':
+                dtype = category_dtype(categories[column] if categories else df[column].dropna().unique())
+            df[column] = df[column].astype(dtype)
+    for column in df.columns[df.dtypes == object]:
+        df[column] = df[column].where(df[column].notna(), np.nan)
+    return df
+
+
+def _categories(connection, path, columns):
+    """Return the distinct non-missing values of each of the columns in a whole source file, with one scan"""
+    lists = ', '.join(f'list(DISTINCT "{column}") FILTER (WHERE "{column}" IS NOT NULL)' for column in columns)
+    row = connection.execute(f"SELECT {lists} FROM {_scan(path)}").fetchone()
+    return {column: values or [] for column, values in zip(columns, row)}
+
+
+def _literal(text):
+    """Return text as a SQL string literal"""
+    return "'" + str(text).replace("'", "''") + "'"
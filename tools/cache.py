@@ -0,0 +1,207 @@
+"""
+This module provides a shared, in-memory cache for the DataFrames returned by the cleaning functions.
+
+Every merging function in data_preparation.py calls the single file cleaning functions, so without a cache the same
+source files are read and cleaned once per merge. Wrapping a cleaning function with the cached decorator stores its
+result keyed by the function, the resolved file paths (with their modification time and size) and the remaining
+arguments, so each source is parsed once per process until the file on disk changes.
+
+CONTENTS
+I. imports and defaults
+II. DatasetCache class
+III. decorator and module level helpers
+"""
+import functools
+import inspect
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# Default memory budget for cached DataFrames, in bytes
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+"""
+II.
+DATASETCACHE CLASS:
+LRU mapping of cache keys to DataFrames, bounded by the total memory usage of the stored frames
+"""
+
+
+class DatasetCache:
+    """Least-recently-used store of cleaned DataFrames with a memory budget and hit/miss counters"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, enabled=True):
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._frames = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def current_bytes(self):
+        return sum(self._sizes.values())
+
+    def get(self, key):
+        """Return a private copy of the cached DataFrame for key, or None if it is not cached"""
+        with self._lock:
+            if key not in self._frames:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._frames.move_to_end(key)
+            return _private_copy(self._frames[key])
+
+    def put(self, key, df):
+        """Store df under key, evicting least recently used entries until the memory budget is respected"""
+        size = int(df.memory_usage(deep=True).sum()) if isinstance(df, pd.DataFrame) else 0
+
+        with self._lock:
+            # Frames larger than the whole budget are never stored
+            if size > self.max_bytes:
+                return
+            self._frames[key] = df
+            self._sizes[key] = size
+            self._frames.move_to_end(key)
+            self._evict()
+
+    def set_max_bytes(self, max_bytes):
+        """Change the memory budget, evicting entries immediately if the cache is now over budget"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        """Drop every cached DataFrame and reset the counters"""
+        with self._lock:
+            self._frames.clear()
+            self._sizes.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Return a dictionary of cache counters and memory usage"""
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self._frames),
+                    'current_bytes': self.current_bytes,
+                    'max_bytes': self.max_bytes}
+
+    def _evict(self):
+        while self._frames and self.current_bytes > self.max_bytes:
+            key, _ = self._frames.popitem(last=False)
+            del self._sizes[key]
+            self.evictions += 1
+
+
+"""
+III.
+DECORATOR AND MODULE LEVEL HELPERS:
+1. cached
+2. cache_stats
+3. clear_cache
+4. set_memory_budget
+"""
+
+# Cache shared by every decorated cleaning function
+DATASET_CACHE = DatasetCache()
+
+
+def cached(func=None, cache=None):
+    """
+    Memoize a DataFrame-returning cleaning function in a DatasetCache
+
+    Every argument whose name ends in 'path' is treated as a source file: it is resolved to an absolute path and its
+    modification time and size become part of the key, so an edited file is read again. Callers always receive their
+    own copy of the cached frame. The undecorated function remains available as func.__wrapped__, and
+    func.prime(df, *args, **kwargs) stores a frame computed elsewhere under the key of func(*args, **kwargs).
+
+    @param func: cleaning function to decorate
+    @param cache: DatasetCache instance, defaults to the module level DATASET_CACHE
+    @return: decorated function
+    """
+    if func is None:
+        return functools.partial(cached, cache=cache)
+
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        store = DATASET_CACHE if cache is None else cache
+        if not store.enabled:
+            return func(*args, **kwargs)
+
+        key = _make_key(func, signature, args, kwargs)
+        df = store.get(key)
+        if df is None:
+            df = func(*args, **kwargs)
+            store.put(key, df)
+            df = _private_copy(df)
+        return df
+
+    def prime(df, *args, **kwargs):
+        store = DATASET_CACHE if cache is None else cache
+        if store.enabled:
+            store.put(_make_key(func, signature, args, kwargs), df)
+
+    wrapper.prime = prime
+    return wrapper
+
+
+def cache_stats():
+    """Return hit/miss counters and memory usage of the shared dataset cache"""
+    return DATASET_CACHE.stats()
+
+
+def clear_cache():
+    """Empty the shared dataset cache"""
+    DATASET_CACHE.clear()
+
+
+def set_memory_budget(max_bytes):
+    """Set the memory budget, in bytes, of the shared dataset cache"""
+    DATASET_CACHE.set_max_bytes(max_bytes)
+
+
+def _make_key(func, signature, args, kwargs):
+    """Build a hashable key from the function, the stat of its source files and its bound arguments"""
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+
+    items = []
+    for name, value in bound.arguments.items():
+        if name.endswith('path') and isinstance(value, (str, os.PathLike)):
+            path = os.path.abspath(value)
+            try:
+                stat = os.stat(path)
+                value = (path, stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                value = (path, None, None)
+        items.append((name, _freeze(value)))
+
+    return (func.__module__, func.__qualname__, tuple(items))
+
+
+def _freeze(value):
+    """Convert unhashable argument values, such as lists passed as 'subset', into hashable equivalents"""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def _private_copy(df):
+    """Return a copy of a cached DataFrame that the caller is free to modify"""
+    if not isinstance(df, pd.DataFrame):
+        return df
+    # With copy-on-write enabled, a shallow copy already protects the cached frame from modification
+    copy_on_write = getattr(pd.options.mode, 'copy_on_write', False) is True
+    return df.copy(deep=not copy_on_write)
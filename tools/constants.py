@@ -0,0 +1,65 @@
+"""
+This module defines the source file paths and the analysis constants shared by the tools package.
+
+It imports nothing, so that the command line interface (python -m tools) and other lightweight callers can use the
+paths and the valid parameter values without loading pandas. data_preparation.py re-exports every name.
+
+CONTENTS
+I. source file paths
+II. analysis constants
+"""
+
+# Define global constants for relative paths from microsoft_movies_directory
+RT_REVIEWS_PATH = "./data/rt.reviews.tsv"
+RT_MOVIE_INFO = "./data/rt.movie_info.tsv"
+BOM_GROSS = "./data/bom.movie_gross.csv"
+IMDB_NAME_BASICS = "./data/imdb.name.basics.csv"
+IMDB_TITLE_AKAS = "./data/imdb.title.akas.csv"
+IMDB_TITLE_BASICS = "./data/imdb.title.basics.csv"
+IMDB_TITLE_CREW = "./data/imdb.title.crew.csv"
+IMDB_TITLE_PRINCIPALS = "./data/imdb.title.principals.csv"
+IMDB_TITLE_RATINGS = "./data/imdb.title.ratings.csv"
+TMDB_MOVIES = "./data/tmdb.movies.csv"
+TN_BUDGETS = "./data/tn.movie_budgets.csv"
+
+TMDB_GENRE_IDS = './data/tmdb_genre_ids.json'
+
+# Every source file, in the order of the constants above
+SOURCE_PATHS = [RT_REVIEWS_PATH, RT_MOVIE_INFO, BOM_GROSS, IMDB_NAME_BASICS, IMDB_TITLE_AKAS, IMDB_TITLE_BASICS,
+                IMDB_TITLE_CREW, IMDB_TITLE_PRINCIPALS, IMDB_TITLE_RATINGS, TMDB_MOVIES, TN_BUDGETS, TMDB_GENRE_IDS]
+
+"""
+II.
+ANALYSIS CONSTANTS:
+"""
+
+# Aggregates merge_rt_data and merge_rt_foci can return
+RT_FOCI = ['genre_popularity', 'rating_popularity', 'combined_popularity']
+
+# Columns the popularity aggregates can be sorted by
+RT_SORT_COLUMNS = ['total_references', 'total_positive', 'percent_positive']
+
+# Order of the ratings in combined_popularity
+RT_RATING_ORDER = ['G', 'PG', 'PG-13', 'R', 'NR']
+
+# Genres and roles kept by merge_imdb_top_crew, determined from other data
+TOP_CREW_GENRES = ['Sci-Fi', 'Action', 'Adventure', 'Fantasy', 'Animation']
+TOP_CREW_ROLES = ['actor', 'actress', 'director', 'writer']
+
+# Columns of merge_imdb_top_crew, in the order of the joined title basics, ratings, principals and name basics files
+TOP_CREW_COLUMNS = ['tconst', 'primary_title', 'original_title', 'start_year', 'runtime_minutes', 'genres',
+                    'averagerating', 'numvotes', 'ordering', 'nconst', 'category', 'job', 'characters', 'primary_name',
+                    'birth_year', 'death_year', 'primary_profession', 'known_for_titles']
+
+# Sort order of merge_imdb_top_crew as column: ascending; the last three columns break ties between equal ratings
+TOP_CREW_ORDER = {'averagerating': False, 'numvotes': False, 'tconst': True, 'genres': True, 'ordering': True}
+
+# Execution backends of the IMDB functions, see tools.backends
+BACKENDS = ('pandas', 'duckdb')
+
+# Dollar columns merge_tn_imdb can average, mapped to the name of their mean in millions
+TN_PROFIT_VALUES = {'net_gain': 'earnings_in_millions', 'domestic_gross': 'domestic_earnings_millions',
+                    'international_gross': 'international_earnings_millions'}
+
+# Columns of tn_imdb_budgets merge_tn_imdb can group by; 'genres' counts each film once per genre
+TN_GROUP_COLUMNS = ['genres', 'movie']
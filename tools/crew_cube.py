@@ -0,0 +1,187 @@
+"""
+This module materializes merge_imdb_top_crew for every genre/role selection as a persisted, pre-sorted result cube.
+
+merge_imdb_top_crew joins four IMDB files and filters them on every call, although its selections come from tiny
+domains (TOP_CREW_GENRES x TOP_CREW_ROLES). CrewCube computes the unselected result once and stores it sorted by
+(genre, role) and then in the TOP_CREW_ORDER of merge_imdb_top_crew, so that every (genre, role) selection is a
+contiguous slice, together with precomputed row orders for the genre-only and unselected lookups. Any lookup, including
+the top k rows of a selection, is then a slice of at most k rows.
+
+The cube is pickled to CUBE_PATH after a header holding the modification time and size of the four IMDB files it was
+built from, the selection domains and a hash of the code of merge_imdb_top_crew, the functions it reaches (such as
+top_crew_query) and CrewCube, see tools.disk_cache.code_stamp. top_crew() reloads it when another process rebuilt it,
+and rebuilds it when any of those files or that code changed; the header is read first, so a cube pickled by other
+code is never unpickled.
+
+CONTENTS
+I. imports and constants
+II. CrewCube class
+III. lookup functions
+"""
+import os
+import pickle
+import threading
+
+import numpy as np
+import pandas as pd
+
+from tools.constants import TOP_CREW_ORDER
+
+# Pickled cube, relative to the microsoft_movies directory like the data path constants
+CUBE_PATH = "./data/.cache/crew_cube.pkl"
+
+# Bump when the layout of the pickled cube changes
+CUBE_VERSION = 2
+
+# Cube used by top_crew, with the lock serializing its (re)builds
+_cube = None
+_cube_lock = threading.Lock()
+
+"""
+II.
+CREWCUBE CLASS:
+"""
+
+
+class CrewCube:
+    """Result of merge_imdb_top_crew() partitioned by ('genres', 'category') with pre-sorted slices"""
+
+    def __init__(self, table, stamp=None):
+        """
+        @param table: unselected merge_imdb_top_crew() result
+        @param stamp: source_stamp() of the files and code the table was built from
+        """
+        # Rank every row once, then lay the rows out by genre and role keeping that rank inside each partition
+        ranked = table.sort_values(list(TOP_CREW_ORDER), ascending=list(TOP_CREW_ORDER.values()), kind='stable')
+        ranked = ranked.reset_index(drop=True)
+        ranked['_rank'] = np.arange(len(ranked))
+        self.table = ranked.sort_values(['genres', 'category', '_rank'], kind='mergesort').reset_index(drop=True)
+        self.stamp = stamp
+
+        # Row positions of the unselected and genre-only lookups, in rank order
+        rank = self.table.pop('_rank').to_numpy()
+        self.orders = {None: np.argsort(rank, kind='stable')}
+        genres = self.table['genres'].to_numpy()
+        for genre in pd.unique(genres):
+            positions = np.flatnonzero(genres == genre)
+            self.orders[genre] = positions[np.argsort(rank[positions], kind='stable')]
+
+        # Start and stop positions of each (genre, role) partition
+        roles = self.table['category'].astype(object).to_numpy()
+        changes = np.flatnonzero(np.r_[True, (genres[1:] != genres[:-1]) | (roles[1:] != roles[:-1])])
+        stops = np.r_[changes[1:], len(self.table)]
+        self.partitions = {(genres[start], roles[start]): (int(start), int(stop))
+                           for start, stop in zip(changes, stops)}
+
+    def lookup(self, select_genre=None, select_role=None, k=None):
+        """
+        Return the rows merge_imdb_top_crew(select_genre, select_role) returns, or the first k of them
+
+        @param select_genre: one of TOP_CREW_GENRES, or None for every genre
+        @param select_role: one of TOP_CREW_ROLES, only applied together with select_genre as in merge_imdb_top_crew
+        @param k: optional number of top rows
+        @return: pd.DataFrame sorted by TOP_CREW_ORDER
+        """
+        if select_genre and select_role:
+            start, stop = self.partitions.get((select_genre, select_role), (0, 0))
+            if k is not None:
+                stop = min(stop, start + k)
+            return self.table.iloc[start:stop].reset_index(drop=True)
+
+        positions = self.orders.get(select_genre or None, np.array([], dtype=np.intp))
+        return self.table.take(positions[:k]).reset_index(drop=True)
+
+    def counts(self):
+        """Return the number of rows of every (genre, role) partition as a DataFrame"""
+        counts = pd.Series({key: stop - start for key, (start, stop) in self.partitions.items()}, dtype='int64')
+        counts.index.names = ['genres', 'category']
+        return counts.unstack(fill_value=0)
+
+    def save(self, path=CUBE_PATH):
+        """Atomically pickle the cube after a header with its CUBE_VERSION and stamp"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump({'version': CUBE_VERSION, 'stamp': self.stamp}, f)
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path=CUBE_PATH, stamp=None):
+        """
+        Return the pickled cube, or None if it is missing, unreadable, or of another CUBE_VERSION or stamp
+
+        @param path: location of the pickled cube
+        @param stamp: expected source_stamp(), or None to accept any
+        """
+        try:
+            with open(path, 'rb') as f:
+                header = pickle.load(f)
+                if not isinstance(header, dict) or header.get('version') != CUBE_VERSION:
+                    return None
+                if stamp is not None and header.get('stamp') != stamp:
+                    return None
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError, AttributeError, ImportError):
+            return None
+
+    @classmethod
+    def build(cls):
+        """Compute the cube from the current IMDB files"""
+        from tools import data_preparation
+
+        stamp = source_stamp()
+        return cls(data_preparation.merge_imdb_top_crew(), stamp)
+
+
+"""
+III.
+LOOKUP FUNCTIONS:
+1. top_crew
+2. get_cube
+3. source_stamp
+"""
+
+
+def top_crew(select_genre=None, select_role=None, k=None, path=CUBE_PATH):
+    """
+    Return merge_imdb_top_crew(select_genre, select_role), or its first k rows, from the persisted cube
+
+    The cube is loaded from path on the first call and rebuilt (and saved) whenever the IMDB files it was built from
+    changed, so results always reflect the files on disk.
+
+    @param select_genre: one of TOP_CREW_GENRES, or None for every genre
+    @param select_role: one of TOP_CREW_ROLES
+    @param k: optional number of top rows
+    @param path: location of the pickled cube
+    @return: pd.DataFrame
+    """
+    return get_cube(path).lookup(select_genre, select_role, k)
+
+
+def get_cube(path=CUBE_PATH):
+    """Return an up-to-date CrewCube, loading or rebuilding it as needed"""
+    global _cube
+    stamp = source_stamp()
+    with _cube_lock:
+        if _cube is None or _cube.stamp != stamp:
+            _cube = CrewCube.load(path, stamp)
+        if _cube is None:
+            _cube = CrewCube.build()
+            _cube.save(path)
+        return _cube
+
+
+def source_stamp():
+    """Return the modification time and size of the four IMDB files, the selection domains and the code of the cube"""
+    # Imported here because data_preparation is only needed when the cube is used
+    from tools import data_preparation
+    from tools.disk_cache import code_stamp
+
+    stamp = []
+    for path in [data_preparation.IMDB_TITLE_BASICS, data_preparation.IMDB_TITLE_RATINGS,
+                 data_preparation.IMDB_TITLE_PRINCIPALS, data_preparation.IMDB_NAME_BASICS]:
+        stat = os.stat(path)
+        stamp.append((os.path.abspath(path), stat.st_mtime_ns, stat.st_size))
+    code = code_stamp(data_preparation.merge_imdb_top_crew, CUBE_VERSION) + code_stamp(CrewCube, CUBE_VERSION)
+    return tuple(stamp), tuple(data_preparation.TOP_CREW_GENRES), tuple(data_preparation.TOP_CREW_ROLES), code
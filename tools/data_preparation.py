@@ -2,123 +2,223 @@
 This module is to be used for data cleaning and preparation.
 
 CONTENTS
-I. imports and path constants
+I. imports and path constants (defined in tools.constants)
 II. merging functions
 III. single file cleaning functions
 IV. miscellaneous helper functions
 """
-import ast
-import json
+import functools
 import string
 import pandas as pd
 
-# Define global constants for relative paths from microsoft_movies_directory
-RT_REVIEWS_PATH = "./data/rt.reviews.tsv"
-RT_MOVIE_INFO = "./data/rt.movie_info.tsv"
-BOM_GROSS = "./data/bom.movie_gross.csv"
-IMDB_NAME_BASICS = "./data/imdb.name.basics.csv"
-IMDB_TITLE_AKAS = "./data/imdb.title.akas.csv"
-IMDB_TITLE_BASICS = "./data/imdb.title.basics.csv"
-IMDB_TITLE_CREW = "./data/imdb.title.crew.csv"
-IMDB_TITLE_PRINCIPALS = "./data/imdb.title.principals.csv"
-IMDB_TITLE_RATINGS = "./data/imdb.title.ratings.csv"
-TMDB_MOVIES = "./data/tmdb.movies.csv"
-TN_BUDGETS = "./data/tn.movie_budgets.csv"
-
-TMDB_GENRE_IDS = './data/tmdb_genre_ids.json'
+from tools.backends import (PUNCTUATION_PATTERN, duckdb_merge_bom_and_imdb, duckdb_merge_imdb_title_and_ratings,
+                            duckdb_merge_imdb_top_crew, read_with_backend, resolve_backend)
+from tools.cache import cached, cache_stats, clear_cache
+from tools.dates import parse_dates, quarantine_report
+from tools.constants import (BOM_GROSS, IMDB_NAME_BASICS, IMDB_TITLE_AKAS, IMDB_TITLE_BASICS, IMDB_TITLE_CREW,
+                             IMDB_TITLE_PRINCIPALS, IMDB_TITLE_RATINGS, RT_FOCI, RT_MOVIE_INFO, RT_RATING_ORDER,
+                             RT_REVIEWS_PATH, RT_SORT_COLUMNS, TMDB_GENRE_IDS, TMDB_MOVIES, TN_BUDGETS,
+                             TN_GROUP_COLUMNS, TN_PROFIT_VALUES, TOP_CREW_COLUMNS, TOP_CREW_GENRES, TOP_CREW_ORDER,
+                             TOP_CREW_ROLES)
+from tools.disk_cache import persisted, clear_disk_cache
+from tools.genres import aggregate_by_genre, genre_bridge
+from tools.incremental import ImdbGenreRatings, RtGenrePopularity
+from tools.instrumentation import instrumented, stage
+from tools.keys import TITLES, decode_ids, encode_columns, encode_ids, encode_titles, title_year_keys
+from tools.query import Query
+from tools.sampling import ImdbGenreRatingsSample, RtGenrePopularitySample
+from tools.schemas import read_source, read_source_filtered, widen_dtypes
+
+# Translation table deleting every punctuation character and space, used by remove_punctuation
+_PUNCTUATION_TABLE = str.maketrans('', '', string.punctuation + ' ')
 
 """
 II.
 MERGING FUNCTIONS:
 These functions merge DataFrames produced by the single file cleaning functions
 1. merge_rt_data
-2. merge_bom_and_imdb
-3. merge_imdb_title_and_ratings
-4. merge_imdb_top_crew
-5. merge_tn_tmdb
+2. merge_rt_foci
+3. merge_bom_and_imdb
+4. merge_imdb_title_and_ratings
+5. merge_imdb_top_crew
+6. stream_imdb_top_crew
+7. tn_imdb_budgets
+8. merge_tn_imdb
+
+The joins and filters of functions 1, 3 and 5 are declared as tools.query.Query objects by the *_query functions below,
+which push filters and projections ahead of the joins. Call .explain() on one of them to see the plan and row counts.
+Genre-level aggregates join only their value columns to a genre bridge table (see tools.genres) instead of exploding
+whole rows.
+
+These joins run on int64 keys: the IMDB cleaning functions called with encode_keys=True parse tconst and nconst into
+integers and dictionary-encode 'cleaned_title', and only the identifiers a function returns are decoded, see
+tools.keys.
+
+The merging functions return int64 and float64 columns where the source schemas read compact int8-int32 and float32
+ones, see tools.schemas.widen_dtypes; columns the schemas read as categories, such as 'rating' of Rotten Tomatoes and
+'category' and 'job' of the IMDB principals, stay categorical.
+
+Functions 3-5 and the IMDB cleaning functions take a backend argument: 'pandas' (the default) or 'duckdb', which runs
+them out of core in DuckDB and returns the same DataFrame, see tools.backends. The TOOLS_BACKEND environment variable
+sets the backend used when none is passed.
 """
 
 
-def merge_rt_data(focus=None, by='total_positive'):
-    """Return inner-joined DataFrame, or a feature-engineered subset of it with the focus parameter"""
-    # Initialize DataFrames
-    reviews_df = clean_rt_reviews()
-    info_df = clean_rt_movie_info()
-
-    # Initialize merged DataFrame
-    rt_df = info_df.merge(reviews_df, on='id')
-
-    # If genre_popularity is passed, then subset with 'genre' and 'fresh' columns, then explode on 'genre'
-    if focus == 'genre_popularity':
-        exploded = rt_df[['genre', 'fresh']].explode('genre')
-
-        # Group by genre and aggregate 'fresh' with 'count', 'sum' and 'mean'
-        grouped = exploded.groupby('genre')['fresh'].aggregate(['count', 'sum', 'mean'])
-
-        # Rename columns: count -> 'total_references', sum -> 'total_positive', mean -> 'percent_positive'
-        grouped.rename(columns={'count': 'total_references',
-                                'sum': 'total_positive',
-                                'mean': 'percent_positive'}, inplace=True)
-
-        # Sort values by quantity of positive reviews
-        rt_df = grouped.sort_values(by=by, ascending=False)
-
-    # Handle similarly for rating popularity
-    elif focus == 'rating_popularity':
-        grouped = rt_df[['rating', 'fresh']].groupby('rating')['fresh'].aggregate(['count', 'sum', 'mean'])
-        grouped.rename(columns={'count': 'total_references',
-                                'sum': 'total_positive',
-                                'mean': 'percent_positive'}, inplace=True)
-
-        rt_df = grouped.sort_values(by=by, ascending=False)
-
-    # Return DataFrame suitable for plotting
-    elif focus == 'combined_popularity':
-        exploded = rt_df[['genre', 'rating', 'fresh']].explode('genre')
-        grouped = exploded.groupby(['genre', 'rating'])['fresh'].aggregate(['count', 'sum', 'mean'])
-        grouped.rename(columns={'count': 'total_references',
-                                'sum': 'total_positive',
-                                'mean': 'percent_positive'}, inplace=True)
-        grouped.reset_index(inplace=True)
-        # To sort ratings in sequential order, the column was made into a Categorical Series
-        grouped['rating'] = pd.Categorical(grouped['rating'], ['G', 'PG', 'PG-13', 'R', 'NR'])
-        rt_df = grouped.sort_values(['genre', 'rating'])
+def rt_query():
+    """Return a Query joining the Rotten Tomatoes movie info and reviews DataFrames on 'id'"""
+    return Query('rt_movie_info', clean_rt_movie_info).join(Query('rt_reviews', clean_rt_reviews), on='id')
+
+
+@instrumented
+def merge_rt_data(focus=None, by='total_positive', incremental=False, approximate=False):
+    """
+    Return inner-joined DataFrame, or a feature-engineered subset of it with the focus parameter
+
+    @param focus: None, 'genre_popularity', 'rating_popularity' or 'combined_popularity'
+    @param by: column to sort the popularity aggregates by
+    @param incremental: with focus='genre_popularity', update persisted genre totals with only the reviews appended
+        since the previous call, see tools.incremental.RtGenrePopularity
+    @param approximate: with focus='genre_popularity', estimate percent_positive with confidence intervals from a
+        persisted sample of each genre's reviews, ranked by the estimate, see tools.sampling.RtGenrePopularitySample;
+        the sample is updated incrementally whatever incremental is, and by must keep its default
+    @return: pd.DataFrame
+    @raise ValueError: if approximate is combined with another focus or a sort column
+    """
+    if approximate:
+        if focus != 'genre_popularity' or by != 'total_positive':
+            raise ValueError(f"approximate=True only supports focus='genre_popularity' ranked by the estimate, "
+                             f"got focus={focus!r} and by={by!r}")
+        return RtGenrePopularitySample().refresh()
+    if incremental and focus == 'genre_popularity':
+        aggregate = RtGenrePopularity()
+        aggregate.refresh()
+        return aggregate.result(by=by)
+
+    # The popularity aggregates are computed from one pass over the reviews, see merge_rt_foci
+    if focus in RT_FOCI:
+        return merge_rt_foci([focus], by)[focus]
+
     # Return unmodified DataFrame if 'focus' parameter is not passed
-    return rt_df
+    return widen_dtypes(rt_query().collect())
 
 
-# Arthur and Mia
-def merge_bom_and_imdb():
-    """Merge the Box Office Mojo and IMDB title ratings and basics DataFrames"""
-    # Initialize DataFrames
-    bom_df = clean_bom_gross()
-    basics_df = clean_imdb_title_basics()
-    ratings_df = clean_imdb_title_ratings()
+@instrumented
+def merge_rt_foci(foci=None, by='total_positive'):
+    """
+    Return several Rotten Tomatoes popularity aggregates computed from a single merge and grouped pass
+
+    The reviews are grouped once per movie into review and fresh review counts, which are joined to the movie ratings
+    and genres. The (genre, rating) aggregate is summed from those movie counts, and genre_popularity is its marginal.
+    rating_popularity is summed from the movie counts directly, since a movie with several genres would otherwise be
+    counted once per genre.
+
+    @param foci: list of 'genre_popularity', 'rating_popularity' and 'combined_popularity', defaults to all three
+    @param by: column or list of columns to sort genre_popularity and rating_popularity by in descending order, or a
+        dict mapping foci to their sort columns; combined_popularity is sorted by genre and rating unless given in
+        the dict
+    @return: dict mapping each focus to the DataFrame merge_rt_data(focus, by) returns
+    """
+    foci = RT_FOCI if foci is None else list(foci)
+    unknown = [focus for focus in foci if focus not in RT_FOCI]
+    if unknown:
+        raise ValueError(f"Unknown foci {unknown}, expected some of {RT_FOCI}")
+    sort_keys = by if isinstance(by, dict) else {'genre_popularity': by, 'rating_popularity': by}
+
+    # Count the reviews and fresh reviews of every movie in one grouped pass
+    reviews_df = clean_rt_reviews()[['id', 'fresh']]
+    with stage('groupby movie', reviews_df) as current:
+        movies = current.output(reviews_df.groupby('id')['fresh'].aggregate(['count', 'sum']))
+    movies.columns = ['total_references', 'total_positive']
+
+    # Join the movie ratings, as integer codes so that unrated movies still count towards their genres
+    ratings = clean_rt_movie_info()[['id', 'rating']]
+    with stage('join rt_movie_info', [movies, ratings]) as current:
+        movies = current.output(pd.merge(ratings, movies, how='inner', left_on='id', right_index=True))
+    movies['rating_code'] = movies['rating'].cat.codes
+    categories = movies['rating'].cat.categories
+
+    totals = {'total_references': ('total_references', 'sum'), 'total_positive': ('total_positive', 'sum')}
+    results = {}
+    if 'genre_popularity' in foci or 'combined_popularity' in foci:
+        combined = aggregate_by_genre(rt_genre_bridge(), movies, on='id', by='rating_code', **totals)
+
+        if 'genre_popularity' in foci:
+            grouped = combined.groupby(level='genre').sum()
+            results['genre_popularity'] = _popularity(grouped, sort_keys.get('genre_popularity'))
+
+        if 'combined_popularity' in foci:
+            # Unrated movies only count towards genre_popularity
+            rated = combined[combined.index.get_level_values('rating_code') >= 0]
+            grouped = rated.reset_index().rename(columns={'rating_code': 'rating'})
+            grouped['rating'] = pd.Categorical(categories[grouped['rating']], RT_RATING_ORDER)
+            grouped['percent_positive'] = grouped['total_positive'] / grouped['total_references']
+            key = sort_keys.get('combined_popularity')
+            results['combined_popularity'] = (grouped.sort_values(['genre', 'rating']) if key is None
+                                              else grouped.sort_values(by=key, ascending=False))
+
+    if 'rating_popularity' in foci:
+        rated = movies[movies['rating_code'] >= 0]
+        grouped = rated.groupby('rating_code').aggregate(**totals)
+        grouped.index = pd.CategoricalIndex(pd.Categorical.from_codes(grouped.index, categories), name='rating')
+        results['rating_popularity'] = _popularity(grouped, sort_keys.get('rating_popularity'))
+
+    return {focus: results[focus] for focus in foci}
+
+
+def _popularity(grouped, by=None):
+    """Add 'percent_positive' to review totals and sort them by the given column(s) in descending order"""
+    grouped['percent_positive'] = grouped['total_positive'] / grouped['total_references']
+    return grouped.sort_values(by='total_positive' if by is None else by, ascending=False)
+
+
+def bom_imdb_query(encode_keys=False):
+    """
+    Return a Query joining IMDB title basics to Box Office Mojo on 'cleaned_title' and to ratings on 'tconst'
+
+    @param encode_keys: join on int64 'tconst' and 'cleaned_title' codes, see tools.keys; 'tconst' stays encoded
+    @return: Query
+    """
+    # Box Office Mojo titles are encoded after the disk cache, as title codes are only valid within the process
+    bom_loader = (lambda: encode_titles(clean_bom_gross())) if encode_keys else clean_bom_gross
 
-    # Perform first merge
-    bom_titles_df = pd.merge(basics_df, bom_df, how='inner', on='cleaned_title')
+    # Genres are not exploded here: merge_bom_and_imdb joins the result to the genre bridge table on 'tconst'
+    return (Query('imdb_title_basics', functools.partial(clean_imdb_title_basics, encode_keys=encode_keys))
+            .join(Query('bom_gross', bom_loader), on='cleaned_title')
+            .join(Query('imdb_title_ratings', functools.partial(clean_imdb_title_ratings, encode_keys=encode_keys)),
+                  on='tconst')
+            .select(['tconst', 'numvotes', 'averagerating', 'domestic_gross', 'foreign_gross']))
 
-    # Explode DataFrame on 'genres' column
-    bom_titles_df['genres'] = bom_titles_df['genres'].str.strip().str.split(',')
-    exploded = bom_titles_df.explode('genres')
 
-    # Merge with ratings DataFrame
-    combined = pd.merge(exploded, ratings_df, how='inner', on='tconst')
+# Arthur and Mia
+@instrumented
+def merge_bom_and_imdb(backend=None):
+    """
+    Merge the Box Office Mojo and IMDB title ratings and basics DataFrames
+
+    @param backend: 'pandas' or 'duckdb', see tools.backends
+    @return: pd.DataFrame
+    """
+    if resolve_backend(backend) == 'duckdb':
+        return widen_dtypes(duckdb_merge_bom_and_imdb(IMDB_TITLE_BASICS, BOM_GROSS, IMDB_TITLE_RATINGS))
+
+    # Merge basics with BOM and ratings and subset the columns of interest
+    combined = bom_imdb_query(encode_keys=True).collect()
 
-    # Subset and add 'avgrating_x_numvotes', 'total_gross' columns
+    # Add 'avgrating_x_numvotes', 'total_gross' columns
     eval_exp1 = '''
     avgrating_x_numvotes = averagerating * numvotes
     total_gross = domestic_gross + foreign_gross
     '''
-    subset = combined[['genres', 'numvotes', 'averagerating', 'domestic_gross', 'foreign_gross']].eval(eval_exp1)
+    subset = combined.eval(eval_exp1)
 
-    # Create columns of interest with named aggregation
-    final_df = subset.groupby('genres').aggregate(numvotes=pd.NamedAgg('numvotes', 'sum'),
-                                                  avgrating_x_numvotes=pd.NamedAgg('avgrating_x_numvotes', 'sum'),
-                                                  avgnumvotes=pd.NamedAgg('numvotes', 'mean'),
-                                                  domestic_gross=pd.NamedAgg('domestic_gross', 'mean'),
-                                                  foreign_gross=pd.NamedAgg('foreign_gross', 'mean'),
-                                                  total_gross=pd.NamedAgg('total_gross', 'mean'))
+    # Create columns of interest per genre with named aggregation
+    final_df = aggregate_by_genre(imdb_genre_bridge(encode_keys=True), subset, on='tconst', name='genres',
+                                  numvotes=pd.NamedAgg('numvotes', 'sum'),
+                                  avgrating_x_numvotes=pd.NamedAgg('avgrating_x_numvotes', 'sum'),
+                                  avgnumvotes=pd.NamedAgg('numvotes', 'mean'),
+                                  domestic_gross=pd.NamedAgg('domestic_gross', 'mean'),
+                                  foreign_gross=pd.NamedAgg('foreign_gross', 'mean'),
+                                  total_gross=pd.NamedAgg('total_gross', 'mean'))
 
     # Add more columns for weighted average rating and scaled gross for plotting
     eval_exp2 = '''
@@ -130,27 +230,41 @@ def merge_bom_and_imdb():
     # Reset the index for easier control over plotting
     final_df.reset_index(inplace=True)
 
-    return final_df
+    return widen_dtypes(final_df)
 
 
 # Arthur
-def merge_imdb_title_and_ratings():
-    """Merge, clean and sort combined IMDB title and ratings DataFrame"""
-    # Initialize DataFrames, exploding and not cleaning the titles of 'basics_df'
-    basics_df = clean_imdb_title_basics(clean_titles=False, explode=True)
-    ratings_df = clean_imdb_title_ratings()
+@instrumented
+def merge_imdb_title_and_ratings(incremental=False, backend=None, approximate=False):
+    """
+    Merge, clean and sort combined IMDB title and ratings DataFrame
+
+    @param incremental: update persisted genre totals with only the titles and ratings appended since the previous
+        call, see tools.incremental.ImdbGenreRatings
+    @param backend: 'pandas' or 'duckdb', see tools.backends; ignored when incremental or approximate
+    @param approximate: estimate wavg_rating with confidence intervals from a persisted sample of each genre's rated
+        titles, ranked by the estimate, see tools.sampling.ImdbGenreRatingsSample
+    @return: pd.DataFrame
+    """
+    if approximate:
+        return ImdbGenreRatingsSample().refresh()
+    if incremental:
+        return ImdbGenreRatings().refresh()
+    if resolve_backend(backend) == 'duckdb':
+        return widen_dtypes(duckdb_merge_imdb_title_and_ratings(IMDB_TITLE_BASICS, IMDB_TITLE_RATINGS))
 
-    # Merge the DataFrames
-    combined = pd.merge(basics_df, ratings_df, how='inner', on='tconst')
+    # Initialize the ratings DataFrame; titles are matched to their genres through the genre bridge table
+    ratings_df = clean_imdb_title_ratings(encode_keys=True)
 
-    # Create column for averagerating * numvotes and aggregate
+    # Create column for averagerating * numvotes and aggregate per genre
     eval_exp1 = '''
     avgrating_x_numvotes = averagerating * numvotes
     '''
-    subset = combined[['genres', 'numvotes', 'averagerating']].eval(eval_exp1)
-    main_df = subset.groupby('genres').aggregate(numvotes=pd.NamedAgg('numvotes', 'sum'),
-                                                 avgrating_x_numvotes=pd.NamedAgg('avgrating_x_numvotes', 'sum'),
-                                                 avgnumvotes=pd.NamedAgg('numvotes', 'mean'))
+    subset = ratings_df.eval(eval_exp1)
+    main_df = aggregate_by_genre(imdb_genre_bridge(encode_keys=True), subset, on='tconst', name='genres',
+                                 numvotes=pd.NamedAgg('numvotes', 'sum'),
+                                 avgrating_x_numvotes=pd.NamedAgg('avgrating_x_numvotes', 'sum'),
+                                 avgnumvotes=pd.NamedAgg('numvotes', 'mean'))
 
     # Create column for weighted average rating
     eval_exp2 = '''
@@ -163,75 +277,200 @@ def merge_imdb_title_and_ratings():
 
     # Reset the index and sort by 'numvotes' in descending order
     main_df.reset_index(inplace=True)
-    main_df.sort_values('numvotes', ascending=False, inplace=True)
+    main_df.sort_values('numvotes', ascending=False, ignore_index=True, inplace=True)
 
-    return main_df
+    return widen_dtypes(main_df)
 
 
-def merge_imdb_top_crew(select_genre=None, select_role=None):
+def top_crew_query(select_genre=None, select_role=None, encode_keys=False):
+    """
+    Return a Query joining IMDB title basics, ratings, principals and name basics with the top crew filters
+
+    @param encode_keys: join on int64 'tconst' and 'nconst', which the result then holds, see tools.keys
+    @return: Query
+    """
+    def loader(func, **kwargs):
+        return functools.partial(func, encode_keys=encode_keys, **kwargs)
+
+    query = (Query('imdb_title_basics', loader(clean_imdb_title_basics, clean_titles=False))
+             .join(Query('imdb_title_ratings', loader(clean_imdb_title_ratings)), on='tconst')
+             .join(Query('imdb_title_principals', loader(clean_imdb_title_principals)), on='tconst')
+             .join(Query('imdb_name_basics', loader(clean_imdb_name_basics)), on='nconst')
+             .explode('genres', sep=',')
+             # Filter genres not in the top four, determined from other data
+             .filter('genres', 'isin', TOP_CREW_GENRES)
+             # Filter by 'start_year' and only include actors, actresses, directors, and writers
+             .filter('start_year', '>', 2014)
+             .filter('category', 'isin', TOP_CREW_ROLES)
+             # Keep rows where the number of votes is higher than the average
+             .filter('numvotes', '>', 100000))
+
+    if select_genre:
+        query.filter('genres', '==', select_genre)
+        if select_role:
+            query.filter('category', '==', select_role)
+
+    return query
+
+
+@instrumented
+def merge_imdb_top_crew(select_genre=None, select_role=None, chunksize=None, backend=None):
     """
     Return a filtered dataframe containing the top choices for cast/producers for movies of a given genre
 
     @param select_genre: {'Drama', 'Action', 'Adventure', 'Comedy'}
     @param select_role: {'actor', 'actress', 'director', 'writer'}
+    @param chunksize: if given, stream the principals and name basics files in chunks of this many rows, see
+        stream_imdb_top_crew
+    @param backend: 'pandas' or 'duckdb', see tools.backends; DuckDB bounds memory without chunksize
+    @return: pd.DataFrame with columns TOP_CREW_COLUMNS, sorted by TOP_CREW_ORDER, even when no row matches
+
+    For repeated lookups, tools.crew_cube.top_crew returns the same rows from a persisted, pre-sorted result cube.
+    """
+    if resolve_backend(backend) == 'duckdb':
+        return _sort_top_crew(duckdb_merge_imdb_top_crew(IMDB_TITLE_BASICS, IMDB_TITLE_RATINGS, IMDB_TITLE_PRINCIPALS,
+                                                         IMDB_NAME_BASICS, TOP_CREW_GENRES, TOP_CREW_ROLES,
+                                                         select_genre, select_role))
+    if chunksize:
+        return stream_imdb_top_crew(select_genre, select_role, chunksize)
+
+    # Combine the four DataFrames by inner merge, with every filter applied before the joins where possible
+    final_df = top_crew_query(select_genre, select_role, encode_keys=True).collect()
+    final_df['tconst'] = decode_ids(final_df['tconst'], 'tt')
+    final_df['nconst'] = decode_ids(final_df['nconst'], 'nm')
+
+    return _sort_top_crew(final_df)
+
+
+@instrumented
+def stream_imdb_top_crew(select_genre=None, select_role=None, chunksize=1_000_000):
+    """
+    Return the same rows as merge_imdb_top_crew with memory bounded for full-size IMDB dumps
+
+    The year, genre, role and vote filters are applied before joining, and the principals and name basics files are
+    read chunksize rows at a time, keeping only rows whose tconst/nconst can still appear in the result.
+
+    @param select_genre: {'Drama', 'Action', 'Adventure', 'Comedy'}
+    @param select_role: {'actor', 'actress', 'director', 'writer'}
+    @param chunksize: number of principals and name basics rows parsed at a time
     @return: pd.DataFrame
     """
-    # Initialize DataFrames, exploding and not cleaning the titles of the title_basics file
+    # Narrow the genre and role domains with the optional selections, as merge_imdb_top_crew does after joining
+    genres = TOP_CREW_GENRES
+    roles = TOP_CREW_ROLES
+    if select_genre:
+        genres = [genre for genre in genres if genre == select_genre]
+        if select_role:
+            roles = [role for role in roles if role == select_role]
+
+    # Filter titles and ratings before joining them
     title_basics_df = clean_imdb_title_basics(clean_titles=False, explode=True)
+    title_basics_df = title_basics_df[title_basics_df['genres'].isin(genres) & (title_basics_df['start_year'] > 2014)]
     ratings_df = clean_imdb_title_ratings()
-    principals_df = clean_imdb_title_principals()
-    name_basics_df = clean_imdb_name_basics()
-
-    # Filter genres not in the top four, determined from other data
-    filtered_title_basics = title_basics_df[(title_basics_df['genres'] == 'Sci-Fi') |
-                                            (title_basics_df['genres'] == 'Action') |
-                                            (title_basics_df['genres'] == 'Adventure') |
-                                            (title_basics_df['genres'] == 'Fantasy') |
-                                            (title_basics_df['genres'] == 'Animation')]
-    # Combine the four DataFrames by inner merge
-    combined = pd.merge(filtered_title_basics, ratings_df, how='inner', on='tconst')
-    combined = pd.merge(combined, principals_df, how='inner', on='tconst')
-    combined = pd.merge(combined, name_basics_df, how='inner', on='nconst')
-
-    # Filter by 'start_year' and only include actors, actresses, directors, and writers
-    combined = combined[combined['start_year'] > 2014]
-    combined = combined[(combined['category'] == 'actor') |
-                        (combined['category'] == 'actress') |
-                        (combined['category'] == 'director') |
-                        (combined['category'] == 'writer')]
-
-    # Keep rows where the number of votes is higher than the average
-    final_df = combined[combined['numvotes'] > 100000]
+    ratings_df = ratings_df[ratings_df['numvotes'] > 100000]
+    with stage('join imdb_title_ratings', [title_basics_df, ratings_df]) as current:
+        combined = current.output(pd.merge(title_basics_df, ratings_df, how='inner', on='tconst'))
 
-    if select_genre:
-        final_df = final_df[final_df['genres'] == select_genre]
-        if select_role:
-            final_df = final_df[final_df['category'] == select_role]
-
-    return final_df.sort_values(['averagerating', 'numvotes'], ascending=(False, False))
-
-
-# Eddie
-# def merge_tn_imdb():
-# """Merge The Numbers and TMDB datasets and return a clean DataFrame"""
-# # Initialize DataFrames
-# imdb_movies_df = clean_imdb_title_basics(explode=True)
-# tmdb_df = clean_tmdb_movies()
-# tn_df = clean_tn_budgets()
-#
-# # Merge DataFrames
-# combined = pd.merge(imdb_movies_df, tn_df, how='inner', left_on='cleaned_title', right_on='movie')
-#
-# simplified = combined[['genres', 'production_budget', 'domestic_gross', 'worldwide_gross']]
-# eval_exp = '''
-# international_gross = worldwide_gross - domestic_gross
-# net_gain = worldwide_gross - production_budget
-# '''
-# simplified.eval(eval_exp, inplace=True)
-# final_df = simplified.groupby('genres').mean() / 10 ** 6
-# final_df.sort_values('net_gain', ascending=False, inplace=True)
-# return final_df
-# return eddies_function()
+    # Semi-join each principals chunk against the remaining titles, then each name basics chunk against their people
+    principals_df = read_source_filtered(IMDB_TITLE_PRINCIPALS, chunksize, tconst=combined['tconst'], category=roles)
+    with stage('join imdb_title_principals', [combined, principals_df]) as current:
+        combined = current.output(pd.merge(combined, principals_df, how='inner', on='tconst'))
+    name_basics_df = read_source_filtered(IMDB_NAME_BASICS, chunksize, nconst=combined['nconst'])
+    with stage('join imdb_name_basics', [combined, name_basics_df]) as current:
+        combined = current.output(pd.merge(combined, name_basics_df, how='inner', on='nconst'))
+
+    return _sort_top_crew(combined)
+
+
+def _sort_top_crew(df):
+    """Return top crew rows with the columns TOP_CREW_COLUMNS, sorted by TOP_CREW_ORDER with a stable sort"""
+    # Merging empty frames can reorder columns, so the column order is restored on every path
+    df = df.reindex(columns=TOP_CREW_COLUMNS)
+    return widen_dtypes(df.sort_values(list(TOP_CREW_ORDER), ascending=list(TOP_CREW_ORDER.values()), kind='stable',
+                                       ignore_index=True))
+
+
+@instrumented
+def tn_imdb_budgets(chunksize=1_000_000):
+    """
+    Return one row per distinct The Numbers film and IMDB genres combination, with its profit columns in dollars
+
+    A film is a row of The Numbers budgets whose normalized title is also a TMDB title, and whose title and TMDB release
+    year match an IMDB title that has at least one alias in the IMDB title akas file. The akas only decide which IMDB
+    titles match, so only the aliases of the candidate titles are read, as their identifiers, instead of joining every
+    regional alias to the title basics. The profit columns are computed once the rows are de-duplicated.
+
+    @param chunksize: number of IMDB title akas rows parsed at a time
+    @return: pd.DataFrame with columns ['movie', 'genres', 'production_budget', 'domestic_gross', 'worldwide_gross',
+        'international_gross', 'net_gain']
+    """
+    tn_df = clean_tn_budgets()
+    tn_df = tn_df[['movie', 'production_budget', 'domestic_gross', 'worldwide_gross']].assign(
+        cleaned_title=TITLES.encode(remove_punctuation_series(tn_df['movie'])))
+
+    # Key every distinct TMDB title by its title code and release year, and give each budget the keys of its title
+    tmdb_df = clean_tmdb_movies()[['title', 'release_date']].drop_duplicates()
+    codes = TITLES.encode(remove_punctuation_series(tmdb_df['title']))
+    years = tmdb_df['release_date'].astype(str).str[:4]
+    tmdb_keys = pd.DataFrame({'cleaned_title': codes, 'name_year': title_year_keys(codes, years)}).drop_duplicates()
+    with stage('join tmdb_movies', [tn_df, tmdb_keys]) as current:
+        tn_df = current.output(pd.merge(tn_df, tmdb_keys, how='inner', on='cleaned_title'))
+
+    # Keep the IMDB titles whose title and start year match a film, then those with an alias
+    basics_df = clean_imdb_title_basics(encode_keys=True)
+    basics_df = basics_df[['tconst', 'genres']].assign(
+        name_year=title_year_keys(basics_df['cleaned_title'], basics_df['start_year']))
+    basics_df = basics_df[basics_df['name_year'].isin(tn_df['name_year'])]
+    akas_df = read_source_filtered(IMDB_TITLE_AKAS, chunksize, usecols=['title_id'],
+                                   title_id=decode_ids(basics_df['tconst'], 'tt'))
+    basics_df = basics_df[basics_df['tconst'].isin(encode_ids(akas_df['title_id'], 'tt'))]
+
+    with stage('join imdb_title_basics', [tn_df, basics_df]) as current:
+        budget_df = current.output(pd.merge(tn_df, basics_df[['name_year', 'genres']], how='inner', on='name_year'))
+
+    # A film matching several TMDB or IMDB titles is kept once per distinct genres
+    columns = ['movie', 'genres', 'production_budget', 'domestic_gross', 'worldwide_gross']
+    budget_df = budget_df[columns].drop_duplicates().reset_index(drop=True)
+    budget_df['international_gross'] = budget_df['worldwide_gross'] - budget_df['domestic_gross']
+    budget_df['net_gain'] = budget_df['worldwide_gross'] - budget_df['production_budget']
+
+    return budget_df
+
+
+@instrumented
+def merge_tn_imdb(top_n=10, group_by='genres', value='net_gain', chunksize=1_000_000):
+    """
+    Return the groups of tn_imdb_budgets films with the highest mean of a dollar column, in millions
+
+    @param top_n: number of groups returned, or None for every group
+    @param group_by: column or list of columns of TN_GROUP_COLUMNS; 'genres' counts each film once per genre
+    @param value: column averaged, one of TN_PROFIT_VALUES
+    @param chunksize: number of IMDB title akas rows parsed at a time
+    @return: pd.DataFrame with the group_by columns and the mean named after value in TN_PROFIT_VALUES, e.g.
+        'earnings_in_millions' for 'net_gain', sorted in descending order of the mean
+    """
+    group_by = [group_by] if isinstance(group_by, str) else list(group_by)
+    if not group_by or not set(group_by) <= set(TN_GROUP_COLUMNS) or value not in TN_PROFIT_VALUES:
+        raise ValueError(f"Cannot group by {group_by} and average {value!r}: group_by must be taken from "
+                         f"{TN_GROUP_COLUMNS} and value from {list(TN_PROFIT_VALUES)}")
+
+    budget_df = tn_imdb_budgets(chunksize).rename_axis('film').reset_index()
+    name = TN_PROFIT_VALUES[value]
+    budget_df[name] = budget_df[value] / 10 ** 6
+
+    # Genres are split through a bridge table rather than by exploding the film rows, see tools.genres
+    others = [column for column in group_by if column != 'genres']
+    if 'genres' in group_by:
+        bridge = genre_bridge(budget_df, 'film', 'genres', sep=',')
+        means = aggregate_by_genre(bridge, budget_df[['film', name] + others], on='film', by=others or None,
+                                   name='genres', **{name: (name, 'mean')})
+    else:
+        means = budget_df.groupby(others)[[name]].mean()
+
+    means = means.sort_values(name, ascending=False)
+    if top_n is not None:
+        means = means.head(top_n)
+    return means.reset_index()[group_by + [name]]
 
 
 """
@@ -252,20 +491,39 @@ These functions each clean one of the provided csv files, and one obtains genre
 10. clean_imdb_title_principals
 11. clean_imdb_title_ratings
 12. clean_imdb_title_basics
+13. imdb_genre_bridge
+14. rt_genre_bridge
+
+Each cleaning function is wrapped with tools.cache.cached, so repeated calls with the same arguments return a copy of
+the DataFrame parsed on the first call until the source file changes. Use cache_stats() to inspect hits and misses.
+Functions 1-5 are also wrapped with tools.disk_cache.persisted, which stores their output as Feather files in
+./data/.cache so later processes skip the parsing; clear_disk_cache() removes them.
+
+Date columns are parsed by tools.dates.parse_dates with the formats detected for their source file, and values that
+no format parses are reported by quarantine_report() instead of raising.
+
+Every cleaning and merging function, and the inner steps such as date parsing and joins, is also recorded as a stage by
+tools.instrumentation once instrumentation.enable() is called. Calls answered by the in-memory cache are not recorded.
 """
 
 
+@cached
+@instrumented
+@persisted
 def clean_rt_reviews(path=RT_REVIEWS_PATH, na_action=None):
     """Drop duplicate reviews, drop 'rating', 'publisher', and 'critic' columns, and cast to useful data types"""
     # Initialize pd.DataFrame object
-    reviews_df = pd.read_csv(path, delimiter='\t', encoding='latin-1')
+    reviews_df = read_source(path)
 
     # Drop duplicates and unnecessary columns
-    reviews_df.drop_duplicates(inplace=True)
+    with stage('drop_duplicates', reviews_df) as current:
+        reviews_df.drop_duplicates(inplace=True)
+        current.output(reviews_df)
     reviews_df.drop(['rating', 'publisher', 'critic'], axis=1, inplace=True)
 
     # Cast dates as pd.datetime objects
-    reviews_df['date'] = pd.to_datetime(reviews_df['date'])
+    with stage('to_datetime', reviews_df['date']) as current:
+        reviews_df['date'] = current.output(parse_dates(reviews_df['date'], path))
 
     # Change 'fresh' column to 1 if fresh, 0 if rotten
     reviews_df['fresh'] = reviews_df['fresh'].map({'rotten': 0, 'fresh': 1})
@@ -282,28 +540,32 @@ def clean_rt_reviews(path=RT_REVIEWS_PATH, na_action=None):
     return reviews_df
 
 
+@cached
+@instrumented
+@persisted
 def clean_rt_movie_info(path=RT_MOVIE_INFO, dropna=False, subset=None):
     """Clean Rotten Tomatoes movie info dataset"""
     # Initialize info_df DataFrame object
-    info_df = pd.read_csv(path, delimiter='\t')
+    info_df = read_source(path)
 
     # Drop duplicates if they exist
     if info_df.duplicated().sum():
         info_df.drop_duplicates(inplace=True)
 
-    # Drop unnecessary columns
-    info_df.drop(['director', 'writer', 'currency', 'box_office', 'studio'], axis=1, inplace=True)
+    # Drop unnecessary columns, if the schema did not already skip them
+    info_df.drop(['director', 'writer', 'currency', 'box_office', 'studio'], axis=1, inplace=True, errors='ignore')
 
     # Fill NaN 'genre' values and create tuples of genre categories for each movie
     info_df['genre'].fillna('Not listed', inplace=True)
     info_df['genre'] = info_df['genre'].map(lambda x: tuple(x.split('|')))
 
-    # Change date strings to pd.datetime objects
-    date_cols = ['theater_date', 'dvd_date']
-    info_df[date_cols] = info_df[date_cols].apply(pd.to_datetime, axis=1)
+    # Change date strings to pd.datetime objects, one vectorized parse per column
+    for col in ['theater_date', 'dvd_date']:
+        with stage('to_datetime', info_df[col]) as current:
+            info_df[col] = current.output(parse_dates(info_df[col], path))
 
     # Format 'runtime' column and cast as integer
-    info_df['runtime'] = info_df['runtime'].map(minutes_to_num, na_action='ignore')
+    info_df['runtime'] = minutes_to_num_series(info_df['runtime'])
 
     # Drop rows with NaN values in subset columns. If not specified, then all columns considered
     if dropna:
@@ -312,101 +574,155 @@ def clean_rt_movie_info(path=RT_MOVIE_INFO, dropna=False, subset=None):
     return info_df
 
 
-def clean_tn_budgets():
+@cached
+@instrumented
+@persisted
+def clean_tn_budgets(path=TN_BUDGETS):
     """Return a clean DataFrame from The Numbers information on budget"""
     # Initialize DataFrame
-    tn_df = pd.read_csv(TN_BUDGETS)
+    tn_df = read_source(path)
 
     # Cast date strings as pd.datetime objects
-    tn_df['release_date'] = pd.to_datetime(tn_df['release_date'])
+    with stage('to_datetime', tn_df['release_date']) as current:
+        tn_df['release_date'] = current.output(parse_dates(tn_df['release_date'], path))
 
     # Cast dollar amount strings as integer amounts
     dollar_cols = ['production_budget', 'domestic_gross', 'worldwide_gross']
     for col in dollar_cols:
-        tn_df[col] = tn_df[col].map(dollars_to_num)
+        tn_df[col] = dollars_to_num_series(tn_df[col])
 
     return tn_df
 
 
-def clean_bom_gross():
+@cached
+@instrumented
+@persisted
+def clean_bom_gross(path=BOM_GROSS):
     """Return a clean DataFrame from Box Office Mojo dataset"""
     # Initialize DataFrame
-    bom_df = pd.read_csv(BOM_GROSS)
+    bom_df = read_source(path)
 
     # Cast foreign_gross column as integers
-    bom_df['foreign_gross'] = (bom_df['foreign_gross'].map(dollars_to_num, na_action='ignore'))
+    bom_df['foreign_gross'] = dollars_to_num_series(bom_df['foreign_gross'])
 
     # Fill NaN values
     bom_df['foreign_gross'].fillna(0, inplace=True)
     bom_df['domestic_gross'].fillna(0, inplace=True)
 
     # Remove punctuation and spaces from title names and make new column, 'cleaned_title'
-    bom_df['cleaned_title'] = bom_df['title'].map(remove_punctuation)
+    bom_df['cleaned_title'] = remove_punctuation_series(bom_df['title'])
 
     return bom_df
 
 
-def tmdb_genre_dict():
-    with open(TMDB_GENRE_IDS) as f:
+def tmdb_genre_dict(path=TMDB_GENRE_IDS):
+    # Imported here because only the TMDB functions parse JSON, and the module should import quickly
+    import json
+
+    with open(path) as f:
         return {int(i): genre for i, genre in json.load(f).items()}
 
 
-def clean_tmdb_movies():
-    tmdb_movies_df = pd.read_csv(TMDB_MOVIES)
-    tmdb_movies_df.drop('Unnamed: 0', axis=1, inplace=True)
-    tmdb_movies_df['genre_ids'] = tmdb_movies_df['genre_ids'].map(ast.literal_eval)
+@cached
+@instrumented
+@persisted
+def clean_tmdb_movies(path=TMDB_MOVIES, genre_ids_path=TMDB_GENRE_IDS):
+    # Imported here because only this function parses literals, and the module should import quickly
+    import ast
+
+    tmdb_movies_df = read_source(path)
+    tmdb_movies_df.drop('Unnamed: 0', axis=1, inplace=True, errors='ignore')
+    with stage('literal_eval', tmdb_movies_df['genre_ids']) as current:
+        tmdb_movies_df['genre_ids'] = current.output(tmdb_movies_df['genre_ids'].map(ast.literal_eval))
 
-    genre_dict = tmdb_genre_dict()
-    exploded = tmdb_movies_df.explode('genre_ids')
+    genre_dict = tmdb_genre_dict(genre_ids_path)
+    with stage('explode', tmdb_movies_df) as current:
+        exploded = current.output(tmdb_movies_df.explode('genre_ids'))
     exploded['genre_ids'] = exploded['genre_ids'].map(genre_dict)
 
     return exploded
 
 
-def clean_imdb_name_basics():
-    """Read DataFrame from IMDB name basics file: already clean"""
-    return pd.read_csv(IMDB_NAME_BASICS)
+@cached
+@instrumented
+def clean_imdb_name_basics(path=IMDB_NAME_BASICS, backend=None, encode_keys=False):
+    """Read DataFrame from IMDB name basics file: already clean, with int64 identifiers if encode_keys"""
+    df = read_with_backend(path, backend)
+    return encode_columns(df) if encode_keys else df
 
 
-def clean_imdb_title_akas():
+@cached
+@instrumented
+def clean_imdb_title_akas(path=IMDB_TITLE_AKAS, backend=None):
     """Read DataFrame from IMDB title akas file: already clean"""
-    return pd.read_csv(IMDB_TITLE_AKAS)
+    return read_with_backend(path, backend)
 
 
-def clean_imdb_title_crew():
+@cached
+@instrumented
+def clean_imdb_title_crew(path=IMDB_TITLE_CREW, backend=None):
     """Read DataFrame from IMDB title crew file: already clean"""
-    return pd.read_csv(IMDB_TITLE_CREW)
+    return read_with_backend(path, backend)
 
 
-def clean_imdb_title_principals():
-    """Read DataFrame from IMDB title principles file: already clean"""
-    return pd.read_csv(IMDB_TITLE_PRINCIPALS)
+@cached
+@instrumented
+def clean_imdb_title_principals(path=IMDB_TITLE_PRINCIPALS, backend=None, encode_keys=False):
+    """Read DataFrame from IMDB title principles file: already clean, with int64 identifiers if encode_keys"""
+    df = read_with_backend(path, backend)
+    return encode_columns(df) if encode_keys else df
 
 
-def clean_imdb_title_ratings():
-    """Read DataFrame from IMDB title ratings file: already clean"""
-    return pd.read_csv(IMDB_TITLE_RATINGS)
+@cached
+@instrumented
+def clean_imdb_title_ratings(path=IMDB_TITLE_RATINGS, backend=None, encode_keys=False):
+    """Read DataFrame from IMDB title ratings file: already clean, with int64 identifiers if encode_keys"""
+    df = read_with_backend(path, backend)
+    return encode_columns(df) if encode_keys else df
 
 
-def clean_imdb_title_basics(clean_titles=True, explode=False):
-    """ Return cleaned IMDB title basics DataFrame"""
+@cached
+@instrumented
+def clean_imdb_title_basics(clean_titles=True, explode=False, path=IMDB_TITLE_BASICS, backend=None,
+                            encode_keys=False):
+    """ Return cleaned IMDB title basics DataFrame, with int64 'tconst' and 'cleaned_title' codes if encode_keys"""
     # Initialize DataFrame
-    title_basics_df = pd.read_csv(IMDB_TITLE_BASICS)
+    title_basics_df = read_with_backend(path, backend)
 
     # Drop rows without genres
     title_basics_df.dropna(subset=['genres'], inplace=True)
 
     # Remove punctuation and spaces from title names and make new column, 'cleaned_title', if specified
     if clean_titles:
-        title_basics_df['cleaned_title'] = title_basics_df['primary_title'].map(remove_punctuation)
+        title_basics_df['cleaned_title'] = remove_punctuation_series(title_basics_df['primary_title'])
+    if encode_keys:
+        encode_columns(title_basics_df)
+        if clean_titles:
+            encode_titles(title_basics_df)
     # Explode DataFrame on 'genres' column if specified
     if explode:
-        title_basics_df['genres'] = title_basics_df['genres'].str.strip().str.split(',')
-        title_basics_df = title_basics_df.explode('genres')
+        with stage('explode', title_basics_df) as current:
+            title_basics_df['genres'] = title_basics_df['genres'].str.strip().str.split(',')
+            title_basics_df = current.output(title_basics_df.explode('genres'))
 
     return title_basics_df
 
 
+@cached
+@instrumented
+def imdb_genre_bridge(path=IMDB_TITLE_BASICS, encode_keys=False):
+    """Return the (tconst, genre) bridge table of the IMDB title basics file, with int64 'tconst' if encode_keys"""
+    title_basics_df = clean_imdb_title_basics(clean_titles=False, path=path, encode_keys=encode_keys)
+    return genre_bridge(title_basics_df, 'tconst', 'genres', sep=',')
+
+
+@cached
+@instrumented
+def rt_genre_bridge(path=RT_MOVIE_INFO):
+    """Return the (id, genre) bridge table of the Rotten Tomatoes movie info file"""
+    return genre_bridge(clean_rt_movie_info(path), 'id', 'genre')
+
+
 """
 MISCELLANEOUS HELPER FUNCTIONS:
 
@@ -416,6 +732,12 @@ These were used for formatting and other general purposes in EDA.
 3. minutes_to_num
 4. dollars_to_num
 5. remove_punctuation
+6. minutes_to_num_series
+7. dollars_to_num_series
+8. remove_punctuation_series
+
+Functions 6-8 are whole-column equivalents of 3-5, used by the cleaning functions in place of Series.map. Missing and
+non-string values become NaN, as they do when the scalar versions are mapped with na_action='ignore'.
 """
 
 
@@ -447,6 +769,24 @@ def dollars_to_num(val):
 
 def remove_punctuation(text):
     """Remove punctuation from a string and make lowercase"""
-    for char in string.punctuation:
-        text = text.replace(char, '')
-    return text.strip().lower().replace(' ', '')
+    return text.translate(_PUNCTUATION_TABLE).strip().lower()
+
+
+@instrumented
+def minutes_to_num_series(series):
+    """Cast a Series of runtime minutes strings as numeric values"""
+    stripped = series.astype(object).str.replace('minutes', '', regex=False).str.strip()
+    return pd.to_numeric(stripped)
+
+
+@instrumented
+def dollars_to_num_series(series):
+    """Cast a Series of formatted dollar amount strings as numeric values"""
+    stripped = series.astype(object).str.replace(r'[$,]', '', regex=True)
+    return pd.to_numeric(stripped)
+
+
+@instrumented
+def remove_punctuation_series(series):
+    """Remove punctuation from a Series of strings and make lowercase, as remove_punctuation does per string"""
+    return series.str.replace(PUNCTUATION_PATTERN, '', regex=True).str.strip().str.lower()
@@ -0,0 +1,208 @@
+"""
+This module parses the date columns of the source files with formats detected once per source column.
+
+Calling pd.to_datetime without a format makes pandas infer the format of every distinct string with dateutil, and
+applying it row by row, as clean_rt_movie_info did, adds a Python call per row on top. parse_dates instead looks up
+the strptime formats of a column by its source file and column name, e.g. 'rt.reviews.tsv:date' -> ['%B %d, %Y'], and
+parses the whole column with one vectorized pd.to_datetime call per format. Formats are detected from a sample of the
+column's distinct values the first time it is parsed, and kept in FORMATS_PATH so later processes skip the detection.
+
+Values that none of the formats parse become NaT, and are recorded with their row in a quarantine file per source
+column in QUARANTINE_DIR, e.g. 'rt.reviews.tsv@date.csv'; quarantine_report() collects them. A value in a format the
+cache does not know yet triggers a new detection on the unparsed values, whose formats are added to the cache.
+benchmarks.bench_dates compares this stage with the previous pd.to_datetime calls.
+
+CONTENTS
+I. imports and constants
+II. parsing functions
+III. format cache and quarantine functions
+"""
+import json
+import os
+import threading
+
+import pandas as pd
+
+from tools.disk_cache import CACHE_DIR
+
+# Candidate strptime formats, in order of preference when several parse the same values
+DATE_FORMATS = ['%Y-%m-%d', '%b %d, %Y', '%B %d, %Y', '%m/%d/%Y', '%d/%m/%Y', '%Y/%m/%d', '%d %b %Y', '%d %B %Y',
+                '%Y-%m-%d %H:%M:%S', '%Y']
+
+# Number of distinct values of a column that format detection tries the candidate formats on
+SAMPLE_VALUES = 1000
+
+# Detected formats per source column, and quarantined values, relative to the microsoft_movies directory
+FORMATS_PATH = os.path.join(CACHE_DIR, "date_formats.json")
+QUARANTINE_DIR = os.path.join(CACHE_DIR, "quarantine")
+
+# Formats loaded from FORMATS_PATH or detected in this process, keyed like 'rt.reviews.tsv:date'
+_formats = None
+
+# Guards _formats, as the cleaning functions parse dates from several threads when loaded by tools.parallel
+_formats_lock = threading.Lock()
+
+"""
+II.
+PARSING FUNCTIONS:
+1. parse_dates
+2. detect_formats
+"""
+
+
+def parse_dates(series, path):
+    """
+    Parse a date column of a source file with the formats detected for it, quarantining the values none parse
+
+    @param series: pd.Series of date strings, named after its column in the source file
+    @param path: path of the source file the column was read from
+    @return: pd.Series of datetime64[ns] with the index of series, NaT for missing and quarantined values
+    """
+    key = f"{os.path.basename(path)}:{series.name}"
+    formats = get_formats().get(key, [])
+    parsed = _parse(series, formats)
+
+    # Detect formats for values the cached ones do not parse, e.g. on the first parse of the column
+    failed = series.notna() & parsed.isna()
+    if failed.any():
+        new_formats = detect_formats(series[failed], exclude=formats)
+        if new_formats:
+            parsed[failed] = _parse(series[failed], new_formats)
+            failed &= parsed.isna()
+            _save_formats(key, formats + new_formats)
+
+    _save_quarantine(key, series[failed])
+    return parsed
+
+
+def detect_formats(series, candidates=DATE_FORMATS, exclude=()):
+    """
+    Return the formats that parse a sample of a column's distinct values, each chosen greedily for the most values
+
+    @param series: pd.Series of date strings
+    @param candidates: strptime formats to try
+    @param exclude: formats not to return, e.g. those already known to the cache
+    @return: list of formats, possibly empty
+    """
+    uniques = pd.unique(series.dropna().astype(str))
+    # Spread the sample over the column, as files are often ordered by date
+    remaining = pd.Series(uniques[::max(1, len(uniques) // SAMPLE_VALUES)])
+
+    formats = []
+    candidates = [fmt for fmt in candidates if fmt not in exclude]
+    while len(remaining) and candidates:
+        parsed = {fmt: pd.to_datetime(remaining, format=fmt, errors='coerce').notna() for fmt in candidates}
+        best = max(candidates, key=lambda fmt: parsed[fmt].sum())
+        if not parsed[best].any():
+            break
+        formats.append(best)
+        candidates.remove(best)
+        remaining = remaining[~parsed[best]]
+    return formats
+
+
+def _parse(series, formats):
+    """Parse a Series with each format in turn, the later ones only on the values the earlier ones left as NaT"""
+    parsed = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    for fmt in formats:
+        remaining = series.notna() & parsed.isna()
+        if not remaining.any():
+            break
+        # The first format usually parses every value, so it is applied without selecting the rows
+        values = series if remaining.all() else series[remaining]
+        parsed[remaining] = pd.to_datetime(values, format=fmt, errors='coerce')
+    return parsed
+
+
+"""
+III.
+FORMAT CACHE AND QUARANTINE FUNCTIONS:
+1. get_formats
+2. clear_formats
+3. quarantine_report
+"""
+
+
+def get_formats():
+    """Return a copy of the cached formats per source column, e.g. {'rt.reviews.tsv:date': ['%B %d, %Y']}"""
+    with _formats_lock:
+        return dict(_load_formats())
+
+
+def clear_formats():
+    """Forget the cached formats, so that every column is detected again on its next parse"""
+    global _formats
+    with _formats_lock:
+        _formats = {}
+        if os.path.exists(FORMATS_PATH):
+            os.remove(FORMATS_PATH)
+
+
+def quarantine_report():
+    """
+    Return every quarantined date value, from the last parse of each source column
+
+    @return: pd.DataFrame with columns ['source', 'column', 'row', 'value'], 'row' being the index label of the value
+        in the DataFrame read from the source, i.e. its 0-based data row
+    """
+    reports = []
+    if os.path.isdir(QUARANTINE_DIR):
+        for name in sorted(os.listdir(QUARANTINE_DIR)):
+            if name.endswith('.csv'):
+                source, column = name[:-len('.csv')].rsplit('@', 1)
+                report = pd.read_csv(os.path.join(QUARANTINE_DIR, name), dtype={'value': object})
+                reports.append(report.assign(source=source, column=column))
+    columns = ['source', 'column', 'row', 'value']
+    if not reports:
+        return pd.DataFrame({column: pd.Series(dtype=object) for column in columns})
+    return pd.concat(reports, ignore_index=True)[columns]
+
+
+def _load_formats():
+    """Return _formats, loading it from FORMATS_PATH first if needed; the caller holds _formats_lock"""
+    global _formats
+    if _formats is None:
+        try:
+            with open(FORMATS_PATH) as f:
+                _formats = json.load(f)
+        except (OSError, ValueError):
+            _formats = {}
+    return _formats
+
+
+def _save_formats(key, formats):
+    """Cache the formats of a source column, in memory and atomically in FORMATS_PATH"""
+    with _formats_lock:
+        cache = _load_formats()
+        cache[key] = formats
+        snapshot = dict(cache)
+        try:
+            os.makedirs(os.path.dirname(FORMATS_PATH), exist_ok=True)
+            temp_path = _temp_path(FORMATS_PATH)
+            with open(temp_path, 'w') as f:
+                json.dump(snapshot, f, indent=1, sort_keys=True)
+            os.replace(temp_path, FORMATS_PATH)
+        except OSError:
+            # The formats stay cached in memory, and are detected again by the next process
+            pass
+
+
+def _save_quarantine(key, values):
+    """Replace the quarantine file of a source column with its unparsed values, or remove it if there are none"""
+    path = os.path.join(QUARANTINE_DIR, f"{key.replace(':', '@')}.csv")
+    try:
+        if values.empty:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        os.makedirs(QUARANTINE_DIR, exist_ok=True)
+        temp_path = _temp_path(path)
+        pd.DataFrame({'row': values.index, 'value': values.to_numpy()}).to_csv(temp_path, index=False)
+        os.replace(temp_path, path)
+    except OSError:
+        pass
+
+
+def _temp_path(path):
+    """Return a temporary path next to path that no other process or thread writes to"""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
@@ -0,0 +1,304 @@
+"""
+This module persists the DataFrames returned by the cleaning functions to an on-disk columnar cache.
+
+Cleaning the Rotten Tomatoes, The Numbers, Box Office Mojo and TMDB files repeats the same latin-1 decoding, date
+parsing, dollar string conversion and literal_eval work on every process start. Wrapping a cleaning function with the
+persisted decorator writes its result to an uncompressed Feather file in CACHE_DIR, keyed by a content hash of the
+source files and a stamp of the cleaning code, and later runs load it back memory-mapped. The code stamp covers the
+cleaning function and every function and constant of the tools package it reaches, such as the dollar parsers, the read
+schemas of tools.schemas and the date parsing of tools.dates, so a change to any of them rebuilds the tables.
+
+Feather support requires pyarrow. Without it, persisted functions simply run the wrapped cleaning function.
+
+CONTENTS
+I. imports and constants
+II. decorator
+III. helper functions
+"""
+import functools
+import hashlib
+import inspect
+import json
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+    feather = None
+
+# Directory for cached tables, relative to the microsoft_movies directory like the data path constants
+CACHE_DIR = "./data/.cache"
+
+# Set to False to bypass the on-disk cache entirely
+DISK_CACHE_ENABLED = pa is not None
+
+# Bump to invalidate every cached table after a change the code stamps cannot see, e.g. of the Feather layout
+CACHE_VERSION = 1
+
+# Package whose functions and constants are part of the code stamps, except the modules that do not shape results
+_STAMPED_PACKAGE = 'tools'
+_UNSTAMPED_MODULES = ('tools.instrumentation',)
+
+# Types of the constants and default arguments hashed by their value
+_PLAIN_TYPES = (str, bytes, int, float, bool, tuple, list, dict, type(None))
+
+# Metadata key recording which list columns held tuples or lists before conversion to Arrow
+_SEQUENCE_COLUMNS_KEY = b'tools.sequence_columns'
+
+# Content hashes of source files, memoized on (path, mtime, size) so each file is hashed once per process
+_file_hashes = {}
+
+# Function sources and constants reachable from each persisted function, collected on its first call
+_code_references = {}
+
+"""
+II.
+DECORATOR:
+1. persisted
+"""
+
+
+def persisted(func=None, version=1, cache_dir=None):
+    """
+    Cache the DataFrame returned by a cleaning function as a Feather file
+
+    The cache key combines the SHA-256 of every source file argument (any argument whose name ends in 'path'), the
+    remaining arguments, CACHE_VERSION, the version number and a hash of the source of the function and of the
+    functions and upper-case constants of the tools package it reaches, see code_stamp. Editing either the raw data,
+    the cleaning code or a helper it calls therefore invalidates stale tables automatically.
+
+    @param func: cleaning function to decorate
+    @param version: integer to bump when something outside the tools package changes the function's result
+    @param cache_dir: directory for Feather files, defaults to CACHE_DIR
+    @return: decorated function
+    """
+    if func is None:
+        return functools.partial(persisted, version=version, cache_dir=cache_dir)
+
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not DISK_CACHE_ENABLED or feather is None:
+            return func(*args, **kwargs)
+
+        directory = CACHE_DIR if cache_dir is None else cache_dir
+        try:
+            prefix, content_stamp = _make_key(func, signature, args, kwargs)
+        except OSError:
+            # Let the cleaning function raise its own error for missing files
+            return func(*args, **kwargs)
+        stamp = code_stamp(func, version)
+        cache_path = os.path.join(directory, f"{prefix}-{_hash_text(stamp + content_stamp)[:16]}.feather")
+
+        if os.path.exists(cache_path):
+            try:
+                return read_table(cache_path)
+            except (OSError, pa.ArrowException):
+                # Corrupt or truncated cache file: rebuild it below
+                pass
+
+        df = func(*args, **kwargs)
+        try:
+            write_table(df, cache_path)
+            _remove_stale(directory, prefix, cache_path)
+        except (OSError, pa.ArrowException, TypeError, ValueError):
+            # Tables that cannot be represented in Arrow, or an unwritable directory, are simply not persisted
+            pass
+        return df
+
+    return wrapper
+
+
+"""
+III.
+HELPER FUNCTIONS:
+1. to_arrow
+2. from_arrow
+3. write_table
+4. read_table
+5. clear_disk_cache
+6. code_stamp
+"""
+
+
+def to_arrow(df):
+    """Convert a DataFrame, including its index, to an Arrow table that from_arrow can convert back exactly"""
+    table = pa.Table.from_pandas(df, preserve_index=True)
+
+    # Record the Python sequence type of list columns so they can be restored as tuples or lists
+    sequence_columns = {}
+    for field in table.schema:
+        if pa.types.is_list(field.type) and field.name in df.columns:
+            first = df[field.name].dropna().head(1)
+            sequence_columns[field.name] = 'tuple' if len(first) and isinstance(first.iat[0], tuple) else 'list'
+    metadata = dict(table.schema.metadata or {})
+    metadata[_SEQUENCE_COLUMNS_KEY] = json.dumps(sequence_columns).encode()
+    return table.replace_schema_metadata(metadata)
+
+
+def from_arrow(table):
+    """Convert an Arrow table produced by to_arrow back to a DataFrame"""
+    df = table.to_pandas()
+
+    metadata = table.schema.metadata or {}
+    sequence_columns = json.loads(metadata.get(_SEQUENCE_COLUMNS_KEY, b'{}'))
+    for column, kind in sequence_columns.items():
+        convert = tuple if kind == 'tuple' else list
+        df[column] = df[column].map(convert, na_action='ignore')
+
+    return df
+
+
+def write_table(df, path):
+    """Atomically write a DataFrame, including its index, to an uncompressed Feather file"""
+    table = to_arrow(df)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    feather.write_feather(table, temp_path, compression='uncompressed')
+    os.replace(temp_path, path)
+
+
+def read_table(path):
+    """Read a DataFrame written by write_table, memory-mapping the file"""
+    return from_arrow(feather.read_table(path, memory_map=True))
+
+
+def clear_disk_cache(cache_dir=None):
+    """Delete every cached Feather file"""
+    directory = CACHE_DIR if cache_dir is None else cache_dir
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith('.feather'):
+            os.remove(os.path.join(directory, name))
+
+
+def code_stamp(func, version=1):
+    """
+    Return a hash of a function's source and of the functions and constants of the tools package it reaches
+
+    Functions are followed through the global names their code (including nested functions and comprehensions) refers
+    to, directly or as attributes of an imported tools module. Upper-case constants holding plain data, e.g. SCHEMAS,
+    are hashed by their current value, so setting one such as schemas.READ_CSV_ENGINE also changes the stamp. Lower-case
+    globals are runtime state, e.g. the detected date formats, and are left out.
+
+    @param func: function, possibly decorated
+    @param version: integer folded into the stamp along with CACHE_VERSION
+    @return: hex digest
+    """
+    if func not in _code_references:
+        _code_references[func] = _collect_references(func)
+    sources, constants = _code_references[func]
+    values = [f"{module.__name__}.{name}={_plain_repr(getattr(module, name, None))}" for module, name in constants]
+    return _hash_text('\n'.join([f"{CACHE_VERSION}:{version}"] + sources + values))
+
+
+def _collect_references(func):
+    """Return the sources of the tools functions reachable from func, and the (module, name) of their constants"""
+    sources = []
+    constants = set()
+    seen = set()
+    pending = [func]
+    while pending:
+        current = inspect.unwrap(pending.pop())
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        try:
+            sources.append(inspect.getsource(current))
+        except (OSError, TypeError):
+            sources.append(getattr(current, '__qualname__', repr(current)))
+        if not inspect.isfunction(current):
+            continue
+        # Default arguments such as a list of candidate formats are not part of the source text
+        sources.append(_plain_repr((current.__defaults__, current.__kwdefaults__)))
+
+        namespace = current.__globals__
+        # Sorted, as the order of a set of strings changes between processes
+        names = sorted(_code_names(current.__code__))
+        imported = [namespace[name] for name in names if inspect.ismodule(namespace.get(name))]
+        modules = [inspect.getmodule(current)] + [module for module in imported if _is_stamped(module.__name__)]
+        for module in filter(None, modules):
+            for name in names:
+                if not hasattr(module, name):
+                    continue
+                value = getattr(module, name)
+                if (inspect.isfunction(value) or inspect.isclass(value)) and _is_stamped(value.__module__):
+                    pending.append(value)
+                elif name.isupper() and _is_stamped(module.__name__) and isinstance(value, _PLAIN_TYPES):
+                    constants.add((module, name))
+    return sources, sorted(constants, key=lambda constant: (constant[0].__name__, constant[1]))
+
+
+def _code_names(code):
+    """Return the global and attribute names used by a code object and the code objects nested in it"""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _code_names(const)
+    return names
+
+
+def _plain_repr(value):
+    """Return the repr of plain data, with other objects, whose repr can hold their address, replaced by their type"""
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}({', '.join(_plain_repr(item) for item in value)})"
+    if isinstance(value, dict):
+        return f"{{{', '.join(f'{_plain_repr(key)}: {_plain_repr(item)}' for key, item in value.items())}}}"
+    if isinstance(value, _PLAIN_TYPES):
+        return repr(value)
+    return f"<{type(value).__module__}.{type(value).__qualname__}>"
+
+
+def _is_stamped(module_name):
+    in_package = module_name == _STAMPED_PACKAGE or module_name.startswith(f"{_STAMPED_PACKAGE}.")
+    return in_package and module_name not in _UNSTAMPED_MODULES
+
+
+def _make_key(func, signature, args, kwargs):
+    """Return a file name prefix for the function and its arguments, and a stamp of the source file contents"""
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+
+    arguments = []
+    content = []
+    for name, value in bound.arguments.items():
+        if name.endswith('path') and isinstance(value, (str, os.PathLike)):
+            content.append(_file_hash(value))
+        else:
+            arguments.append(f"{name}={value!r}")
+
+    prefix = f"{func.__name__}-{_hash_text(';'.join(arguments))[:8]}"
+    return prefix, ':'.join(content)
+
+
+def _file_hash(path):
+    """Return the SHA-256 of a file's contents, reusing the result while its modification time and size are unchanged"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    memo_key = (path, stat.st_mtime_ns, stat.st_size)
+    if memo_key not in _file_hashes:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(functools.partial(f.read, 1024 ** 2), b''):
+                digest.update(block)
+        _file_hashes[memo_key] = digest.hexdigest()
+    return _file_hashes[memo_key]
+
+
+def _hash_text(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _remove_stale(directory, prefix, keep_path):
+    """Delete older cache files for the same function and arguments"""
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.startswith(f"{prefix}-") and name.endswith('.feather') and path != keep_path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
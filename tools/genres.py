@@ -0,0 +1,86 @@
+"""
+This module builds normalized title-to-genre bridge tables and aggregates values by genre through them.
+
+Exploding a genres column copies every other column of the row once per genre. A bridge table instead holds one narrow
+row per (title id, genre) pair, with the genre stored as a categorical (an integer code per row plus one shared list of
+genre names). Genre-level aggregates then join only the needed value columns to the bridge and group on the integer
+codes.
+
+CONTENTS
+I. imports
+II. bridge functions
+"""
+import pandas as pd
+
+from tools.instrumentation import instrumented
+
+"""
+II.
+BRIDGE FUNCTIONS:
+1. genre_bridge
+2. aggregate_by_genre
+"""
+
+
+@instrumented
+def genre_bridge(df, id_column, genre_column, sep=None):
+    """
+    Return a bridge DataFrame with one row per (id, genre) pair
+
+    Only the id and genre columns are exploded, never the full rows of df. Ids are expected to be unique in df, as
+    tconst is in the IMDB title basics file and id is in the Rotten Tomatoes movie info file.
+
+    @param df: DataFrame with an id column and a genre column holding lists/tuples, or delimited strings if sep is given
+    @param id_column: column identifying a title, e.g. 'tconst' or 'id'
+    @param genre_column: column holding the genres of each title
+    @param sep: delimiter for string genre columns, e.g. ','
+    @return: pd.DataFrame with columns [id_column, 'genre'], 'genre' being categorical with sorted categories
+    """
+    has_genres = df[genre_column].notna().to_numpy()
+    genres = df[genre_column][has_genres]
+
+    # Split each distinct genre combination once, rather than once per title
+    codes, combinations = pd.factorize(genres)
+    combinations = pd.Series(combinations, dtype=object)
+    if sep is not None:
+        combinations = combinations.str.strip().str.split(sep)
+    members = combinations.explode().dropna()
+    members = pd.DataFrame({'combination': members.index, 'genre': pd.Categorical(members.to_numpy())})
+
+    # Attach every title to the members of its combination with an integer join
+    titles = pd.DataFrame({id_column: df[id_column][has_genres].to_numpy(), 'combination': codes})
+    bridge = pd.merge(titles, members, how='inner', on='combination')
+    return bridge[[id_column, 'genre']]
+
+
+@instrumented
+def aggregate_by_genre(bridge, values_df, on, by=None, name='genre', **aggregations):
+    """
+    Join value columns to a bridge table and aggregate them per genre code
+
+    @param bridge: DataFrame returned by genre_bridge
+    @param values_df: DataFrame holding the id column 'on' and the columns to aggregate
+    @param on: id column shared by bridge and values_df
+    @param by: optional extra column(s) of values_df to group by after the genre, e.g. 'rating'
+    @param name: name of the genre level in the result's index
+    @param aggregations: named aggregations passed to DataFrameGroupBy.aggregate, e.g. numvotes=('numvotes', 'sum')
+    @return: pd.DataFrame indexed by genre name (and the 'by' columns)
+    """
+    joined = pd.merge(bridge, values_df, how='inner', on=on)
+
+    keys = [joined['genre'].cat.codes.rename(name)]
+    if by is not None:
+        keys += [joined[column] for column in ([by] if isinstance(by, str) else by)]
+    result = joined.groupby(keys, observed=True).aggregate(**aggregations)
+    return _decode_genres(result, bridge['genre'].cat.categories, name)
+
+
+def _decode_genres(df, categories, name):
+    """Replace the integer genre codes in the index of an aggregate with genre names"""
+    genres = pd.Index(categories[df.index.get_level_values(name)], dtype=object, name=name)
+    if isinstance(df.index, pd.MultiIndex):
+        levels = [genres] + [df.index.get_level_values(i) for i in range(1, df.index.nlevels)]
+        df.index = pd.MultiIndex.from_arrays(levels)
+    else:
+        df.index = genres
+    return df
@@ -0,0 +1,378 @@
+"""
+This module maintains genre aggregates incrementally as the review and IMDB feeds grow.
+
+merge_rt_data(focus='genre_popularity') and merge_imdb_title_and_ratings recompute their counts, sums and weighted
+averages from the full files on every call. The aggregates here persist their mergeable state (counts and sums per
+genre, plus what is needed to undo earlier contributions) together with a watermark per source file: the byte offset
+processed so far and a fingerprint of the bytes just before it. A refresh only parses the rows appended since the
+watermark. If a file was rewritten rather than appended to (it shrank, or the fingerprint no longer matches), the state
+is rebuilt from scratch.
+
+The IMDB ratings feed is treated as an append-only log in which the latest row for a tconst replaces earlier ones: the
+earlier rating's contribution is retracted from the title's genres before the new one is added.
+
+The parts of the state that grow with the feeds (the hashes of the reviews seen, the genres and latest rating of every
+IMDB title) are dicts and sets, so that a refresh looks up and updates only the keys of its rows. They are persisted
+as a journal to which each refresh appends the entries it changed, next to a small state file with the per-genre
+totals, the watermarks and the committed length of the journal, so that a refresh costs time in the number of new
+rows rather than in the size of the files.
+
+CONTENTS
+I. imports and constants
+II. aggregate classes
+III. watermark helper functions
+"""
+import hashlib
+import io
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from tools.genres import genre_bridge
+from tools.schemas import get_schema
+
+# Directory for persisted aggregate state, relative to the microsoft_movies directory like the data path constants
+STATE_DIR = "./data/.incremental"
+
+# Number of bytes before the watermark offset that are fingerprinted to detect rewritten files
+FINGERPRINT_BYTES = 64 * 1024
+
+# States saved in this process, keyed by state path, as (stat of the state file, state), so that the next aggregate
+# of the same path copies the state instead of replaying the journal
+_states = {}
+
+"""
+II.
+AGGREGATE CLASSES:
+1. IncrementalAggregate
+2. RtGenrePopularity
+3. ImdbGenreRatings
+"""
+
+
+class IncrementalAggregate:
+    """Base class handling the persisted state and the watermarks of an incremental aggregate"""
+
+    # File name of the persisted state inside STATE_DIR, set by subclasses
+    name = None
+
+    # Sources whose every change, appends included, requires rebuilding the state from scratch
+    rebuild_sources = ()
+
+    # Keys of dicts and sets in the state that are persisted as a journal of their changes, see update
+    journaled = ()
+
+    def __init__(self, paths, state_dir=STATE_DIR):
+        """
+        @param paths: dict of source name to file path
+        @param state_dir: directory holding the persisted state
+        """
+        self.paths = paths
+        self.state_path = os.path.join(state_dir, f"{self.name}.pkl")
+        self.journal_path = os.path.join(state_dir, f"{self.name}.journal")
+        # Changes of the journaled keys since the state was last saved, as a list of (key, changes)
+        self.changes = []
+        self.state = self._load_state()
+
+    def refresh(self):
+        """Apply the rows appended to the source files since the last refresh and return the current aggregate"""
+        # The state saved last may be the one updated below, and is only valid again once saved
+        _states.pop(self.state_path, None)
+        watermarks = self.state.get('watermarks', {})
+        if self.state and not all(_is_appended(self.paths[source], watermarks.get(source),
+                                               exact=source in self.rebuild_sources) for source in self.paths):
+            self.state = {}
+        if not self.state:
+            self.state = self.initial_state()
+            self.state['watermarks'] = {}
+            self.state['journal_offset'] = 0
+            self.changes = []
+
+        for source in self.ordered_sources():
+            delta, watermark = read_appended(self.paths[source], self.state['watermarks'].get(source))
+            self.apply(source, delta)
+            self.state['watermarks'][source] = watermark
+
+        self._save_state()
+        return self.result()
+
+    def reset(self):
+        """Forget the persisted state, so that the next refresh reads the full files"""
+        self.state = {}
+        self.changes = []
+        _states.pop(self.state_path, None)
+        for path in [self.state_path, self.journal_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def ordered_sources(self):
+        return list(self.paths)
+
+    def initial_state(self):
+        raise NotImplementedError
+
+    def apply(self, source, delta):
+        raise NotImplementedError
+
+    def result(self):
+        raise NotImplementedError
+
+    def update(self, key, changes):
+        """Update a journaled dict or set of the state, and record the changes for the next save"""
+        self.state[key].update(changes)
+        self.changes.append((key, changes))
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        saved = _states.get(self.state_path)
+        if saved is not None and saved[0] == _stat(self.state_path):
+            # The dicts and sets are copied, as the aggregate that saved the state may still update them
+            return {key: value.copy() if isinstance(value, (dict, set)) else value for key, value in saved[1].items()}
+        try:
+            state = pd.read_pickle(self.state_path)
+        except (OSError, EOFError, ValueError):
+            return {}
+        if not self.journaled:
+            return state
+
+        # Replay the journal up to the length committed with the state; a longer journal ends with the changes of a
+        # refresh that failed before saving its state, which are dropped by the next save
+        initial = self.initial_state()
+        state.update({key: initial[key] for key in self.journaled})
+        try:
+            with open(self.journal_path, 'rb') as f:
+                while f.tell() < state['journal_offset']:
+                    for key, changes in pickle.load(f):
+                        state[key].update(changes)
+                complete = f.tell() == state['journal_offset']
+        except (OSError, EOFError, KeyError, pickle.UnpicklingError):
+            complete = False
+        return state if complete else {}
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        state = self.state
+        if self.journaled:
+            with open(self.journal_path, 'r+b' if os.path.exists(self.journal_path) else 'wb') as f:
+                f.seek(state['journal_offset'])
+                f.truncate()
+                pickle.dump(self.changes, f, protocol=pickle.HIGHEST_PROTOCOL)
+                state['journal_offset'] = f.tell()
+            self.changes = []
+            state = {key: value for key, value in state.items() if key not in self.journaled}
+
+        temp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        pd.to_pickle(state, temp_path)
+        os.replace(temp_path, self.state_path)
+        _states[self.state_path] = (_stat(self.state_path), self.state)
+
+
+class RtGenrePopularity(IncrementalAggregate):
+    """
+    Incremental equivalent of merge_rt_data(focus='genre_popularity')
+
+    Keeps the number of reviews and of fresh reviews per genre, and a hash of every review row seen so that appended
+    duplicates are dropped as clean_rt_reviews does. A change to the movie info file triggers a full rebuild.
+    """
+
+    name = 'rt_genre_popularity'
+    rebuild_sources = ('info',)
+    journaled = ('row_hashes',)
+
+    def __init__(self, reviews_path=None, info_path=None, state_dir=STATE_DIR):
+        # Imported here because data_preparation imports this module
+        from tools import data_preparation
+
+        paths = {'info': info_path or data_preparation.RT_MOVIE_INFO,
+                 'reviews': reviews_path or data_preparation.RT_REVIEWS_PATH}
+        super().__init__(paths, state_dir)
+
+    def initial_state(self):
+        return {'row_hashes': set(),
+                'bridge': None,
+                'totals': pd.DataFrame({'total_references': pd.Series(dtype='int64'),
+                                        'total_positive': pd.Series(dtype='int64')})}
+
+    def apply(self, source, delta):
+        from tools import data_preparation
+
+        if source == 'info':
+            # Movie info is small and only read on a full rebuild, as reviews counted earlier may reference new ids
+            if self.state['bridge'] is None:
+                self.state['bridge'] = data_preparation.rt_genre_bridge(self.paths['info'])
+            return
+
+        # Drop reviews identical to an earlier row, as clean_rt_reviews does with drop_duplicates
+        hashes = pd.util.hash_pandas_object(delta, index=False).to_numpy()
+        seen = self.state['row_hashes']
+        keep = ~pd.Series(hashes).duplicated().to_numpy()
+        if seen:
+            keep &= np.fromiter((value not in seen for value in hashes.tolist()), dtype=bool, count=len(hashes))
+        self.update('row_hashes', set(hashes[keep].tolist()))
+        reviews_df = delta.loc[keep, ['id', 'fresh']]
+        reviews_df['fresh'] = reviews_df['fresh'].astype(object).map({'rotten': 0, 'fresh': 1})
+
+        joined = pd.merge(self.state['bridge'], reviews_df, how='inner', on='id')
+        grouped = joined.groupby('genre', observed=True)['fresh'].aggregate(['count', 'sum'])
+        grouped.index = grouped.index.astype(object)
+        grouped.columns = ['total_references', 'total_positive']
+        self.state['totals'] = self.state['totals'].add(grouped, fill_value=0)
+
+    def result(self, by='total_positive'):
+        """Return the aggregate in the layout of merge_rt_data(focus='genre_popularity')"""
+        totals = self.state['totals'].astype('int64')
+        totals['percent_positive'] = totals['total_positive'] / totals['total_references']
+        totals.index.name = 'genre'
+        return totals.sort_values(by=by, ascending=False)
+
+
+class ImdbGenreRatings(IncrementalAggregate):
+    """
+    Incremental equivalent of merge_imdb_title_and_ratings
+
+    Keeps numvotes, averagerating * numvotes and the number of rated titles per genre, plus the latest rating of each
+    tconst and the genres of each title so that a new rating for a known tconst can retract the old contribution.
+    """
+
+    name = 'imdb_genre_ratings'
+    journaled = ('genres', 'ratings')
+
+    def __init__(self, basics_path=None, ratings_path=None, state_dir=STATE_DIR):
+        # Imported here because data_preparation imports this module
+        from tools import data_preparation
+
+        paths = {'basics': basics_path or data_preparation.IMDB_TITLE_BASICS,
+                 'ratings': ratings_path or data_preparation.IMDB_TITLE_RATINGS}
+        super().__init__(paths, state_dir)
+
+    def initial_state(self):
+        # 'genres' maps each tconst to the tuple of its genres, 'ratings' to its latest (averagerating, numvotes)
+        return {'genres': {},
+                'ratings': {},
+                'totals': pd.DataFrame({'numvotes': pd.Series(dtype='int64'),
+                                        'avgrating_x_numvotes': pd.Series(dtype='float64'),
+                                        'titles': pd.Series(dtype='int64')})}
+
+    def ordered_sources(self):
+        # New titles are registered before ratings, so that ratings appended for them in the same refresh count
+        return ['basics', 'ratings']
+
+    def apply(self, source, delta):
+        if source == 'basics':
+            known = self.state['genres']
+            titles = delta.dropna(subset=['genres']).drop_duplicates('tconst')
+            titles = titles[np.fromiter((tconst not in known for tconst in titles['tconst'].tolist()), dtype=bool,
+                                        count=len(titles))]
+            bridge = genre_bridge(titles, 'tconst', 'genres', sep=',')
+            bridge['genre'] = bridge['genre'].astype(object)
+            self.update('genres', bridge.groupby('tconst', sort=False)['genre'].agg(tuple).to_dict())
+
+            # Titles rated before they appeared in the basics file start contributing now
+            self._add(self._ratings(titles['tconst']), sign=1)
+            return
+
+        # The latest row of each tconst in the delta replaces any rating seen in earlier refreshes
+        ratings = delta.drop_duplicates('tconst', keep='last').set_index('tconst')[['averagerating', 'numvotes']]
+        ratings = ratings.astype({'numvotes': 'int64'})
+        self._add(self._ratings(ratings.index), sign=-1)
+        self._add(ratings, sign=1)
+        self.update('ratings', dict(zip(ratings.index, zip(ratings['averagerating'].tolist(),
+                                                           ratings['numvotes'].tolist()))))
+
+    def _ratings(self, tconsts):
+        """Return the latest ratings of the rated tconsts among tconsts, as a DataFrame indexed by tconst"""
+        known = self.state['ratings']
+        rated = [tconst for tconst in tconsts if tconst in known]
+        return pd.DataFrame([known[tconst] for tconst in rated], index=pd.Index(rated, name='tconst', dtype=object),
+                            columns=['averagerating', 'numvotes'])
+
+    def _add(self, ratings, sign):
+        """Add (sign=1) or retract (sign=-1) the contribution of per-tconst ratings to the genre totals"""
+        if not len(ratings.index):
+            return
+        genres = self.state['genres']
+        bridge = pd.DataFrame([(tconst, genre) for tconst in ratings.index for genre in genres.get(tconst, ())],
+                              columns=['tconst', 'genre'])
+        contributions = pd.merge(bridge, ratings, how='inner', left_on='tconst', right_index=True)
+        contributions['avgrating_x_numvotes'] = contributions['averagerating'] * contributions['numvotes']
+        grouped = contributions.groupby('genre').aggregate(numvotes=('numvotes', 'sum'),
+                                                           avgrating_x_numvotes=('avgrating_x_numvotes', 'sum'),
+                                                           titles=('tconst', 'count'))
+        totals = self.state['totals'].add(sign * grouped, fill_value=0)
+        self.state['totals'] = totals[totals['titles'] > 0]
+
+    def result(self):
+        """Return the aggregate in the layout of merge_imdb_title_and_ratings"""
+        totals = self.state['totals']
+        main_df = pd.DataFrame({'numvotes': totals['numvotes'].astype('int64'),
+                                'avgrating_x_numvotes': totals['avgrating_x_numvotes'],
+                                'avgnumvotes': totals['numvotes'] / totals['titles']})
+        main_df['wavg_rating'] = main_df['avgrating_x_numvotes'] / main_df['numvotes']
+        main_df.index.name = 'genres'
+
+        # Drop the 'Adult' genre row, which was a significant outlier that will not be part of the recommendation
+        main_df = main_df.drop(index='Adult', errors='ignore')
+        main_df.reset_index(inplace=True)
+        return main_df.sort_values('numvotes', ascending=False, ignore_index=True)
+
+
+"""
+III.
+WATERMARK HELPER FUNCTIONS:
+1. read_appended
+"""
+
+
+def read_appended(path, watermark=None):
+    """
+    Parse the complete rows appended to a source file after a watermark
+
+    @param path: path to one of the source files
+    @param watermark: dict returned by a previous call, or None to read the whole file
+    @return: (pd.DataFrame of the new rows, read with the file's schema, new watermark dict)
+    """
+    with open(path, 'rb') as f:
+        header = f.readline()
+        start = watermark['offset'] if watermark else len(header)
+        f.seek(start)
+        data = f.read()
+        size = f.tell()
+
+    # Leave a partially written last line for the next refresh
+    data = data[:data.rfind(b'\n') + 1]
+    offset = start + len(data)
+
+    schema = get_schema(path)
+    delta = pd.read_csv(io.BytesIO(header + data), **schema)
+    return delta, {'offset': offset, 'size': size, 'fingerprint': _fingerprint(path, offset)}
+
+
+def _is_appended(path, watermark, exact=False):
+    """Return whether the file still starts with the bytes a watermark was taken from, and is unchanged if exact"""
+    if watermark is None:
+        return False
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return False
+    if size < watermark['offset'] or (exact and size != watermark['size']):
+        return False
+    return _fingerprint(path, watermark['offset']) == watermark['fingerprint']
+
+
+def _fingerprint(path, offset):
+    """Hash the header line and the bytes just before offset"""
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.readline())
+        f.seek(max(0, offset - FINGERPRINT_BYTES))
+        digest.update(f.read(min(offset, FINGERPRINT_BYTES)))
+    return digest.hexdigest()
+
+
+def _stat(path):
+    """Return what identifies a version of an atomically replaced file"""
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
@@ -0,0 +1,350 @@
+"""
+This module provides opt-in timing and memory instrumentation for the data preparation pipeline.
+
+Every clean_* and merge_* function in data_preparation.py is wrapped with the instrumented decorator, and their inner
+steps (reading the csv files, date parsing, dollar and punctuation conversions, explodes, genre bridges and the joins of
+tools.query.Query) are wrapped in stage blocks. While instrumentation is disabled, which is the default, the decorator
+and stage only check a module level flag. Once enable() is called, every stage records its wall time, the growth of
+the process's peak RSS, optionally the tracemalloc peak, and the rows and bytes of its input and output DataFrames.
+Each record is passed to a sink: a LoggingSink, a JsonLinesSink or an in-memory MemorySink, whose summary() ranks the
+slowest stages.
+
+Example:
+    from tools import instrumentation
+    sink = instrumentation.enable(instrumentation.MemorySink(), trace_memory=True)
+    merge_bom_and_imdb()
+    print(sink.summary())
+
+CONTENTS
+I. imports and state
+II. control functions
+III. decorator and stage context manager
+IV. sinks
+V. helper functions
+"""
+import contextlib
+import functools
+import json
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Checked by every instrumented function and stage; set through enable() and disable()
+ENABLED = False
+
+# Active configuration, set by enable()
+_config = {'sink': None, 'trace_memory': False, 'deep_bytes': False}
+
+# Stack of open stages of each thread, used to name nested stages and to propagate tracemalloc peaks
+_local = threading.local()
+
+"""
+II.
+CONTROL FUNCTIONS:
+1. enable
+2. disable
+3. enabled
+"""
+
+
+def enable(sink=None, trace_memory=False, deep_bytes=False):
+    """
+    Start recording stages
+
+    @param sink: callable receiving each stage record (a dict), defaults to a new MemorySink
+    @param trace_memory: also record the tracemalloc peak of each stage, which slows allocation-heavy code down
+    @param deep_bytes: measure DataFrame bytes with memory_usage(deep=True), which scans every object column
+    @return: the sink
+    """
+    global ENABLED
+    sink = MemorySink() if sink is None else sink
+    _config.update(sink=sink, trace_memory=trace_memory, deep_bytes=deep_bytes)
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    ENABLED = True
+    return sink
+
+
+def disable():
+    """Stop recording stages, and stop tracemalloc if enable() started it"""
+    global ENABLED
+    ENABLED = False
+    if _config['trace_memory'] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _config.update(sink=None, trace_memory=False)
+
+
+@contextlib.contextmanager
+def enabled(sink=None, trace_memory=False, deep_bytes=False):
+    """Enable instrumentation for the duration of a with block, yielding the sink"""
+    sink = enable(sink, trace_memory, deep_bytes)
+    try:
+        yield sink
+    finally:
+        disable()
+
+
+"""
+III.
+DECORATOR AND STAGE CONTEXT MANAGER:
+1. instrumented
+2. stage
+3. Stage
+"""
+
+
+def instrumented(func=None, name=None):
+    """
+    Record every call of a function as a stage named after it
+
+    DataFrame arguments are counted as the stage input and a DataFrame (or Series) return value as its output.
+
+    @param func: function to decorate
+    @param name: stage name, defaults to the function name
+    @return: decorated function
+    """
+    if func is None:
+        return functools.partial(instrumented, name=name)
+    stage_name = func.__name__ if name is None else name
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not ENABLED:
+            return func(*args, **kwargs)
+        inputs = [value for value in list(args) + list(kwargs.values()) if isinstance(value, (pd.DataFrame, pd.Series))]
+        with Stage(stage_name, inputs) as current:
+            return current.output(func(*args, **kwargs))
+
+    return wrapper
+
+
+def stage(name, inputs=None):
+    """
+    Return a context manager recording a block as a stage nested in the enclosing stage
+
+    Pass the block's input DataFrame(s) as inputs and its result to .output(), which returns it unchanged:
+        with stage('to_datetime', df) as s:
+            df['date'] = s.output(pd.to_datetime(df['date']))
+
+    @param name: stage name, e.g. 'to_datetime'
+    @param inputs: optional DataFrame, Series or list of them
+    @return: Stage, or a shared no-op context manager when instrumentation is disabled
+    """
+    if not ENABLED:
+        return _NULL_STAGE
+    return Stage(name, inputs)
+
+
+class Stage:
+    """Context manager measuring one stage and passing its record to the configured sink"""
+
+    def __init__(self, name, inputs=None):
+        self.name = name
+        self.inputs = [] if inputs is None else inputs if isinstance(inputs, (list, tuple)) else [inputs]
+        self.outputs = []
+        self.child_peak = 0
+
+    def output(self, value):
+        """Count value as an output of the stage and return it"""
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            self.outputs.append(value)
+        return value
+
+    def __enter__(self):
+        stack = _stack()
+        self.parent = stack[-1] if stack else None
+        self.path = self.name if self.parent is None else f"{self.parent.path}/{self.name}"
+        stack.append(self)
+
+        self.sink = _config['sink']
+        self.trace_memory = _config['trace_memory'] and tracemalloc.is_tracing()
+        if self.trace_memory:
+            # Keep the enclosing stage's peak before resetting it for this stage
+            current, peak = tracemalloc.get_traced_memory()
+            if self.parent is not None:
+                self.parent.child_peak = max(self.parent.child_peak, peak)
+            tracemalloc.reset_peak()
+            self.start_traced = current
+        self.start_rss = _max_rss()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.start
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+
+        record = {'stage': self.path,
+                  'name': self.name,
+                  'depth': self.path.count('/'),
+                  'seconds': seconds,
+                  'rss_growth_mb': _megabytes(_max_rss() - self.start_rss) if self.start_rss is not None else None,
+                  'traced_peak_mb': None,
+                  'rows_in': _rows(self.inputs),
+                  'bytes_in': _bytes(self.inputs),
+                  'rows_out': _rows(self.outputs),
+                  'bytes_out': _bytes(self.outputs),
+                  'error': None if exc_type is None else exc_type.__name__}
+
+        if self.trace_memory:
+            peak = max(self.child_peak, tracemalloc.get_traced_memory()[1])
+            record['traced_peak_mb'] = _megabytes(peak - self.start_traced)
+            if self.parent is not None:
+                self.parent.child_peak = max(self.parent.child_peak, peak)
+
+        if self.sink is not None:
+            self.sink(record)
+        return False
+
+
+class _NullStage:
+    """Stage returned while instrumentation is disabled"""
+
+    def output(self, value):
+        return value
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+"""
+IV.
+SINKS:
+Sinks are callables receiving one record dict per finished stage
+1. MemorySink
+2. LoggingSink
+3. JsonLinesSink
+"""
+
+
+class MemorySink:
+    """Collect stage records in a list"""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def clear(self):
+        with self._lock:
+            self.records = []
+
+    def to_frame(self):
+        """Return the records as a DataFrame, one row per finished stage"""
+        return pd.DataFrame(self.records)
+
+    def summary(self, top=10):
+        """Return the slowest stages, see summarize"""
+        return summarize(self.records, top)
+
+
+class LoggingSink:
+    """Log one line per stage record"""
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logging.getLogger('tools.instrumentation') if logger is None else logger
+        self.level = level
+
+    def __call__(self, record):
+        self.logger.log(self.level, "%s%s: %.3fs, rows %s -> %s, traced peak %s MB", '  ' * record['depth'],
+                        record['stage'], record['seconds'], record['rows_in'], record['rows_out'],
+                        'n/a' if record['traced_peak_mb'] is None else f"{record['traced_peak_mb']:.1f}")
+
+
+class JsonLinesSink:
+    """Append each stage record as a JSON line to a file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record)
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+
+
+"""
+V.
+HELPER FUNCTIONS:
+1. summarize
+2. read_json_lines
+"""
+
+
+def summarize(records, top=10):
+    """
+    Rank stages by their total wall time
+
+    @param records: list of stage record dicts, e.g. MemorySink.records or read_json_lines(path)
+    @param top: number of stages returned
+    @return: pd.DataFrame indexed by stage path with calls, total/mean/max seconds, peak memory and row counts
+    """
+    df = pd.DataFrame(list(records))
+    if df.empty:
+        return df
+    grouped = df.groupby('stage').aggregate(calls=('seconds', 'count'),
+                                            total_seconds=('seconds', 'sum'),
+                                            mean_seconds=('seconds', 'mean'),
+                                            max_seconds=('seconds', 'max'),
+                                            max_traced_peak_mb=('traced_peak_mb', 'max'),
+                                            max_rss_growth_mb=('rss_growth_mb', 'max'),
+                                            max_rows_in=('rows_in', 'max'),
+                                            max_rows_out=('rows_out', 'max'))
+    return grouped.sort_values('total_seconds', ascending=False).head(top)
+
+
+def read_json_lines(path):
+    """Return the records written by a JsonLinesSink"""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def _rows(frames):
+    return sum(len(frame) for frame in frames) if frames else None
+
+
+def _bytes(frames):
+    if not frames:
+        return None
+    deep = _config['deep_bytes']
+    return int(sum(frame.memory_usage(deep=deep, index=True).sum() if isinstance(frame, pd.DataFrame)
+                   else frame.memory_usage(deep=deep, index=True) for frame in frames))
+
+
+def _max_rss():
+    """Return the peak resident set size of the process in bytes, or None where the resource module is missing"""
+    if resource is None:
+        return None
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def _megabytes(value):
+    return value / 1024 ** 2
@@ -0,0 +1,162 @@
+"""
+This module encodes the string join keys of the source files as int64 keys.
+
+Joining on tconst, nconst or a normalized title hashes and compares variable-length Python strings, which dominates the
+time and memory of the IMDB merges. Two encodings replace them:
+    - IMDB identifiers such as 'tt0123456' and 'nm0123456' are parsed into their number with vectorized numpy
+      arithmetic. The encoding needs no lookup table, so codes from different files and processes always agree, and
+      decode_ids restores the original strings.
+    - Normalized titles are dictionary-encoded into a Vocabulary shared by every source in the process (TITLES), so
+      that the same title gets the same code in Box Office Mojo, The Numbers, TMDB and IMDB. Codes are only
+      meaningful within the process, so frames holding them must not be persisted or loaded in worker processes.
+
+The cleaning functions of data_preparation.py encode their keys at load time when called with encode_keys=True, and
+the merging functions decode them only for the columns they return. benchmarks.bench_keys compares the encoded joins
+with the string-keyed ones.
+
+CONTENTS
+I. imports and constants
+II. identifier encoding
+III. Vocabulary class
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Prefix of each IMDB identifier column
+ID_PREFIXES = {'tconst': 'tt', 'nconst': 'nm', 'title_id': 'tt'}
+
+# Number of digits IMDB pads identifiers to, e.g. 'tt0123456'; larger numbers use as many digits as they need
+ID_WIDTH = 7
+
+# Code given to missing titles, which join to each other as NaN keys do in pd.merge
+MISSING = -1
+
+"""
+II.
+IDENTIFIER ENCODING:
+1. encode_ids
+2. decode_ids
+3. encode_columns
+"""
+
+
+def encode_ids(series, prefix):
+    """
+    Return the number of every IMDB identifier of a Series as an int64 array, e.g. 123456 for 'tt0123456'
+
+    @param series: pd.Series of identifier strings
+    @param prefix: two-letter prefix of every identifier, e.g. 'tt'
+    @return: np.ndarray of int64
+    @raise ValueError: if an identifier is missing or does not round trip through decode_ids
+    """
+    values = series.to_numpy(dtype=str)
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    # View the fixed-width unicode array as one row of code points per identifier, padded with zeros
+    width = values.dtype.itemsize // 4
+    chars = values.view(np.uint32).reshape(len(values), width)
+    present = chars[:, len(prefix):] != 0
+    digits = chars[:, len(prefix):].astype(np.int64) - ord('0')
+
+    # Only identifiers with the prefix, digits only and IMDB's zero padding decode back to the same string
+    count = present.sum(axis=1)
+    valid = (chars[:, :len(prefix)] == [ord(char) for char in prefix]).all(axis=1)
+    valid &= ((digits >= 0) & (digits <= 9) | ~present).all(axis=1)
+    valid &= (count == ID_WIDTH) | ((count > ID_WIDTH) & (digits[:, 0] != 0))
+    if not valid.all():
+        raise ValueError(f"Cannot encode identifier {values[np.argmin(valid)]!r} with prefix {prefix!r}")
+
+    codes = np.zeros(len(values), dtype=np.int64)
+    for position in range(width - len(prefix)):
+        codes = np.where(present[:, position], codes * 10 + digits[:, position], codes)
+    return codes
+
+
+def decode_ids(codes, prefix):
+    """Return the identifier strings of encoded IMDB identifiers as an object array, e.g. 'tt0123456' for 123456"""
+    numbers = pd.Series(np.asarray(codes, dtype=np.int64)).astype(str).str.zfill(ID_WIDTH)
+    return (prefix + numbers).to_numpy(dtype=object)
+
+
+def encode_columns(df):
+    """Encode every IMDB identifier column of df (see ID_PREFIXES) in place and return df"""
+    for column, prefix in ID_PREFIXES.items():
+        if column in df.columns:
+            df[column] = encode_ids(df[column], prefix)
+    return df
+
+
+"""
+III.
+VOCABULARY CLASS:
+1. Vocabulary
+2. encode_titles
+3. title_year_keys
+"""
+
+
+class Vocabulary:
+    """Dictionary encoding of strings into consecutive int64 codes, shared by every Series encoded with it"""
+
+    def __init__(self):
+        self.strings = pd.Index([], dtype=object)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.strings)
+
+    def encode(self, series):
+        """
+        Return the codes of a Series of strings, adding unseen strings to the vocabulary
+
+        @param series: pd.Series of strings, missing values become MISSING
+        @return: np.ndarray of int64
+        """
+        # Hash every distinct string once, then look only the distinct ones up in the vocabulary
+        positions, uniques = pd.factorize(series)
+        uniques = pd.Index(uniques, dtype=object)
+        with self._lock:
+            found = self.strings.get_indexer(uniques)
+            unseen = found == -1
+            if unseen.any():
+                found[unseen] = np.arange(len(self.strings), len(self.strings) + unseen.sum())
+                self.strings = self.strings.append(uniques[unseen])
+        codes = np.full(len(positions), MISSING, dtype=np.int64)
+        present = positions != -1
+        codes[present] = found[positions[present]]
+        return codes
+
+    def decode(self, codes):
+        """Return the strings of codes as an object array, with NaN for MISSING"""
+        codes = np.asarray(codes, dtype=np.int64)
+        present = codes != MISSING
+        strings = np.full(len(codes), np.nan, dtype=object)
+        strings[present] = self.strings.to_numpy(dtype=object)[codes[present]]
+        return strings
+
+
+# Vocabulary of the normalized titles of every source, e.g. the 'cleaned_title' columns
+TITLES = Vocabulary()
+
+
+def encode_titles(df, column='cleaned_title', vocabulary=TITLES):
+    """Replace a column of normalized titles with its codes in a vocabulary, in place, and return df"""
+    df[column] = vocabulary.encode(df[column])
+    return df
+
+
+def title_year_keys(codes, years):
+    """
+    Combine title codes with four-digit release years into int64 join keys, e.g. code * 10000 + 2015
+
+    @param codes: array of title codes from a Vocabulary
+    @param years: pd.Series of years, as numbers or strings such as '2015'
+    @return: np.ndarray of int64, MISSING where the year is missing or not between 0 and 9999
+    """
+    years = pd.to_numeric(years, errors='coerce')
+    keys = np.asarray(codes, dtype=np.int64) * 10000 + years.fillna(0).astype('int64').to_numpy()
+    keys[years.isna().to_numpy() | (years < 0).to_numpy() | (years > 9999).to_numpy()] = MISSING
+    return keys
@@ -0,0 +1,209 @@
+"""
+This module loads several source files concurrently by running the cleaning functions in a worker pool.
+
+The cleaning functions are independent of each other and spend most of their time parsing, so a full report build can
+clean the IMDB, Rotten Tomatoes, The Numbers, Box Office Mojo and TMDB files at the same time. Process workers send
+their results back as Arrow IPC streams when pyarrow is installed, which is much cheaper than pickling object columns.
+Every loaded frame is also stored in the shared dataset cache, so the merging functions reuse it instead of parsing the
+file again. clean_imdb_title_basics(encode_keys=True) holds the codes of its cleaned titles in tools.keys.TITLES,
+which are only valid within the process that encoded them, so it is never loaded by process workers: load_many rejects
+it, and load_all loads it in threads of this process while the workers parse the other files. The tconst and nconst
+numbers of the other sources called with encode_keys=True are parsed from the identifiers, and are the same in every
+process.
+
+CONTENTS
+I. imports and source list
+II. loading functions
+III. worker helpers
+"""
+import inspect
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from tools import data_preparation, disk_cache, schemas
+
+# Cached function names and keyword arguments loaded by load_all, as called by the merging functions and
+# tools.title_matching; stream_imdb_top_crew reads its files in chunks instead
+ALL_SOURCES = [
+    ('clean_rt_reviews', {}),
+    ('clean_rt_movie_info', {}),
+    ('rt_genre_bridge', {}),
+    ('clean_tn_budgets', {}),
+    ('clean_bom_gross', {}),
+    ('clean_tmdb_movies', {}),
+    ('clean_imdb_name_basics', {'encode_keys': True}),
+    ('clean_imdb_title_principals', {'encode_keys': True}),
+    ('clean_imdb_title_ratings', {'encode_keys': True}),
+    ('clean_imdb_title_basics', {'encode_keys': True}),
+    ('clean_imdb_title_basics', {'clean_titles': False, 'encode_keys': True}),
+    ('imdb_genre_bridge', {'encode_keys': True}),
+    ('clean_imdb_title_basics', {'clean_titles': False}),
+]
+
+"""
+II.
+LOADING FUNCTIONS:
+1. load_many
+2. load_all
+"""
+
+
+def load_many(sources, max_workers=None, executor=None):
+    """
+    Run cleaning functions concurrently and return their DataFrames
+
+    @param sources: iterable of cleaning function names, or of (name, kwargs) pairs, e.g. ('clean_imdb_title_basics',
+        {'explode': True}); the genre bridge functions of data_preparation are accepted too
+    @param max_workers: number of workers, defaults to the number of CPUs (capped at the number of sources)
+    @param executor: 'process' or 'thread'; defaults to 'thread' when schemas.READ_CSV_ENGINE is 'pyarrow', whose
+        multithreaded parser releases the GIL, and to 'process' otherwise. The process executor rejects
+        clean_imdb_title_basics with encode_keys=True and clean_titles=True, as its title codes are only valid
+        within the process that encoded them
+    @return: list of DataFrames, in the order of sources
+    """
+    sources = _normalize(sources)
+    if not sources:
+        return []
+
+    executor = _resolve_executor(executor)
+    if executor == 'process':
+        local = [_label(source) for source in sources if _is_process_local(source)]
+        if local:
+            raise ValueError(f"{local} cannot be loaded by process workers, as title codes are only valid within "
+                             f"one process; use executor='thread'")
+    max_workers = _workers(max_workers, sources)
+
+    if executor == 'thread':
+        # Threads share the dataset cache, so the cached functions can be called directly
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(getattr(data_preparation, name), **kwargs) for name, kwargs in sources]
+            return [future.result() for future in futures]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return _collect(sources, _submit(pool, sources))
+
+
+def load_all(max_workers=None, executor=None, sources=None):
+    """
+    Load every source used by the merging functions concurrently
+
+    With the process executor, the workers take the largest files first, and the sources that cannot leave this
+    process (see load_many) are loaded in threads while the workers run. The genre bridge tables are then derived in
+    this process from the cleaned frames already loaded, rather than parsed again by a worker.
+
+    @param max_workers: number of workers, see load_many
+    @param executor: 'process' or 'thread', see load_many
+    @param sources: subset of ALL_SOURCES to load, defaults to all of them
+    @return: dict mapping each cleaning function name (suffixed with its keyword arguments if any) to its DataFrame
+    """
+    sources = _normalize(ALL_SOURCES if sources is None else sources)
+    executor = _resolve_executor(executor)
+    bridges = [source for source in sources if source[0].endswith('_genre_bridge')]
+    local = [source for source in sources if source not in bridges and (executor == 'thread' or
+                                                                        _is_process_local(source))]
+    remote = sorted([source for source in sources if source not in bridges and source not in local],
+                    key=_source_size, reverse=True)
+
+    frames = {}
+    if remote:
+        with ProcessPoolExecutor(max_workers=_workers(max_workers, remote)) as pool:
+            futures = _submit(pool, remote)
+            frames.update(zip(map(_label, local), load_many(local, max_workers, executor='thread')))
+            frames.update(zip(map(_label, remote), _collect(remote, futures)))
+    else:
+        frames.update(zip(map(_label, local), load_many(local, max_workers, executor='thread')))
+    frames.update(zip(map(_label, bridges), load_many(bridges, max_workers, executor='thread')))
+    return {_label(source): frames[_label(source)] for source in sources}
+
+
+"""
+III.
+WORKER HELPERS:
+"""
+
+
+def _normalize(sources):
+    """Return sources as a list of (name, kwargs) pairs, checking that every name is a cached loading function"""
+    sources = [(source, {}) if isinstance(source, str) else (source[0], dict(source[1])) for source in sources]
+    for name, _ in sources:
+        if not (name.startswith('clean_') or name.endswith('_genre_bridge')) or not hasattr(data_preparation, name):
+            raise ValueError(f"Unknown cleaning function {name!r}")
+    return sources
+
+
+def _is_process_local(source):
+    """Return whether a source's frame holds title codes, which are only valid within the process that encoded them"""
+    name, kwargs = source
+    if name != 'clean_imdb_title_basics':
+        return False
+    arguments = inspect.signature(data_preparation.clean_imdb_title_basics).bind(**kwargs)
+    arguments.apply_defaults()
+    return bool(arguments.arguments['encode_keys'] and arguments.arguments['clean_titles'])
+
+
+def _source_size(source):
+    """Return the size of the file a source reads, or 0 when unknown"""
+    path = inspect.signature(getattr(data_preparation, source[0])).parameters.get('path')
+    try:
+        return os.path.getsize(source[1].get('path', path.default if path else None))
+    except (OSError, TypeError):
+        return 0
+
+
+def _workers(max_workers, sources):
+    """Return the number of workers for sources, defaulting to the number of CPUs"""
+    return min(max_workers or os.cpu_count() or 1, len(sources))
+
+
+def _resolve_executor(executor):
+    if executor is None:
+        executor = 'thread' if schemas.READ_CSV_ENGINE == 'pyarrow' else 'process'
+    if executor not in ('process', 'thread'):
+        raise ValueError("executor must be 'process' or 'thread'")
+    return executor
+
+
+def _label(source):
+    """Return the load_all key of a (name, kwargs) source"""
+    name, kwargs = source
+    return name + ''.join(f"[{key}={value}]" for key, value in kwargs.items())
+
+
+def _submit(pool, sources):
+    """Submit sources to a process pool, returning their futures"""
+    return [pool.submit(_load_in_worker, name, kwargs, schemas.READ_CSV_ENGINE) for name, kwargs in sources]
+
+
+def _collect(sources, futures):
+    """Return the frames of submitted sources, storing each in this process's dataset cache"""
+    frames = []
+    for (name, kwargs), future in zip(sources, futures):
+        df = _decode(future.result())
+        # Later merges find the frame in the cache instead of parsing the file again
+        getattr(data_preparation, name).prime(df, **kwargs)
+        frames.append(df)
+    return frames
+
+
+def _load_in_worker(name, kwargs, engine):
+    """Run one cleaning function in a worker process and encode its result for the parent"""
+    schemas.READ_CSV_ENGINE = engine
+    # Skip the in-memory cache of the short-lived worker; the on-disk cache still applies
+    df = getattr(data_preparation, name).__wrapped__(**kwargs)
+
+    if disk_cache.pa is None:
+        return 'pickle', df
+    table = disk_cache.to_arrow(df)
+    sink = disk_cache.pa.BufferOutputStream()
+    with disk_cache.pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return 'arrow', sink.getvalue().to_pybytes()
+
+
+def _decode(result):
+    """Rebuild a DataFrame from the output of _load_in_worker"""
+    kind, payload = result
+    if kind == 'pickle':
+        return payload
+    table = disk_cache.pa.ipc.open_stream(disk_cache.pa.py_buffer(payload)).read_all()
+    return disk_cache.from_arrow(table)
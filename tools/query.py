@@ -0,0 +1,220 @@
+"""
+This module provides a small lazy query layer over the DataFrames returned by the cleaning functions.
+
+A Query records scans of cleaned tables, inner or outer joins, row filters, an optional genre-style explode and a final
+column projection without executing anything. collect() then runs a plan in which:
+    - filters are applied to the table that owns the filtered column, before any join,
+    - a filter on a column that is exploded later is also applied before the joins as an "any element matches" test,
+    - each table is projected to the columns that later stages need,
+    - the explode runs after the joins, followed by the exact filters on the exploded column.
+explain() shows the chosen plan together with the row count after every stage.
+
+CONTENTS
+I. imports and operators
+II. Query class
+III. helper functions
+"""
+import operator
+import re
+
+import pandas as pd
+
+from tools.instrumentation import stage
+
+# Comparison operators accepted by Query.filter
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    'isin': lambda series, values: series.isin(values),
+}
+
+"""
+II.
+QUERY CLASS:
+"""
+
+
+class Query:
+    """
+    Lazily built scan/join/filter/explode/select pipeline over cleaned DataFrames
+
+    Column names are resolved to the first scanned table that has them, so joined tables should not share column
+    names other than their join keys.
+
+    Example:
+        query = (Query('basics', clean_imdb_title_basics)
+                 .join(Query('ratings', clean_imdb_title_ratings), on='tconst')
+                 .explode('genres', sep=',')
+                 .filter('genres', 'isin', ['Action', 'Drama'])
+                 .select(['genres', 'numvotes']))
+        df = query.collect()
+        print(query.explain())
+    """
+
+    def __init__(self, name, loader):
+        """
+        @param name: label used for the table in explain()
+        @param loader: function without arguments returning the table, e.g. one of the clean_* functions
+        """
+        self._scans = [(name, loader)]
+        self._joins = []
+        self._filters = []
+        self._explode = None
+        self._columns = None
+        self._stages = None
+
+    def join(self, other, on, how='inner'):
+        """Join another single-table Query, whose own filters are kept, on the column(s) in 'on'"""
+        if len(other._scans) != 1 or other._joins or other._explode or other._columns:
+            raise ValueError("Only single-table queries with filters can be joined")
+        self._scans.append(other._scans[0])
+        self._joins.append((other._scans[0][0], on, how))
+        self._filters.extend(other._filters)
+        self._stages = None
+        return self
+
+    def filter(self, column, op, value):
+        """Keep rows where 'column op value' holds, with op one of the keys of OPERATORS"""
+        if op not in OPERATORS:
+            raise ValueError(f"Unknown operator {op!r}, expected one of {list(OPERATORS)}")
+        if op == 'isin':
+            value = list(value)
+        self._filters.append((column, op, value))
+        self._stages = None
+        return self
+
+    def explode(self, column, sep=None):
+        """Explode a list-like column, or a delimited string column if sep is given, after the joins"""
+        self._explode = (column, sep)
+        self._stages = None
+        return self
+
+    def select(self, columns):
+        """Return only the given columns, which also limits the columns carried through the joins"""
+        self._columns = list(columns)
+        self._stages = None
+        return self
+
+    def collect(self):
+        """Execute the plan and return the resulting DataFrame"""
+        self._stages = []
+        tables = {name: loader() for name, loader in self._scans}
+        owners = _column_owners(self._scans, tables)
+        outer_tables = {name for name, _, how in self._joins if how != 'inner'}
+        if any(how in ('right', 'outer') for _, _, how in self._joins):
+            outer_tables.add(self._scans[0][0])
+        explode_column = self._explode[0] if self._explode else None
+
+        # Sort filters into those that run at their table's scan and those that must wait for the joins/explode
+        scan_filters = {name: [] for name, _ in self._scans}
+        late_filters = []
+        for column, op, value in self._filters:
+            owner = owners.get(column)
+            if owner is None or owner in outer_tables:
+                late_filters.append((column, op, value))
+            elif column == explode_column:
+                if op in ('isin', '=='):
+                    values = value if op == 'isin' else [value]
+                    scan_filters[owner].append((column, 'contains any', values))
+                late_filters.append((column, op, value))
+            else:
+                scan_filters[owner].append((column, op, value))
+
+        # Scan, filter and project every table
+        needed = self._needed_columns(late_filters)
+        for name, _ in self._scans:
+            df = tables[name]
+            self._record(f"scan {name}", df)
+            for column, op, value in scan_filters[name]:
+                df = df[_evaluate(df[column], op, value, self._explode)]
+                self._record(f"  filter {column} {op} {_format_value(value)}", df)
+            if needed is not None:
+                df = df[[column for column in df.columns if column in needed]]
+                self._record(f"  project {list(df.columns)}", df)
+            tables[name] = df
+
+        # Join in declaration order
+        combined = tables[self._scans[0][0]]
+        for name, on, how in self._joins:
+            with stage(f"join {name}", [combined, tables[name]]) as current:
+                combined = current.output(pd.merge(combined, tables[name], how=how, on=on))
+            self._record(f"join {name} on {on} ({how})", combined)
+
+        # Explode last, then apply the filters that depend on the exploded values or on outer-joined tables
+        if self._explode:
+            column, sep = self._explode
+            with stage(f"explode {column}", combined) as current:
+                if sep is not None:
+                    combined = combined.assign(**{column: combined[column].str.strip().str.split(sep)})
+                combined = current.output(combined.explode(column))
+            self._record(f"explode {column}", combined)
+        for column, op, value in late_filters:
+            combined = combined[_evaluate(combined[column], op, value)]
+            self._record(f"filter {column} {op} {_format_value(value)}", combined)
+
+        if self._columns is not None:
+            combined = combined[self._columns]
+        return combined
+
+    def explain(self):
+        """Return the executed plan with the row count after each stage, collecting first if necessary"""
+        if self._stages is None:
+            self.collect()
+        width = max(len(description) for description, _ in self._stages)
+        lines = [f"{description:<{width}}  rows: {rows}" for description, rows in self._stages]
+        return '\n'.join(lines)
+
+    def _needed_columns(self, late_filters):
+        """Return the set of columns later stages use, or None if every column is returned"""
+        if self._columns is None:
+            return None
+        needed = set(self._columns)
+        for _, on, _ in self._joins:
+            needed.update([on] if isinstance(on, str) else on)
+        needed.update(column for column, _, _ in late_filters)
+        if self._explode:
+            needed.add(self._explode[0])
+        return needed
+
+    def _record(self, description, df):
+        self._stages.append((description, len(df.index)))
+
+
+"""
+III.
+HELPER FUNCTIONS:
+"""
+
+
+def _column_owners(scans, tables):
+    """Map each column name to the first scanned table containing it"""
+    owners = {}
+    for name, _ in scans:
+        for column in tables[name].columns:
+            owners.setdefault(column, name)
+    return owners
+
+
+def _evaluate(series, op, value, explode=None):
+    """Return the boolean mask for one filter"""
+    if op != 'contains any':
+        return OPERATORS[op](series, value)
+
+    # Pre-explode form of an isin filter on the exploded column: keep rows where any element is in 'value'
+    _, sep = explode
+    if sep is None:
+        allowed = set(value)
+        matches = series.map(lambda items: any(item in allowed for item in items), na_action='ignore')
+        return matches.fillna(False).astype(bool)
+    pattern = f"(?:^|{re.escape(sep)})\\s*(?:{'|'.join(re.escape(str(v)) for v in value)})\\s*(?:{re.escape(sep)}|$)"
+    return series.str.contains(pattern, regex=True, na=False)
+
+
+def _format_value(value):
+    if isinstance(value, list) and len(value) > 6:
+        return f"[{', '.join(map(repr, value[:6]))}, ... {len(value)} values]"
+    return repr(value)
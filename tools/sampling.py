@@ -0,0 +1,313 @@
+"""
+This module maintains stratified samples of the review and IMDB rating feeds, for approximate genre rankings.
+
+merge_rt_data(focus='genre_popularity') and merge_imdb_title_and_ratings aggregate every review and rating. For
+exploratory use, the aggregates here keep a bounded sample per genre instead and estimate percent_positive and
+wavg_rating from it, each with a confidence interval and the range of ranks it is compatible with.
+
+Every sample is a priority sample (Duffield, Lund and Thorup): each unit, a distinct review row or a rated IMDB title,
+is hashed into a pseudo-random number u in (0, 1], and each genre keeps the SAMPLE_SIZE units with the highest priority
+weight / u, where the weight is numvotes for ratings and 1 for reviews. Heavily voted titles, which dominate the
+weighted average, are therefore always sampled. The next highest priority is kept as a threshold tau: each sampled
+unit stands for max(weight, tau) of the total weight, which gives unbiased totals and an unbiased variance estimate.
+A genre with at most SAMPLE_SIZE units keeps all of them, so its estimate is exact. Samples are merged with new rows in
+one vectorized pass, and repeated rows do not bias them: a duplicated review hashes to the same unit, and a new rating
+of a title replaces its earlier values.
+
+The samples persist with the watermarks of tools.incremental, so that a refresh only reads the rows appended since the
+previous one, and the approximate results are answered from the sample rather than from the full files.
+benchmarks.bench_sampling checks the intervals against the exact results and times both.
+
+CONTENTS
+I. imports and constants
+II. sample classes
+III. estimate helper functions
+"""
+import statistics
+
+import numpy as np
+import pandas as pd
+
+from tools.genres import genre_bridge
+from tools.incremental import STATE_DIR, IncrementalAggregate
+
+# Number of units kept per genre
+SAMPLE_SIZE = 2000
+
+# Default confidence level of the intervals
+CONFIDENCE = 0.95
+
+"""
+II.
+SAMPLE CLASSES:
+1. GenreSample
+2. RtGenrePopularitySample
+3. ImdbGenreRatingsSample
+"""
+
+
+class GenreSample(IncrementalAggregate):
+    """Base class keeping a priority sample per genre, in self.state['sample'] with 'genre', 'unit' and 'priority'"""
+
+    # Column weighting the units, set by subclasses; None weighs every unit 1
+    weight = None
+
+    def __init__(self, paths, sample_size=SAMPLE_SIZE, seed=0, state_dir=STATE_DIR):
+        """
+        @param paths: dict of source name to file path
+        @param sample_size: number of units kept per genre
+        @param seed: seed of the priorities, below 10 ** 16
+        @param state_dir: directory holding the persisted state
+        """
+        self.sample_size = sample_size
+        self.seed = seed
+        super().__init__(paths, state_dir)
+        # A sample drawn with other parameters is rebuilt on the next refresh
+        if self.state.get('parameters') != (sample_size, seed):
+            self.state = {}
+
+    def initial_state(self):
+        return {'parameters': (self.sample_size, self.seed), 'sample': None}
+
+    def units(self, values):
+        """Return the uint64 unit hashes of a DataFrame's rows or of an array of ids, equal for equal values"""
+        hash_key = f"{self.seed:016d}"
+        if isinstance(values, pd.DataFrame):
+            return pd.util.hash_pandas_object(values, index=False, hash_key=hash_key).to_numpy()
+        return pd.util.hash_array(np.asarray(values, dtype=object), hash_key=hash_key)
+
+    def insert(self, candidates):
+        """
+        Merge units into the samples of their genres
+
+        @param candidates: pd.DataFrame with 'genre', 'unit' and value columns, one row per unit and genre; the values
+            of a unit already in a sample replace the earlier ones
+        """
+        if candidates.empty:
+            return
+        weights = candidates[self.weight].to_numpy(dtype='float64') if self.weight else 1.0
+        uniform = (candidates['unit'].to_numpy().astype('float64') + 1) / 2.0 ** 64
+        sample = pd.concat([self.state['sample'], candidates.assign(priority=weights / uniform)], ignore_index=True)
+        sample = sample.drop_duplicates(['genre', 'unit'], keep='last')
+
+        # One unit more than the sample size is kept, as its priority is the threshold of the estimates
+        sample = sample.sort_values('priority', ascending=False, kind='mergesort')
+        self.state['sample'] = sample.groupby('genre', sort=False).head(self.sample_size + 1).reset_index(drop=True)
+
+    def estimate(self, value, confidence=CONFIDENCE, exclude=()):
+        """Return the sampled per-genre estimates of a column, ranked without the excluded genres"""
+        sample = self.state['sample']
+        sample = sample[~sample['genre'].isin(exclude)]
+        return estimate_by_genre(sample, value, self.weight, self.sample_size, confidence)
+
+
+class RtGenrePopularitySample(GenreSample):
+    """
+    Sampled equivalent of merge_rt_data(focus='genre_popularity')
+
+    Samples the distinct reviews with a verdict of each genre. Reviews of the same movie tend to agree, so the
+    intervals, which treat reviews as independent draws, can be narrower than the true uncertainty for genres with
+    few movies. A change to the movie info file triggers a full rebuild.
+    """
+
+    name = 'rt_genre_popularity_sample'
+    rebuild_sources = ('info',)
+
+    def __init__(self, reviews_path=None, info_path=None, sample_size=SAMPLE_SIZE, seed=0, state_dir=STATE_DIR):
+        # Imported here because data_preparation imports this module
+        from tools import data_preparation
+
+        paths = {'info': info_path or data_preparation.RT_MOVIE_INFO,
+                 'reviews': reviews_path or data_preparation.RT_REVIEWS_PATH}
+        super().__init__(paths, sample_size, seed, state_dir)
+
+    def initial_state(self):
+        state = super().initial_state()
+        state.update(bridge=None, sample=pd.DataFrame({'genre': pd.Series(dtype=object),
+                                                       'unit': pd.Series(dtype='uint64'),
+                                                       'fresh': pd.Series(dtype='int8'),
+                                                       'priority': pd.Series(dtype='float64')}))
+        return state
+
+    def apply(self, source, delta):
+        from tools import data_preparation
+
+        if source == 'info':
+            if self.state['bridge'] is None:
+                bridge = data_preparation.rt_genre_bridge(self.paths['info'])
+                self.state['bridge'] = bridge.astype({'genre': object})
+            return
+        if delta.empty:
+            return
+
+        # Hash whole rows, so that duplicate reviews, which clean_rt_reviews drops, are one unit
+        reviews_df = pd.DataFrame({'id': delta['id'], 'unit': self.units(delta),
+                                   'fresh': delta['fresh'].astype(object).map({'rotten': 0, 'fresh': 1})})
+        reviews_df = reviews_df.dropna(subset=['fresh']).astype({'fresh': 'int8'})
+        candidates = pd.merge(self.state['bridge'], reviews_df, how='inner', on='id')
+        self.insert(candidates[['genre', 'unit', 'fresh']])
+
+    def result(self, confidence=CONFIDENCE):
+        """
+        Return the estimated percent_positive of every genre, highest first
+
+        @param confidence: confidence level of the intervals
+        @return: pd.DataFrame indexed by 'genre', see estimate_by_genre for the columns, with 'total' renamed to the
+            estimated 'total_references'
+        """
+        estimates = self.estimate('fresh', confidence=confidence)
+        return estimates.rename(columns=lambda column: column.replace('fresh', 'percent_positive').replace(
+            'total', 'total_references'))
+
+
+class ImdbGenreRatingsSample(GenreSample):
+    """
+    Sampled equivalent of merge_imdb_title_and_ratings
+
+    Samples the rated titles of each genre with priorities weighted by numvotes and estimates their vote-weighted
+    average rating. Titles are added to the samples once both their genres and their rating are known, in whichever
+    order the two files receive them, and the latest rating of a tconst replaces earlier ones as in
+    tools.incremental.ImdbGenreRatings. A title whose numvotes fall keeps its place in the sample, as the titles it
+    would now rank below were not kept; call reset() to redraw the samples after many such corrections.
+    """
+
+    name = 'imdb_genre_ratings_sample'
+    weight = 'numvotes'
+
+    def __init__(self, basics_path=None, ratings_path=None, sample_size=SAMPLE_SIZE, seed=0, state_dir=STATE_DIR):
+        # Imported here because data_preparation imports this module
+        from tools import data_preparation
+
+        paths = {'basics': basics_path or data_preparation.IMDB_TITLE_BASICS,
+                 'ratings': ratings_path or data_preparation.IMDB_TITLE_RATINGS}
+        super().__init__(paths, sample_size, seed, state_dir)
+
+    def initial_state(self):
+        ratings = {'unit': pd.Series(dtype='uint64'), 'averagerating': pd.Series(dtype='float64'),
+                   'numvotes': pd.Series(dtype='int64')}
+        state = super().initial_state()
+        state.update(bridge=pd.DataFrame({'tconst': pd.Series(dtype=object), 'genre': pd.Series(dtype=object)}),
+                     pending=pd.DataFrame({'tconst': pd.Series(dtype=object), **ratings}),
+                     sample=pd.DataFrame({'genre': pd.Series(dtype=object), **ratings,
+                                          'priority': pd.Series(dtype='float64')}))
+        return state
+
+    def ordered_sources(self):
+        # New titles are registered before ratings, so that ratings appended for them in the same refresh count
+        return ['basics', 'ratings']
+
+    def apply(self, source, delta):
+        # A refresh without appended rows answers from the persisted sample
+        if delta.empty:
+            return
+        if source == 'basics':
+            titles = delta.dropna(subset=['genres'])
+            titles = titles[~titles['tconst'].isin(self.state['bridge']['tconst'])].drop_duplicates('tconst')
+            bridge = genre_bridge(titles, 'tconst', 'genres', sep=',').astype({'genre': object})
+            self.state['bridge'] = pd.concat([self.state['bridge'], bridge], ignore_index=True)
+
+            # Titles rated before they appeared in the basics file are sampled now
+            pending = self.state['pending']
+            known = pending['tconst'].isin(bridge['tconst'])
+            self.state['pending'] = pending[~known]
+            ratings = pending[known]
+        else:
+            ratings = delta.drop_duplicates('tconst', keep='last')[['tconst', 'averagerating', 'numvotes']]
+            ratings = ratings.assign(unit=self.units(ratings['tconst'])).astype({'numvotes': 'int64'})
+            known = ratings['tconst'].isin(self.state['bridge']['tconst'])
+            pending = pd.concat([self.state['pending'], ratings[~known]], ignore_index=True)
+            self.state['pending'] = pending.drop_duplicates('tconst', keep='last')
+            ratings = ratings[known]
+
+        candidates = pd.merge(self.state['bridge'], ratings, how='inner', on='tconst')
+        self.insert(candidates[['genre', 'unit', 'averagerating', 'numvotes']])
+
+    def result(self, confidence=CONFIDENCE):
+        """
+        Return the estimated wavg_rating of every genre, highest first
+
+        @param confidence: confidence level of the intervals
+        @return: pd.DataFrame with a 'genres' column and the columns of estimate_by_genre, with 'total' renamed to the
+            estimated 'numvotes'
+        """
+        # Drop the 'Adult' genre, which was a significant outlier that will not be part of the recommendation
+        estimates = self.estimate('averagerating', confidence=confidence, exclude=['Adult'])
+        estimates = estimates.rename(columns=lambda column: column.replace('averagerating', 'wavg_rating').replace(
+            'total', 'numvotes'))
+        estimates.index.name = 'genres'
+        return estimates.reset_index()
+
+
+"""
+III.
+ESTIMATE HELPER FUNCTIONS:
+1. estimate_by_genre
+2. rank_intervals
+"""
+
+
+def estimate_by_genre(sample, value, weight=None, sample_size=SAMPLE_SIZE, confidence=CONFIDENCE):
+    """
+    Estimate the (weighted) mean of a column per genre from priority samples, with normal confidence intervals
+
+    Each of the sample_size highest priority units of a genre stands for max(weight, tau) of the genre's total weight,
+    tau being the priority of the next unit, or 0 if the genre has no more units. The mean is the ratio of the
+    estimated totals, and its variance is estimated from the residuals value - mean of the units whose weight is below
+    tau, each with variance tau * (tau - weight); units above tau, and genres sampled in full, are exact.
+
+    @param sample: pd.DataFrame with 'genre', 'priority' and the value and weight columns, holding up to
+        sample_size + 1 units per genre
+    @param value: column whose mean is estimated
+    @param weight: optional column weighting the mean
+    @param sample_size: number of units per genre the estimates use
+    @param confidence: confidence level of the intervals
+    @return: pd.DataFrame indexed by 'genre', sorted by the estimate in descending order, with columns value,
+        value + '_low', value + '_high', 'sampled', the estimated 'total' weight and the columns of rank_intervals
+    """
+    sample = sample.sort_values('priority', ascending=False, kind='mergesort')
+    position = sample.groupby('genre', sort=False).cumcount().to_numpy()
+    genres = sample['genre'].to_numpy()
+
+    # The unit after the sampled ones of a genre only provides its threshold
+    extra = position == sample_size
+    thresholds = pd.Series(sample['priority'].to_numpy()[extra], index=genres[extra])
+    kept = position < sample_size
+    genres = genres[kept]
+    tau = thresholds.reindex(genres).fillna(0).to_numpy()
+    weights = sample[weight].to_numpy(dtype='float64')[kept] if weight else np.ones(len(genres))
+    values = sample[value].to_numpy(dtype='float64')[kept]
+
+    adjusted = np.maximum(weights, tau)
+    grouped = pd.DataFrame({'genre': genres, 'sampled': 1, 'total': adjusted, 'product': adjusted * values})
+    grouped = grouped.groupby('genre').sum()
+    estimates = grouped['product'] / grouped['total']
+
+    residuals = values - estimates.reindex(genres).to_numpy()
+    variances = np.where(weights < tau, tau * (tau - weights), 0) * residuals ** 2
+    variance = pd.Series(variances, index=genres).groupby(level=0).sum() / grouped['total'] ** 2
+    margin = statistics.NormalDist().inv_cdf(0.5 + confidence / 2) * np.sqrt(variance)
+
+    result = pd.DataFrame({value: estimates, f'{value}_low': estimates - margin, f'{value}_high': estimates + margin,
+                           'sampled': grouped['sampled'], 'total': grouped['total'].round().astype('int64')})
+    result.index.name = 'genre'
+    result = result.sort_values(value, ascending=False)
+    return pd.concat([result, rank_intervals(result[f'{value}_low'], result[f'{value}_high'])], axis=1)
+
+
+def rank_intervals(low, high):
+    """
+    Return the ranks of estimates sorted in descending order, and the best and worst ranks their intervals allow
+
+    @param low: pd.Series of lower interval bounds, in the order of the ranking
+    @param high: pd.Series of upper interval bounds, with the same index
+    @return: pd.DataFrame with columns 'rank', 'rank_best', 'rank_worst' and 'rank_stable', True when no other
+        interval overlaps so that the rank cannot change
+    """
+    lows, highs = low.to_numpy(), high.to_numpy()
+    # Estimates certainly above an interval lie entirely above its upper bound, and conversely
+    above = (lows[None, :] > highs[:, None]).sum(axis=1)
+    below = (highs[None, :] < lows[:, None]).sum(axis=1)
+    ranks = pd.DataFrame({'rank': np.arange(1, len(lows) + 1), 'rank_best': above + 1,
+                          'rank_worst': len(lows) - below}, index=low.index)
+    ranks['rank_stable'] = ranks['rank_best'] == ranks['rank_worst']
+    return ranks
@@ -0,0 +1,188 @@
+"""
+This module defines explicit read schemas for the eleven source files and a read_csv wrapper that applies them.
+
+Without a schema every column is read, integers default to int64 and repetitive strings become object columns. Each
+entry in SCHEMAS lists the columns the cleaning functions actually use, compact integer dtypes and category dtypes
+for low-cardinality strings. Fractional measures such as ratings and popularity stay float64 so that the weighted
+averages computed from them are unchanged. The merging functions pass their results through widen_dtypes, so that the
+compact integer and float32 columns they return are int64 and float64, as read_csv infers without a schema; the
+cleaning functions return the compact dtypes. A category column always has the sorted distinct values of the whole
+file as categories, also when it is read in chunks or by the DuckDB backend, so that every path returns the same
+dtypes.
+
+CONTENTS
+I. imports and engine setting
+II. schema registry
+III. reader functions
+"""
+import os
+
+import pandas as pd
+
+from tools.instrumentation import instrumented
+
+# Parser passed to pd.read_csv. Set to 'pyarrow' to use the multithreaded Arrow CSV reader when pyarrow is installed
+READ_CSV_ENGINE = None
+
+"""
+II.
+SCHEMA REGISTRY:
+Keyed by file name so that the schema also applies to copies of a source file stored in another directory.
+'usecols' is omitted where the cleaning function returns every column of the file.
+"""
+
+SCHEMAS = {
+    'rt.reviews.tsv': {
+        'sep': '\t',
+        'encoding': 'latin-1',
+        # 'rating', 'publisher' and 'critic' are dropped after de-duplication, so they are needed to tell apart
+        # reviews that share a movie, date and verdict; categories keep them small until then
+        'dtype': {'id': 'int32', 'rating': 'category', 'critic': 'category',
+                  'top_critic': 'int8', 'publisher': 'category'},
+    },
+    'rt.movie_info.tsv': {
+        'sep': '\t',
+        'usecols': ['id', 'synopsis', 'rating', 'genre', 'theater_date', 'dvd_date', 'runtime'],
+        'dtype': {'id': 'int32', 'rating': 'category'},
+    },
+    'bom.movie_gross.csv': {
+        'dtype': {'studio': 'category', 'domestic_gross': 'float64', 'foreign_gross': 'object', 'year': 'int16'},
+    },
+    'tmdb.movies.csv': {
+        'usecols': ['genre_ids', 'id', 'original_language', 'original_title', 'popularity', 'release_date', 'title',
+                    'vote_average', 'vote_count'],
+        'dtype': {'id': 'int32', 'original_language': 'category', 'vote_count': 'int32'},
+    },
+    'tn.movie_budgets.csv': {
+        'dtype': {'id': 'int16'},
+    },
+    'imdb.name.basics.csv': {
+        # Years are whole numbers with gaps, which float32 stores exactly
+        'dtype': {'birth_year': 'float32', 'death_year': 'float32'},
+    },
+    'imdb.title.akas.csv': {
+        'dtype': {'ordering': 'int16', 'region': 'category', 'language': 'category', 'types': 'category',
+                  'attributes': 'category', 'is_original_title': 'float32'},
+    },
+    'imdb.title.basics.csv': {
+        'dtype': {'start_year': 'int16', 'runtime_minutes': 'float32', 'genres': 'category'},
+    },
+    'imdb.title.crew.csv': {},
+    'imdb.title.principals.csv': {
+        'dtype': {'ordering': 'int8', 'category': 'category', 'job': 'category'},
+    },
+    'imdb.title.ratings.csv': {
+        'dtype': {'numvotes': 'int32'},
+    },
+}
+
+"""
+III.
+READER FUNCTIONS:
+1. get_schema
+2. read_source
+3. read_source_filtered
+4. widen_dtypes
+5. category_dtype
+"""
+
+
+def get_schema(path):
+    """Return a copy of the read_csv keyword arguments registered for a source file, or an empty dict"""
+    schema = SCHEMAS.get(os.path.basename(path), {})
+    return {key: value.copy() if isinstance(value, (dict, list)) else value for key, value in schema.items()}
+
+
+@instrumented(name='read_csv')
+def read_source(path, engine=None, **kwargs):
+    """
+    Read a source file with its registered schema
+
+    @param path: path to one of the source files
+    @param engine: read_csv parser, defaults to READ_CSV_ENGINE
+    @param kwargs: extra read_csv arguments, overriding the schema
+    @return: pd.DataFrame
+    """
+    options = get_schema(path)
+    options.update(kwargs)
+
+    engine = READ_CSV_ENGINE if engine is None else engine
+    if engine is not None:
+        options['engine'] = engine
+
+    df = pd.read_csv(path, **options)
+    if isinstance(df, pd.DataFrame):
+        # read_csv appends the categories of each block of the file it parses, so only small files come out sorted
+        for column in df.columns[df.dtypes == 'category']:
+            categories = df[column].cat.categories
+            if not categories.is_monotonic_increasing:
+                df[column] = df[column].cat.reorder_categories(category_dtype(categories).categories)
+    return df
+
+
+@instrumented(name='read_csv_filtered')
+def read_source_filtered(path, chunksize, usecols=None, **isin):
+    """
+    Read a source file in chunks, keeping only rows whose column values are in the given sets
+
+    Only the surviving rows of each chunk are held in memory, so peak memory is bounded by chunksize plus the size of
+    the filtered result rather than by the size of the file.
+
+    @param path: path to one of the source files
+    @param chunksize: number of rows parsed at a time
+    @param usecols: optional list of the columns to parse, which must include the filtered columns
+    @param isin: column name mapped to a collection of allowed values, e.g. tconst={'tt0369610'}
+    @return: pd.DataFrame
+    """
+    filters = {column: set(values) for column, values in isin.items()}
+    categories = {column: set() for column, dtype in get_schema(path).get('dtype', {}).items()
+                  if dtype == 'category' and (usecols is None or column in usecols)}
+    kept = []
+    # The pyarrow parser does not support chunked reading
+    for chunk in read_source(path, engine='c', chunksize=chunksize, usecols=usecols):
+        for column, values in categories.items():
+            values.update(chunk[column].cat.categories)
+        mask = pd.Series(True, index=chunk.index)
+        for column, values in filters.items():
+            mask &= chunk[column].isin(values)
+        kept.append(chunk[mask])
+
+    if not kept:
+        return read_source(path, nrows=0, usecols=usecols)
+    df = pd.concat(kept)
+
+    # Each chunk infers its own categories, which concat falls back to object for, so restore the category dtypes
+    # with the categories of every chunk, filtered out rows included, as read_source finds them in the whole file
+    for column, values in categories.items():
+        df[column] = df[column].astype(category_dtype(values))
+
+    return df
+
+
+def widen_dtypes(df):
+    """
+    Cast the compact numeric columns of a DataFrame back to the dtypes read_csv infers without a schema
+
+    int8, int16 and int32 columns become int64 and float32 columns float64. The float32 schema columns hold whole
+    numbers, which float32 stores exactly, so the widened values equal those parsed as float64. Category columns are
+    kept.
+
+    @param df: pd.DataFrame, modified in place
+    @return: df
+    """
+    for column, dtype in df.dtypes.items():
+        if dtype in ('int8', 'int16', 'int32'):
+            df[column] = df[column].astype('int64')
+        elif dtype == 'float32':
+            df[column] = df[column].astype('float64')
+    return df
+
+
+def category_dtype(values):
+    """
+    Return the category dtype read_source gives a column with the given distinct values
+
+    @param values: iterable of the distinct non-missing strings of the column
+    @return: pd.CategoricalDtype with the values sorted, as an object Index even when there are none
+    """
+    return pd.CategoricalDtype(pd.Index(sorted(values), dtype=object))
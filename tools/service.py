@@ -0,0 +1,329 @@
+"""
+This module serves the genre and crew analyses over a local HTTP API from a long-running process.
+
+Dashboards used to call merge_imdb_top_crew, merge_rt_data and merge_bom_and_imdb from a fresh Python process each
+time, reloading and re-merging every source file. QueryService instead loads every source once at startup (filling the
+shared dataset cache through tools.parallel.load_all) and the top crew result cube of tools.crew_cube, from which every
+genre/role selection is sliced. Responses are cached per endpoint and parameters. Merging runs in a thread
+pool so that a slow request never blocks the event loop, and concurrent requests for the same parameters share one
+computation. When a source file changes on disk, the cached responses are dropped, and the dataset cache and the crew
+cube reload or rebuild from the changed file.
+
+The server only needs the standard library: asyncio streams handling HTTP/1.1 GET requests with keep-alive.
+
+Endpoints, each returning JSON:
+    GET /health
+    GET /rt?focus=genre_popularity&by=total_positive&limit=10
+    GET /bom_imdb
+    GET /imdb_ratings
+    GET /top_crew?genre=Action&role=actor&limit=20
+
+Run from the microsoft_movies directory:
+    python -m tools.service [--host 127.0.0.1] [--port 8765] [--workers 4]
+
+CONTENTS
+I. imports and constants
+II. QueryService class
+III. HTTP server functions
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from tools import crew_cube, data_preparation, parallel
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Number of serialized responses kept by each QueryService
+RESPONSE_CACHE_SIZE = 256
+
+RT_FOCI = data_preparation.RT_FOCI
+RT_SORT_COLUMNS = data_preparation.RT_SORT_COLUMNS
+
+# Source files whose modification invalidates the cached responses
+SOURCE_PATHS = [data_preparation.RT_REVIEWS_PATH, data_preparation.RT_MOVIE_INFO, data_preparation.BOM_GROSS,
+                data_preparation.IMDB_NAME_BASICS, data_preparation.IMDB_TITLE_BASICS,
+                data_preparation.IMDB_TITLE_PRINCIPALS, data_preparation.IMDB_TITLE_RATINGS]
+
+
+class BadRequest(ValueError):
+    """Raised for invalid query parameters, answered with status 400"""
+
+
+"""
+II.
+QUERYSERVICE CLASS:
+"""
+
+
+class QueryService:
+    """Warm tables, a per-parameter response cache and the handlers of the HTTP endpoints"""
+
+    def __init__(self, max_workers=None, cache_size=RESPONSE_CACHE_SIZE):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or min(4, os.cpu_count() or 1))
+        self.cache_size = cache_size
+        self.responses = OrderedDict()
+        self.pending = {}
+        self.source_stamp = None
+        self.started = time.time()
+        self.requests = 0
+        self.cache_hits = 0
+        self.routes = {'/health': self.health,
+                       '/rt': self.rt,
+                       '/bom_imdb': self.bom_imdb,
+                       '/imdb_ratings': self.imdb_ratings,
+                       '/top_crew': self.top_crew_query}
+
+    def warm(self):
+        """Load every source into the dataset cache and load or build the top crew cube; blocking"""
+        self.source_stamp = _source_stamp()
+        available = [(name, kwargs) for name, kwargs in parallel.ALL_SOURCES if _source_exists(name)]
+        parallel.load_many(available, executor='thread')
+        try:
+            crew_cube.get_cube()
+        except OSError:
+            # Without the IMDB files, /top_crew answers with the error instead of preventing the start
+            pass
+
+    async def handle(self, path, params):
+        """
+        Answer one request
+
+        @param path: URL path, e.g. '/top_crew'
+        @param params: dict of query parameter name to its last value
+        @return: (HTTP status, JSON bytes)
+        """
+        self.requests += 1
+        route = self.routes.get(path)
+        if route is None:
+            return 404, _error(f"Unknown endpoint {path}; expected one of {sorted(self.routes)}")
+        if route == self.health:
+            return 200, _json(self.health())
+
+        try:
+            key, compute = route(params)
+        except BadRequest as error:
+            return 400, _error(str(error))
+        self._check_sources()
+
+        if key in self.responses:
+            self.cache_hits += 1
+            self.responses.move_to_end(key)
+            return 200, self.responses[key]
+
+        # Requests for the same parameters that arrive while the first one is computed wait for its result
+        if key not in self.pending:
+            loop = asyncio.get_running_loop()
+            self.pending[key] = loop.run_in_executor(self.executor, compute)
+        future = self.pending[key]
+        try:
+            body = await asyncio.shield(future)
+        except Exception as error:
+            return 500, _error(f"{type(error).__name__}: {error}")
+        finally:
+            if self.pending.get(key) is future and future.done():
+                del self.pending[key]
+
+        self.responses[key] = body
+        while len(self.responses) > self.cache_size:
+            self.responses.popitem(last=False)
+        return 200, body
+
+    def health(self, params=None):
+        return {'status': 'ok',
+                'uptime_seconds': round(time.time() - self.started, 1),
+                'requests': self.requests,
+                'response_cache_hits': self.cache_hits,
+                'cached_responses': len(self.responses),
+                'dataset_cache': data_preparation.cache_stats()}
+
+    def rt(self, params):
+        focus = params.get('focus', 'genre_popularity')
+        by = params.get('by', 'total_positive')
+        limit = _limit(params)
+        if focus not in RT_FOCI:
+            raise BadRequest(f"focus must be one of {RT_FOCI}")
+        if by not in RT_SORT_COLUMNS:
+            raise BadRequest(f"by must be one of {RT_SORT_COLUMNS}")
+        return ('rt', focus, by, limit), lambda: _records(data_preparation.merge_rt_data(focus, by), limit)
+
+    def bom_imdb(self, params):
+        limit = _limit(params)
+        return ('bom_imdb', limit), lambda: _records(data_preparation.merge_bom_and_imdb(), limit)
+
+    def imdb_ratings(self, params):
+        limit = _limit(params)
+        return ('imdb_ratings', limit), lambda: _records(data_preparation.merge_imdb_title_and_ratings(), limit)
+
+    def top_crew_query(self, params):
+        genre = params.get('genre')
+        role = params.get('role')
+        limit = _limit(params)
+        if genre is not None and genre not in data_preparation.TOP_CREW_GENRES:
+            raise BadRequest(f"genre must be one of {data_preparation.TOP_CREW_GENRES}")
+        if role is not None and role not in data_preparation.TOP_CREW_ROLES:
+            raise BadRequest(f"role must be one of {data_preparation.TOP_CREW_ROLES}")
+        return ('top_crew', genre, role, limit), lambda: _records(crew_cube.top_crew(genre, role, limit))
+
+    def _check_sources(self):
+        """Drop cached responses if a source file changed since they were computed"""
+        stamp = _source_stamp()
+        if stamp != self.source_stamp:
+            self.source_stamp = stamp
+            self.responses.clear()
+
+
+"""
+III.
+HTTP SERVER FUNCTIONS:
+1. serve
+2. main
+"""
+
+
+async def serve(service, host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None):
+    """
+    Warm the service and answer HTTP requests until cancelled
+
+    @param service: QueryService
+    @param host: interface to listen on
+    @param port: TCP port, 0 to pick a free one
+    @param ready: optional callable receiving the bound port once the server accepts connections
+    """
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(service.executor, service.warm)
+
+    async def on_connection(reader, writer):
+        await _handle_connection(service, reader, writer)
+
+    server = await asyncio.start_server(on_connection, host, port)
+    bound_port = server.sockets[0].getsockname()[1]
+    print(f"Serving on http://{host}:{bound_port}", flush=True)
+    if ready is not None:
+        ready(bound_port)
+    async with server:
+        await server.serve_forever()
+
+
+async def _handle_connection(service, reader, writer):
+    """Answer the requests of one keep-alive connection"""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            try:
+                method, target, version = request_line.decode('latin-1').split()
+            except ValueError:
+                status, body, keep_alive = 400, _error("Malformed request line"), False
+            else:
+                keep_alive = (headers.get('connection', '').lower() != 'close'
+                              and (version == 'HTTP/1.1' or headers.get('connection', '').lower() == 'keep-alive'))
+                if method != 'GET':
+                    status, body = 405, _error("Only GET is supported")
+                else:
+                    url = urlsplit(target)
+                    params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+                    status, body = await service.handle(url.path, params)
+
+            writer.write(_response(status, body, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+def _response(status, body, keep_alive):
+    reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               500: 'Internal Server Error'}
+    head = (f"HTTP/1.1 {status} {reasons.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode('latin-1') + body
+
+
+def _records(df, limit=None):
+    """Serialize a result DataFrame as JSON bytes: its row count, columns and rows as records"""
+    if limit is not None:
+        df = df.head(limit)
+    # Keep named indexes, such as 'genre', as ordinary columns
+    if any(name is not None for name in df.index.names):
+        df = df.reset_index()
+    records = df.to_json(orient='records', date_format='iso')
+    head = json.dumps({'rows': len(df), 'columns': [str(column) for column in df.columns]})
+    return f"{head[:-1]}, \"data\": {records}}}".encode()
+
+
+def _json(value):
+    return json.dumps(value).encode()
+
+
+def _error(message):
+    return _json({'error': message})
+
+
+def _limit(params):
+    if 'limit' not in params:
+        return None
+    try:
+        limit = int(params['limit'])
+    except ValueError:
+        raise BadRequest("limit must be an integer") from None
+    if limit < 0:
+        raise BadRequest("limit must not be negative")
+    return limit
+
+
+def _source_exists(name):
+    """Return whether the source file read by a cleaning function exists"""
+    path = inspect.signature(getattr(data_preparation, name)).parameters['path'].default
+    return os.path.exists(path)
+
+
+def _source_stamp():
+    """Return the modification time and size of every source file, None for missing ones"""
+    stamp = []
+    for path in SOURCE_PATHS:
+        try:
+            stat = os.stat(path)
+            stamp.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the genre and crew analyses over HTTP")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=None, help="threads running the merging functions")
+    args = parser.parse_args(argv)
+
+    service = QueryService(max_workers=args.workers)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""
+This module matches movie titles across the Box Office Mojo, The Numbers, TMDB and IMDB sources.
+
+The merging functions join sources on an exact punctuation-free title, which misses near matches ("Star Wars: Episode
+VII - The Force Awakens" and "Star Wars: The Force Awakens") and pairs every remake with every other film of the same
+name. TitleIndex instead indexes one source by (year, title token) and, for every record of the other source, scores
+only the candidates that share one of its rarest tokens within the year window. Scores are the Jaccard similarity of
+character trigrams, and the best pairs are kept one-to-one. Common words such as 'the' or 'love' are treated as stop
+words in a year: tokens listed by more than MAX_POSTINGS titles of the year are skipped, so a record scores at most
+rare_tokens * MAX_POSTINGS candidates per year of the window, and matching grows linearly with the sources rather than
+with the square of their size. benchmarks.bench_titles times the matching and checks the pairs the index finds against
+a brute-force pairing.
+
+CONTENTS
+I. imports and source columns
+II. TitleIndex class
+III. matching functions
+IV. helper functions
+"""
+import re
+from collections import defaultdict
+
+import pandas as pd
+
+# Title, year and studio columns of each source, as returned by load_source
+SOURCE_COLUMNS = {
+    'bom': ('title', 'year', 'studio'),
+    'tn': ('movie', 'year', None),
+    'tmdb': ('title', 'year', None),
+    'imdb': ('primary_title', 'start_year', None),
+}
+
+# Largest number of titles of a block a token may list to be used for finding candidates; more common tokens are
+# treated as stop words in that block
+MAX_POSTINGS = 200
+
+# Characters replaced by spaces before tokenizing
+_NON_ALPHANUMERIC = re.compile(r'[^0-9a-z]+')
+
+# Release year suffix used by Box Office Mojo to tell apart films of the same name, e.g. 'Evil Dead (2013)'
+_YEAR_SUFFIX = re.compile(r'\s*\(\d{4}\)\s*$')
+
+"""
+II.
+TITLEINDEX CLASS:
+"""
+
+
+class TitleIndex:
+    """Inverted index of normalized title tokens, blocked by release year and optionally by studio"""
+
+    def __init__(self, titles, years=None, studios=None):
+        """
+        @param titles: pd.Series of titles; its index labels identify the matched records
+        @param years: optional pd.Series of release years aligned with titles
+        @param studios: optional pd.Series of studios aligned with titles
+        """
+        self.labels = titles.index.to_numpy()
+        self.titles = titles.to_numpy()
+        self.use_years = years is not None
+        self.use_studios = studios is not None
+        self.years = _block_values(years, len(titles))
+        self.studios = _block_values(studios, len(titles))
+        self._postings = defaultdict(list)
+        self._token_counts = defaultdict(int)
+        self._trigrams = {}
+
+        for position, title in enumerate(self.titles):
+            for token in set(tokenize(title)):
+                self._postings[(self.years[position], self.studios[position], token)].append(position)
+                self._token_counts[token] += 1
+
+    def candidates(self, title, year=None, studio=None, year_tolerance=0, rare_tokens=2, max_postings=MAX_POSTINGS):
+        """
+        Return positions of indexed titles sharing one of the rarest tokens of title within the year window
+
+        In each block of the window, the rarest rare_tokens tokens listing at most max_postings titles of the block are
+        used, and more common tokens are skipped as stop words. A title made only of stop words, such as 'The Boy',
+        falls back to its rarest token.
+        """
+        tokens = sorted(set(tokenize(title)), key=lambda token: self._token_counts.get(token, 0))
+        tokens = [token for token in tokens if token in self._token_counts]
+
+        if self.use_years and year is not None:
+            block_years = [year + offset for offset in range(-year_tolerance, year_tolerance + 1)]
+        else:
+            block_years = [None]
+        block_studio = studio if self.use_studios else None
+
+        found = set()
+        for block_year in block_years:
+            used = 0
+            for token in tokens:
+                postings = self._postings.get((block_year, block_studio, token), ())
+                if len(postings) > max_postings:
+                    continue
+                found.update(postings)
+                used += 1
+                if used == rare_tokens:
+                    break
+            if not used and tokens:
+                found.update(self._postings.get((block_year, block_studio, tokens[0]), ()))
+        return found
+
+    def trigrams(self, position):
+        if position not in self._trigrams:
+            self._trigrams[position] = trigrams(self.titles[position])
+        return self._trigrams[position]
+
+
+"""
+III.
+MATCHING FUNCTIONS:
+1. match_titles
+2. load_source
+3. match_sources
+"""
+
+
+def match_titles(left_titles, right_titles, left_years=None, right_years=None, left_studios=None, right_studios=None,
+                 year_tolerance=0, threshold=0.6, rare_tokens=2, max_postings=MAX_POSTINGS):
+    """
+    Return a scored one-to-one match table between two Series of titles
+
+    @param left_titles: pd.Series of titles, e.g. The Numbers 'movie'
+    @param right_titles: pd.Series of titles to index, preferably the larger source, e.g. IMDB 'primary_title'
+    @param left_years: optional release years aligned with left_titles, used as a blocking key
+    @param right_years: optional release years aligned with right_titles
+    @param left_studios: optional studios aligned with left_titles, used as a blocking key when both sides have them
+    @param right_studios: optional studios aligned with right_titles
+    @param year_tolerance: largest accepted difference in release years
+    @param threshold: lowest accepted score, between 0 and 1
+    @param rare_tokens: number of rarest title tokens used to find candidates
+    @param max_postings: largest number of indexed titles of a block a token may list to find candidates
+    @return: pd.DataFrame with columns 'left', 'right' (index labels of the matched records) and 'score'
+    """
+    use_years = left_years is not None and right_years is not None
+    use_studios = left_studios is not None and right_studios is not None
+    index = TitleIndex(right_titles, right_years if use_years else None, right_studios if use_studios else None)
+    years = _block_values(left_years if use_years else None, len(left_titles))
+    studios = _block_values(left_studios if use_studios else None, len(left_titles))
+
+    # Score every candidate pair found through the index
+    pairs = []
+    for position, title in enumerate(left_titles.to_numpy()):
+        left_grams = trigrams(title)
+        for candidate in index.candidates(title, years[position], studios[position], year_tolerance, rare_tokens,
+                                          max_postings):
+            score = _jaccard(left_grams, index.trigrams(candidate))
+            if use_years:
+                # Prefer the same release year when several years are accepted
+                score -= 0.01 * abs(years[position] - index.years[candidate])
+            if score >= threshold:
+                pairs.append((score, position, candidate))
+
+    # Keep the best scoring pairs, using each record at most once
+    pairs.sort(key=lambda pair: pair[0], reverse=True)
+    used_left, used_right, matches = set(), set(), []
+    for score, left, right in pairs:
+        if left not in used_left and right not in used_right:
+            used_left.add(left)
+            used_right.add(right)
+            matches.append((left_titles.index[left], index.labels[right], score))
+
+    return pd.DataFrame(matches, columns=['left', 'right', 'score'])
+
+
+def load_source(name):
+    """Return the cleaned DataFrame of a source with a numeric 'year' column where the source only has dates"""
+    # Imported here because data_preparation is only needed when loading the bundled sources
+    from tools import data_preparation, schemas
+
+    if name == 'bom':
+        return data_preparation.clean_bom_gross()
+    if name == 'tn':
+        tn_df = data_preparation.clean_tn_budgets()
+        tn_df['year'] = tn_df['release_date'].dt.year
+        return tn_df
+    if name == 'tmdb':
+        tmdb_df = schemas.read_source(data_preparation.TMDB_MOVIES)
+        tmdb_df['year'] = pd.to_datetime(tmdb_df['release_date'], errors='coerce').dt.year
+        return tmdb_df
+    if name == 'imdb':
+        return data_preparation.clean_imdb_title_basics(clean_titles=False)
+    raise ValueError(f"Unknown source {name!r}, expected one of {list(SOURCE_COLUMNS)}")
+
+
+def match_sources(left, right, year_tolerance=1, threshold=0.6):
+    """
+    Return a scored one-to-one match table between two of 'bom', 'tn', 'tmdb' and 'imdb'
+
+    @param left: name of the source to look up, ideally the smaller one
+    @param right: name of the source to index
+    @param year_tolerance: largest accepted difference in release years
+    @param threshold: lowest accepted score, between 0 and 1
+    @return: pd.DataFrame with the matched titles and years of both sources and the match score
+    """
+    left_df = load_source(left)
+    right_df = load_source(right)
+    left_title, left_year, left_studio = SOURCE_COLUMNS[left]
+    right_title, right_year, right_studio = SOURCE_COLUMNS[right]
+
+    # Rows without a title or year cannot be blocked, and index labels must be unique to identify records
+    left_df = left_df.dropna(subset=[left_title, left_year]).reset_index(drop=True)
+    right_df = right_df.dropna(subset=[right_title, right_year]).reset_index(drop=True)
+
+    matches = match_titles(left_df[left_title], right_df[right_title],
+                           left_df[left_year].astype(int), right_df[right_year].astype(int),
+                           left_df[left_studio] if left_studio and right_studio else None,
+                           right_df[right_studio] if left_studio and right_studio else None,
+                           year_tolerance=year_tolerance, threshold=threshold)
+
+    left_part = left_df.loc[matches['left'], [left_title, left_year]].reset_index(drop=True)
+    right_part = right_df.loc[matches['right'], [right_title, right_year]].reset_index(drop=True)
+    left_part.columns = [f"{left}_title", f"{left}_year"]
+    right_part.columns = [f"{right}_title", f"{right}_year"]
+    return pd.concat([left_part, right_part, matches[['left', 'right', 'score']]], axis=1)
+
+
+"""
+IV.
+HELPER FUNCTIONS:
+1. tokenize
+2. trigrams
+"""
+
+
+def tokenize(title):
+    """Return the lowercase alphanumeric tokens of a title, ignoring a trailing '(year)'"""
+    return _NON_ALPHANUMERIC.sub(' ', _YEAR_SUFFIX.sub('', str(title)).lower()).split()
+
+
+def trigrams(title):
+    """Return the set of character trigrams of a title with punctuation and spaces removed"""
+    compact = ''.join(tokenize(title))
+    if len(compact) < 3:
+        return {compact}
+    return {compact[i:i + 3] for i in range(len(compact) - 2)}
+
+
+def _jaccard(first, second):
+    union = len(first | second)
+    return len(first & second) / union if union else 0.0
+
+
+def _block_values(series, length):
+    """Return blocking key values as a list, or a list of None when the key is not used"""
+    if series is None:
+        return [None] * length
+    return series.tolist()